@@ -0,0 +1,176 @@
+#admission control in front of SNOWFLAKE.CORTEX.COMPLETE: a global concurrency cap, a bounded priority wait queue
+#and per-user token buckets; callers that can't be admitted get AdmissionRejected (-> 429 + Retry-After) right away
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import metrics
+from executor import CONCURRENCY_LIMITS
+
+#never above the llm executor's cap, so an admitted call (a hedge included) never waits again for a worker thread
+CORTEX_MAX_CONCURRENCY = min(int(os.getenv("CORTEX_MAX_CONCURRENCY", str(CONCURRENCY_LIMITS["llm"]))), CONCURRENCY_LIMITS["llm"])
+CORTEX_MAX_QUEUE       = int(os.getenv("CORTEX_MAX_QUEUE", "64"))
+CORTEX_USER_RATE       = float(os.getenv("CORTEX_USER_RATE", "0.5"))  # completions per second, per user
+CORTEX_USER_BURST      = float(os.getenv("CORTEX_USER_BURST", "10"))
+CORTEX_USER_BUCKETS    = int(os.getenv("CORTEX_USER_BUCKETS", "10000"))
+
+#lower runs first; prompt kinds (the llm_cache policy names) map onto classes
+PRIORITIES = {"interactive": 0, "standard": 1, "background": 2}
+KIND_PRIORITY = {
+    "onboard":             "interactive",
+    "journal_clean":       "interactive",
+    "journal_observation": "standard",
+    "schedule":            "background",
+    "journal_batch":       "background",
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Cortex is busy ({reason}), retry in {math.ceil(retry_after)}s")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency=CORTEX_MAX_CONCURRENCY, max_queue=CORTEX_MAX_QUEUE,
+                 user_rate=CORTEX_USER_RATE, user_burst=CORTEX_USER_BURST, clock=time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._clock = clock
+        self._active = 0
+        self._queue = []              # heap of [priority, seq, future, enqueued_at]; only touched from the event loop
+        self._seq = itertools.count()
+        self._buckets = OrderedDict() # user key -> [tokens, refilled_at], least recently used at the left
+        self._service_s = 5.0         # EWMA of slot hold time, for Retry-After estimates
+        self._stats = {"admitted": 0, "queue_full": 0, "rate_limited": 0, "shed": 0, "speculative_refused": 0}
+        self._waits = {p: {"count": 0, "ms_sum": 0.0, "ms_max": 0.0} for p in PRIORITIES}
+
+    def _take_token(self, key):
+        if key is None or self.user_rate <= 0:
+            return
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.user_burst, now]
+            while len(self._buckets) > CORTEX_USER_BUCKETS:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        bucket[0] = min(self.user_burst, bucket[0] + (now - bucket[1]) * self.user_rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            self._stats["rate_limited"] += 1
+            raise AdmissionRejected("rate_limited", (1 - bucket[0]) / self.user_rate)
+        bucket[0] -= 1
+
+    def _refund_token(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(self.user_burst, bucket[0] + 1)
+
+    def _queue_retry_after(self):
+        return self._service_s * (len(self._queue) + 1) / self.max_concurrency
+
+    def _record_wait(self, priority_name, waited_s):
+        w = self._waits[priority_name]
+        w["count"] += 1
+        w["ms_sum"] += waited_s * 1000
+        w["ms_max"] = max(w["ms_max"], waited_s * 1000)
+
+    async def acquire(self, kind: str, key=None):
+        name = KIND_PRIORITY.get(kind, "standard")
+        priority = PRIORITIES[name]
+        self._take_token(key)
+        if self._active < self.max_concurrency and not self._queue:
+            self._active += 1
+            self._stats["admitted"] += 1
+            self._record_wait(name, 0.0)
+            return
+
+        if len(self._queue) >= self.max_queue:
+            victim = max(self._queue)  # lowest class, most recently queued
+            if victim[0] <= priority:
+                self._refund_token(key)  # nothing ran, so don't charge the user for it
+                self._stats["queue_full"] += 1
+                raise AdmissionRejected("queue_full", self._queue_retry_after())
+            # make room for more important work by shedding the least important waiter
+            self._queue.remove(victim)
+            heapq.heapify(self._queue)
+            self._stats["shed"] += 1
+            victim[2].set_exception(AdmissionRejected("shed", self._queue_retry_after()))
+
+        enqueued_at = self._clock()
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future, enqueued_at]
+        heapq.heappush(self._queue, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()  # the slot was handed over just as the caller went away
+            elif entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            raise
+        self._stats["admitted"] += 1
+        self._record_wait(name, self._clock() - enqueued_at)
+        metrics.record_stage("llm.admission", self._clock() - enqueued_at)
+
+    def try_acquire(self) -> bool:
+        """A slot only if one is free right now and nobody is queued; never waits and charges no user token.
+        For speculative work such as a hedged second attempt, which is pointless if it has to queue."""
+        if self._active >= self.max_concurrency or self._queue:
+            self._stats["speculative_refused"] += 1
+            return False
+        self._active += 1
+        self._stats["admitted"] += 1
+        return True
+
+    def release(self, held_s=None):
+        if held_s is not None:
+            self._service_s = 0.8 * self._service_s + 0.2 * held_s
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            if not entry[2].done():
+                entry[2].set_result(None)  # hand the slot straight to the next waiter
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, kind: str, key=None):
+        await self.acquire(kind, key)
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.release(self._clock() - started)
+
+    def stats(self):
+        by_priority = {name: 0 for name in PRIORITIES}
+        for entry in self._queue:
+            by_priority[next(n for n, p in PRIORITIES.items() if p == entry[0])] += 1
+        return {
+            "limit": self.max_concurrency,
+            "active": self._active,
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "queued_by_priority": by_priority,
+            "service_ms_avg": round(self._service_s * 1000),
+            "user_buckets": len(self._buckets),
+            **self._stats,
+            "wait_ms": {
+                name: {"count": w["count"], "avg": round(w["ms_sum"] / w["count"], 1) if w["count"] else 0.0,
+                       "max": round(w["ms_max"], 1)}
+                for name, w in self._waits.items()
+            },
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,119 @@
+#extractor benchmark: success rate and parse time of the greedy-regex + json.loads baseline vs extractor.extract
+#usage: python bench_extractor.py [--corpus recorded.jsonl] [--repeat N]
+#the corpus is what EXTRACTOR_RECORD_PATH writes ({"name", "text"} per line); without one, a synthetic corpus
+#covering the failure shapes seen from Cortex (prose, code fences, stray and unbalanced braces, trailing commas, truncation) is used
+import re
+import json
+import time
+import random
+import argparse
+
+from pydantic import ValidationError
+
+from data_structure import OnboardingExtract, JournalClean, ScheduleDay
+from extractor import extract, ExtractionError
+
+SCHEMAS = {
+    "onboard":       (OnboardingExtract, False),
+    "journal_clean": (JournalClean, False),
+    "schedule":      (ScheduleDay, True),
+}
+
+_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _payloads(rng):
+    yield "onboard", {
+        "broad_goal": rng.choice(["Building Muscle", "Weight Loss", "Endurance"]),
+        "goals": ["bench press 225lbs", "run a {sub-4} marathon"],
+        "workouts_per_week": rng.randint(2, 6),
+        "ai_extracted_data": {"schedule": "Monday evening, Wednesday evening", "injuries": "none"},
+    }
+    yield "journal_clean", {
+        "cleaned_text": "Slept badly, but hit a new deadlift PR {felt great}.",
+        "context_tags": ["low_sleep", "accomplishment"],
+        "safety_flag": False,
+    }
+    yield "schedule", [
+        {"day": d, "activity": "Tempo Run", "duration_min": 45, "intensity": "Moderate", "focus": "Threshold", "emoji": "⏱️"}
+        for d in _DAYS
+    ]
+
+
+def _variants(body):
+    yield "clean", body
+    yield "prose", f"Here is the result you asked for:\n{body}\nLet me know if you need changes."
+    yield "fenced", f"```json\n{body}\n```"
+    yield "stray_braces", f"Using the template {{name}} from above:\n{body}\nNote: values in [brackets] are estimates."
+    yield "unbalanced_brace", f"Sure {{not json [here. Result: {body}"
+    yield "trailing_comma", re.sub(r"(\]|\}|\"|\d)(\s*[\}\]])", r"\1,\2", body, count=2)
+    yield "truncated", body[: int(len(body) * 0.9)]
+
+
+def synthetic_corpus(n, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < n:
+        for name, payload in _payloads(rng):
+            for shape, text in _variants(json.dumps(payload, ensure_ascii=False, indent=rng.choice([None, 2]))):
+                corpus.append({"name": name, "shape": shape, "text": text})
+    return corpus[:n]
+
+
+def baseline(text, model, many):
+    #what the endpoints did before extractor.py
+    match = re.search(r"\[.*\]" if many else r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise ValueError("no JSON")
+    value = json.loads(match.group())
+    return [model.model_validate(v).model_dump() for v in value] if many else model.model_validate(value).model_dump()
+
+
+def run(fn, corpus, repeat):
+    ok, elapsed, by_shape = 0, 0.0, {}
+    for _ in range(repeat):
+        for entry in corpus:
+            model, many = SCHEMAS[entry["name"]]
+            t = time.perf_counter()
+            try:
+                fn(entry["text"], model, many)
+                success = True
+            except (ValueError, ValidationError, ExtractionError):
+                success = False
+            dt = time.perf_counter() - t
+            ok += success
+            elapsed += dt
+            shape = by_shape.setdefault(entry.get("shape", entry["name"]), [0, 0, 0.0])
+            shape[0] += success
+            shape[1] += 1
+            shape[2] += dt
+    total = len(corpus) * repeat
+    return {
+        "success_rate": round(ok / total, 3),
+        "us_per_response": round(elapsed / total * 1e6, 1),
+        "by_shape": {k: {"success_rate": round(s / n, 3), "us": round(t / n * 1e6, 1)} for k, (s, n, t) in by_shape.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM JSON extraction against the old regex approach")
+    parser.add_argument("--corpus", help="jsonl of recorded responses ({\"name\", \"text\"} per line)")
+    parser.add_argument("--size", type=int, default=540, help="synthetic corpus size when --corpus is not given")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [e for e in map(json.loads, f) if e["name"] in SCHEMAS]
+    else:
+        corpus = synthetic_corpus(args.size)
+
+    print(json.dumps({
+        "responses": len(corpus),
+        "regex_baseline": run(baseline, corpus, args.repeat),
+        "extractor": run(lambda text, model, many: extract(text, model, many=many, name="bench"), corpus, args.repeat),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
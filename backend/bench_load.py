@@ -0,0 +1,349 @@
+#load generator: drives every endpoint concurrently with a weighted mix of user flows, reports p50/p95/p99 and req/s per endpoint
+#usage: python bench_load.py [--concurrency N] [--duration S | --requests N] [--users N] [--url http://host:port]
+#without --url the app runs in-process (httpx ASGI transport, startup/shutdown hooks included) on the local
+#Snowflake/Cortex stand-in (fake_snowflake.py) seeded into a temp dir; the --*-latency flags shape the stand-in
+#(see FAKE_*_LATENCY there). With --url, point it at a server already started with SNOWFLAKE_CONNECTOR=fake and seeded users.
+#in-process, the run fails if any executor kind had more busy threads than its cap (e.g. hedge losers not accounted for)
+#note: in-process, the generator shares the app's event loop, so its own overhead is included in the latencies
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+import httpx
+
+_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+_ENTRIES = [
+    "Great session today, felt strong and proud of the new PR",
+    "Tired and sore after leg day, slept badly",
+    "Stressed at work but the run helped a bit",
+    "Rested and energized, yoga was fun",
+    "Exhausted, skipped the workout, feeling worse",
+]
+
+
+def _percentile(sorted_ms, q):
+    # nearest rank
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, int(round(q * len(sorted_ms))) - 1))]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # endpoint -> [ms, ...]
+        self.errors = {}
+        self.rejected = {}  # 429 / 503 with Retry-After: back-pressure working as intended, not failures
+
+    def add(self, endpoint, ms, status, body=None):
+        # endpoint is "METHOD /route/{template}"
+        self.samples.setdefault(endpoint, []).append(ms)
+        if status in (429, 503):
+            self.rejected[endpoint] = self.rejected.get(endpoint, 0) + 1
+        elif status >= 400 or (isinstance(body, dict) and body.get("status") == "error"):
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed_s):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            ms = sorted(samples)
+            endpoints[endpoint] = {
+                "requests": len(ms),
+                "rps": round(len(ms) / elapsed_s, 2),
+                "p50_ms": round(_percentile(ms, 0.50), 1),
+                "p95_ms": round(_percentile(ms, 0.95), 1),
+                "p99_ms": round(_percentile(ms, 0.99), 1),
+                "max_ms": round(ms[-1], 1),
+                "errors": self.errors.get(endpoint, 0),
+                "rejected": self.rejected.get(endpoint, 0),
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        return {"elapsed_s": round(elapsed_s, 2), "requests": total, "rps": round(total / elapsed_s, 2), "endpoints": endpoints}
+
+
+class Flows:
+    """User flows; each call is recorded under its route template so per-user URLs aggregate."""
+
+    def __init__(self, client, recorder, users, rng):
+        self.client = client
+        self.rec = recorder
+        self.users = users
+        self.rng = rng
+
+    async def call(self, method, endpoint, url, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            r = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.rec.add(f"{method} {endpoint}", (time.perf_counter() - t0) * 1000, 599)
+            return None
+        try:
+            body = r.json()
+        except ValueError:
+            body = None
+        self.rec.add(f"{method} {endpoint}", (time.perf_counter() - t0) * 1000, r.status_code, body)
+        return body
+
+    async def stream(self, endpoint, url, payload):
+        # SSE endpoints: latency is to the last event
+        t0 = time.perf_counter()
+        events = []
+        try:
+            async with self.client.stream("POST", url, json=payload) as r:
+                async for line in r.aiter_lines():
+                    if line.startswith("event:"):
+                        events.append(line[6:].strip())
+                status = r.status_code
+        except httpx.HTTPError:
+            status = 599
+        failed = "error" in events
+        self.rec.add(f"POST {endpoint}", (time.perf_counter() - t0) * 1000, status, {"status": "error"} if failed else None)
+        return events
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def entry(self):
+        # a unique suffix keeps the LLM response cache from absorbing the Cortex load
+        return f"{self.rng.choice(_ENTRIES)} (day {self.rng.randrange(1_000_000)})"
+
+    async def dashboard(self):
+        await self.call("GET", "/dashboard/{user_id}", f"/dashboard/{self.user()}")
+
+    async def profile(self):
+        await self.call("GET", "/profile/{user_id}", f"/profile/{self.user()}")
+
+    async def journal_history(self):
+        await self.call("GET", "/journal_history/{user_id}", f"/journal_history/{self.user()}")
+
+    async def sentiment_trend(self):
+        await self.call("GET", "/sentiment_trend/{user_id}", f"/sentiment_trend/{self.user()}",
+                        params={"window": self.rng.choice([7, 30, 90])})
+
+    async def cohort(self):
+        await self.call("GET", "/cohort/{user_id}", f"/cohort/{self.user()}")
+
+    async def workout_stats(self):
+        await self.call("GET", "/workout_stats/{user_id}", f"/workout_stats/{self.user()}")
+
+    async def workout_history(self):
+        await self.call("GET", "/workout_history/{user_id}", f"/workout_history/{self.user()}", params={"weeks": 12})
+
+    async def log_workouts(self):
+        user = self.user()
+        events = [{"user_id": user, "activity": self.rng.choice(["Run", "Strength", "Yoga"]),
+                   "duration_min": self.rng.randrange(15, 75)} for _ in range(self.rng.randint(1, 3))]
+        await self.call("POST", "/workouts/log", "/workouts/log", json={"events": events})
+
+    async def journal(self):
+        await self.call("POST", "/journal", "/journal", params={"user_id": self.user(), "entry_text": self.entry()})
+
+    async def journal_deferred(self):
+        body = await self.call("POST", "/journal", "/journal",
+                               params={"user_id": self.user(), "entry_text": self.entry(), "defer_observation": True})
+        job_id = (body or {}).get("observation_id")
+        for _ in range(20):
+            if not job_id:
+                return
+            job = await self.call("GET", "/jobs/{job_id}", f"/jobs/{job_id}")
+            if not job or job.get("status") not in ("pending", "running"):
+                return
+            await asyncio.sleep(0.25)
+
+    async def journal_queued(self):
+        body = await self.call("POST", "/journal/queue", "/journal/queue",
+                               params={"user_id": self.user(), "entry_text": self.entry()})
+        journal_id = (body or {}).get("journal_id")
+        for _ in range(20):
+            if not journal_id:
+                return
+            status = await self.call("GET", "/journal/status/{journal_id}", f"/journal/status/{journal_id}")
+            if not status or status.get("status") != "queued":
+                return
+            await asyncio.sleep(0.5)
+
+    async def generate_schedule(self):
+        await self.call("POST", "/generate_schedule", "/generate_schedule", json={"user_id": self.user()})
+
+    async def personalize_schedule(self):
+        await self.call("POST", "/generate_schedule", "/generate_schedule",
+                        json={"user_id": self.user(), "personalize": True})
+
+    async def schedule_stream(self):
+        await self.stream("/generate_schedule/stream", "/generate_schedule/stream",
+                          {"user_id": self.user(), "personalize": self.rng.random() < 0.3})
+
+    async def update_schedule(self):
+        days = self.rng.sample(_DAYS, self.rng.randint(2, 5))
+        await self.call("POST", "/update_schedule", "/update_schedule", json={
+            "user_id": self.user(), "schedule": ", ".join(f"{d} evening" for d in days), "workouts_per_week": len(days),
+        })
+
+    async def patch_profile(self):
+        await self.call("PATCH", "/profile/{user_id}", f"/profile/{self.user()}", json={
+            "age": self.rng.randint(18, 65), "weight_kg": round(self.rng.uniform(55, 110), 1),
+            "height_cm": round(self.rng.uniform(155, 195), 1), "resting_bpm": self.rng.randint(50, 85),
+        })
+
+    async def score_batch(self):
+        profiles = [{"user_id": self.user(), "age": self.rng.randint(18, 65), "weight_kg": self.rng.uniform(55, 110),
+                     "height_cm": self.rng.uniform(155, 195), "resting_bpm": self.rng.randint(50, 85),
+                     "workouts_per_week": self.rng.randint(1, 6)} for _ in range(50)]
+        await self.call("POST", "/score_batch", "/score_batch", json={"profiles": profiles})
+        # write-back re-scores the stored rows of the named users
+        await self.call("POST", "/score_batch", "/score_batch",
+                        json={"user_ids": [p["user_id"] for p in profiles], "write_back": True})
+
+    async def onboard(self):
+        # the full sign-up: four chat turns, then the measurements
+        answers = ["My goal is Building Muscle", f"Bench press {self.rng.randrange(60, 200)}kg",
+                   "Monday and Thursday evenings", "No injuries"]
+        session_id, partial = None, None
+        for text in answers:
+            body = await self.call("POST", "/onboard", "/onboard", json={"session_id": session_id, "message": text})
+            if not body or body.get("status") not in ("chatting", "needs_metrics"):
+                return
+            session_id = body.get("session_id")
+            partial = body.get("partial_data")
+        if partial:
+            await self.call("POST", "/complete_profile", "/complete_profile", json={
+                **partial, "age": 30, "weight_kg": 80, "height_cm": 180, "resting_bpm": 62,
+            })
+
+    async def onboard_stream(self):
+        await self.stream("/onboard/stream", "/onboard/stream", {"message": f"My goal is Endurance, {self.rng.randrange(5, 42)}k"})
+
+    async def backfill(self):
+        await self.call("POST", "/sentiment_trend/backfill", "/sentiment_trend/backfill")
+
+    async def export(self):
+        # one user's journals, the shape of a data-portability request
+        await self.call("GET", "/export/{kind}", "/export/journals", params={"user_id": self.user()})
+
+    async def health(self):
+        await self.call("GET", "/health", "/health")
+
+    async def stats(self):
+        await self.call("GET", "/stats", "/stats")
+
+    async def metrics(self):
+        t0 = time.perf_counter()
+        r = await self.client.get("/metrics")
+        self.rec.add("GET /metrics", (time.perf_counter() - t0) * 1000, r.status_code)
+
+
+#relative weights: mostly dashboard reads, a steady trickle of writes and LLM-backed calls
+MIX = {
+    "dashboard": 15, "profile": 10, "journal_history": 8, "workout_stats": 8, "workout_history": 5,
+    "sentiment_trend": 5, "cohort": 3, "log_workouts": 8, "journal": 4, "journal_deferred": 2, "journal_queued": 5,
+    "generate_schedule": 5, "personalize_schedule": 2, "schedule_stream": 2, "update_schedule": 3,
+    "patch_profile": 3, "score_batch": 1, "onboard": 1, "onboard_stream": 1, "backfill": 0.05,
+    "export": 0.5, "health": 2, "stats": 1, "metrics": 1,
+}
+
+
+async def _worker(flows, deadline, budget):
+    names, weights = list(MIX), list(MIX.values())
+    while time.perf_counter() < deadline and budget["left"] > 0:
+        budget["left"] -= 1
+        await getattr(flows, flows.rng.choices(names, weights)[0])()
+
+
+async def run(client, users, args, routes=None):
+    recorder = Recorder()
+    budget = {"left": args.requests or float("inf")}
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(Flows(client, recorder, users, random.Random(args.seed + i)), deadline, budget)
+        for i in range(args.concurrency)
+    ))
+    report = recorder.report(time.perf_counter() - started)
+    report["concurrency"] = args.concurrency
+    if routes is not None:
+        report["not_exercised"] = sorted(set(routes) - set(report["endpoints"]))
+    return report
+
+
+_DOC_ROUTES = ("/openapi.json", "/docs", "/docs/oauth2-redirect", "/redoc")
+
+
+async def _in_process(args):
+    tmp = tempfile.mkdtemp(prefix="bench_load_")
+    os.environ.update({
+        "SNOWFLAKE_CONNECTOR": "fake",
+        "FAKE_SNOWFLAKE_PATH": os.path.join(tmp, "snowflake.sqlite3"),
+        "WORKOUT_STORE_PATH": os.path.join(tmp, "workouts.sqlite3"),
+        "FAKE_CONNECT_LATENCY": args.connect_latency,
+        "FAKE_QUERY_LATENCY": args.query_latency,
+        "FAKE_COMPLETE_LATENCY": args.complete_latency,
+        "FAKE_SENTIMENT_LATENCY": args.sentiment_latency,
+        "FAKE_MODEL_LATENCY": args.model_latency,
+        "CORTEX_HEDGE_AFTER": str(args.hedge_after),
+        "SLOW_REQUEST_MS": os.getenv("SLOW_REQUEST_MS", "1000000"),  # keep [SLOW] lines out of the report
+    })
+    import fake_snowflake
+    users = fake_snowflake.seed(os.environ["FAKE_SNOWFLAKE_PATH"], args.users, args.journals_per_user)
+    from main import app  # after the env is set: module-level settings are read at import
+    routes = [f"{m} {r.path}" for r in app.routes if r.path not in _DOC_ROUTES
+              for m in getattr(r, "methods", None) or () if m != "HEAD"]
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            report = await run(client, users, args, routes)
+    report["db_path"] = os.environ["FAKE_SNOWFLAKE_PATH"]
+    import executor
+    report["executor"] = executor.stats()
+    return report
+
+
+async def _remote(args):
+    users = [f"user_{i:06d}" for i in range(args.users)]  # ids fake_snowflake.seed hands out
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.url, timeout=120, limits=limits) as client:
+        return await run(client, users, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of every endpoint against the Snowflake/Cortex stand-in")
+    parser.add_argument("--url", help="a running server; default runs the app in-process")
+    parser.add_argument("--concurrency", type=int, default=32, help="simulated users issuing requests back to back")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many flows (0: duration only)")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--journals-per-user", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--connect-latency", default="lognormal:300:0.3")
+    parser.add_argument("--query-latency", default="lognormal:40:0.4")
+    parser.add_argument("--complete-latency", default="lognormal:2000:0.5")
+    parser.add_argument("--sentiment-latency", default="lognormal:150:0.3")
+    parser.add_argument("--model-latency", default=os.getenv("FAKE_MODEL_LATENCY", ""), help="per-model COMPLETE latency, e.g. llama3.1-8b=fixed:300")
+    parser.add_argument("--hedge-after", type=float, default=float(os.getenv("CORTEX_HEDGE_AFTER", "0")), help="CORTEX_HEDGE_AFTER for the in-process app")
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(_remote(args) if args.url else _in_process(args))
+
+    print(f"{'endpoint':40} {'reqs':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>4} {'429/503':>7}")
+    for endpoint, e in report["endpoints"].items():
+        print(f"{endpoint:40} {e['requests']:6d} {e['rps']:7.2f} {e['p50_ms']:8.1f} {e['p95_ms']:8.1f} "
+              f"{e['p99_ms']:8.1f} {e['errors']:4d} {e['rejected']:7d}")
+    print(f"total: {report['requests']} requests in {report['elapsed_s']}s ({report['rps']} req/s), "
+          f"concurrency {report['concurrency']}", file=sys.stderr)
+    if report.get("not_exercised"):
+        print(f"not exercised: {', '.join(report['not_exercised'])}", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    #regression check: cancelled callers (lost hedges, deadlines, disconnects) must not free a slot while their thread runs
+    over = {kind: e for kind, e in report.get("executor", {}).items() if e["running_max"] > e["limit"]}
+    for kind, e in over.items():
+        print(f"[ERROR] executor kind {kind} ran {e['running_max']} threads at once, limit {e['limit']}", file=sys.stderr)
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#fitness model update benchmark on a synthetic dataset: full retrain vs incremental partial_fit, publish time,
+#and hot-swap latency (CURRENT rewritten -> new version scoring) while scoring threads keep running
+#usage: python bench_model_update.py [--rows N] [--update-rows N] [--chunk N] [--swaps N] [--skip-full]
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+import scoring
+from scoring import build_features, FEATURES
+from fitness_score import partial_fit, publish, BASELINE_ROWS
+
+
+def synthetic(n, rng):
+    """Raw profile columns and labels from a fixed logistic ground truth (fitter = younger, lower BPM, trains more)."""
+    age = rng.uniform(18, 65, n)
+    weight = rng.normal(75, 12, n).clip(45, 150)
+    height = rng.normal(172, 9, n).clip(145, 205)
+    bpm = rng.normal(68, 8, n).clip(40, 100)
+    freq = rng.integers(1, 7, n).astype(float)
+    X = build_features(age, weight, height, bpm, freq)
+    z = (X - X.mean(axis=0)) / X.std(axis=0)
+    logits = z @ np.array([-0.6, 0.1, 0.2, -1.2, 0.6, 1.8, -0.4]) - 1.0
+    y = (rng.random(n) < 1 / (1 + np.exp(-logits))).astype(int)
+    return X, y
+
+
+def accuracy(params, X, y):
+    scaled = (X - params["mean"]) / params["scale"]
+    return float((((scaled @ params["coef"] + params["intercept"]) > 0).astype(int) == y).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fitness model retraining, incremental updates and hot swaps")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="historical rows for the full retrain")
+    parser.add_argument("--update-rows", type=int, default=200_000, help="new rows folded in by one incremental update")
+    parser.add_argument("--chunk", type=int, default=100_000, help="rows per partial_fit call")
+    parser.add_argument("--swaps", type=int, default=20)
+    parser.add_argument("--skip-full", action="store_true", help="skip the sklearn full retrain")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    X, y = synthetic(args.rows, rng)
+    X_new, y_new = synthetic(args.update_rows, rng)
+    X_test, y_test = synthetic(100_000, rng)
+    report = {"rows": args.rows, "update_rows": args.update_rows, "chunk": args.chunk}
+
+    # full retrain, the path fitness_score.py takes today
+    if not args.skip_full:
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+        from fitness_score import params_from
+        t0 = time.perf_counter()
+        scaler = StandardScaler().fit(np.vstack([X, X_new]))
+        model = LogisticRegression().fit(scaler.transform(np.vstack([X, X_new])), np.concatenate([y, y_new]))
+        report["full_retrain_s"] = round(time.perf_counter() - t0, 3)
+        report["full_retrain_accuracy"] = round(accuracy(params_from(model, scaler), X_test, y_test), 4)
+
+    # incremental: a baseline fitted on a small sample, then streamed over the history and the new rows in chunks
+    seed_n = BASELINE_ROWS
+    mean, var = X[:seed_n].mean(axis=0), X[:seed_n].var(axis=0)
+    state = {"mean": mean, "scale": np.sqrt(var), "coef": np.zeros(len(FEATURES)), "intercept": 0.0,
+             "n_seen": seed_n, "m2": var * seed_n, "version": 0}
+    t0 = time.perf_counter()
+    for start in range(seed_n, args.rows, args.chunk):
+        state = partial_fit(state, X[start:start + args.chunk], y[start:start + args.chunk])
+    report["incremental_history_s"] = round(time.perf_counter() - t0, 3)
+    report["incremental_history_accuracy"] = round(accuracy(state, X_test, y_test), 4)
+
+    t0 = time.perf_counter()
+    for start in range(0, args.update_rows, args.chunk):
+        state = partial_fit(state, X_new[start:start + args.chunk], y_new[start:start + args.chunk])
+    report["incremental_update_s"] = round(time.perf_counter() - t0, 3)
+    report["incremental_update_accuracy"] = round(accuracy(state, X_test, y_test), 4)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        scoring.FITNESS_MODEL_DIR = model_dir
+        scoring.FITNESS_RELOAD_INTERVAL = 0.0  # check on every call: the measured lag is the swap itself
+        t0 = time.perf_counter()
+        publish(state, model_dir)
+        report["publish_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        scoring._params = None
+        scoring.model_version()
+
+        # scorers hammer the model while versions are published underneath them
+        stop = threading.Event()
+        worst = {"ms": 0.0, "calls": 0}
+        batch = X_test[:1000]
+
+        def scorer():
+            while not stop.is_set():
+                t = time.perf_counter()
+                scoring.score_matrix(batch)
+                worst["ms"] = max(worst["ms"], (time.perf_counter() - t) * 1000)
+                worst["calls"] += 1
+
+        threads = [threading.Thread(target=scorer) for _ in range(4)]
+        for t in threads:
+            t.start()
+        swap_ms = []
+        for _ in range(args.swaps):
+            state = {**state, "coef": state["coef"] * 1.0001}
+            version = publish(state, model_dir)
+            t0 = time.perf_counter()
+            while scoring.score_matrix(batch[:1])[2] != version:
+                pass
+            swap_ms.append((time.perf_counter() - t0) * 1000)
+        stop.set()
+        for t in threads:
+            t.join()
+
+    swap_ms.sort()
+    report["swap_ms_p50"] = round(swap_ms[len(swap_ms) // 2], 3)
+    report["swap_ms_max"] = round(swap_ms[-1], 3)
+    report["scoring_calls_during_swaps"] = worst["calls"]
+    report["scoring_worst_ms_during_swaps"] = round(worst["ms"], 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
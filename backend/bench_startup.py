@@ -0,0 +1,64 @@
+#cold-start benchmark: import time of main.py, first /health latency and first fitness score, each in a fresh interpreter
+#usage: python bench_startup.py [--runs N] [--max-import-ms MS] [--max-first-request-ms MS]
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+t2 = time.perf_counter()
+client.get("/health")
+t3 = time.perf_counter()
+main.score_one(30, 70, 1.75, 55, 190, 5, 22.9)
+t4 = time.perf_counter()
+heavy = sorted(m for m in ("pandas", "sklearn", "joblib", "snowflake.connector") if m in sys.modules)
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "first_score_ms": (t4 - t3) * 1000,
+    "heavy_modules": heavy,
+}))
+"""
+
+
+def run_once():
+    out = subprocess.run([sys.executable, "-c", _PROBE], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold-start latency")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None, help="fail if the median import time exceeds this")
+    parser.add_argument("--max-first-request-ms", type=float, default=None, help="fail if the median first /health exceeds this")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    report = {
+        key: round(statistics.median(r[key] for r in runs), 1)
+        for key in ("import_ms", "first_request_ms", "first_score_ms")
+    }
+    report["heavy_modules_at_startup"] = runs[0]["heavy_modules"]
+    print(json.dumps(report, indent=2))
+
+    failed = []
+    if args.max_import_ms is not None and report["import_ms"] > args.max_import_ms:
+        failed.append(f"import {report['import_ms']} ms > {args.max_import_ms} ms")
+    if args.max_first_request_ms is not None and report["first_request_ms"] > args.max_first_request_ms:
+        failed.append(f"first request {report['first_request_ms']} ms > {args.max_first_request_ms} ms")
+    if report["heavy_modules_at_startup"]:
+        failed.append(f"heavy modules imported at startup: {report['heavy_modules_at_startup']}")
+    if failed:
+        print("[BENCH] regression: " + "; ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#workout store benchmark against the local sqlite stand-in: bulk logging throughput, rollup reads vs scanning the event log
+#usage: python bench_workouts.py [--events N] [--users N] [--batch N] [--queries N]
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from data_structure import WorkoutEvent
+from workouts import SqliteWorkoutStore, week_range, week_start
+
+
+def _percentiles(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {
+        "p50_ms": round(statistics.median(samples_ms), 3),
+        "p99_ms": round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.99))], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the workout event store and its weekly rollups")
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--batch", type=int, default=5_000, help="events per /workouts/log call")
+    parser.add_argument("--queries", type=int, default=2_000, help="rollup reads to time")
+    parser.add_argument("--scan-queries", type=int, default=10, help="event-log scans to time for comparison")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    users = [f"user_{i:06d}" for i in range(args.users)]
+    activities = ["Run", "Strength", "Yoga", "Cycling", "HIIT"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqliteWorkoutStore(os.path.join(tmp, "workouts.sqlite3"))
+
+        t0 = time.perf_counter()
+        for start in range(0, args.events, args.batch):
+            n = min(args.batch, args.events - start)
+            store.log_events([
+                WorkoutEvent(
+                    user_id=rng.choice(users),
+                    completed_at=now - timedelta(minutes=rng.randrange(365 * 24 * 60)),
+                    activity=rng.choice(activities),
+                    duration_min=rng.randrange(10, 90),
+                )
+                for _ in range(n)
+            ])
+        log_s = time.perf_counter() - t0
+
+        rollup_ms = []
+        for _ in range(args.queries):
+            t = time.perf_counter()
+            week_range(rng.choice(users), 12, store=store)
+            rollup_ms.append((time.perf_counter() - t) * 1000)
+
+        #what /workout_stats would cost without rollups: count this week's events straight from the log
+        this_week = week_start(now).isoformat()
+        scan_ms = []
+        for _ in range(args.scan_queries):
+            t = time.perf_counter()
+            store._db.execute(
+                "SELECT COUNT(*) FROM workout_events WHERE user_id = ? AND completed_at >= ?",
+                (rng.choice(users), this_week),
+            ).fetchone()
+            scan_ms.append((time.perf_counter() - t) * 1000)
+
+        rollup_rows = store._db.execute("SELECT COUNT(*) FROM workout_weekly").fetchone()[0]
+
+    print(json.dumps({
+        "events": args.events,
+        "users": args.users,
+        "rollup_rows": rollup_rows,
+        "log_events_per_s": round(args.events / log_s),
+        "rollup_read_12_weeks": _percentiles(rollup_ms),
+        "event_scan_this_week": _percentiles(scan_ms),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#fitness_score percentiles within cohorts (age band, broad goal, experience level), served from precomputed histograms
+#one fixed-bin histogram per (age band, goal, level) cell; histograms merge by addition, so every coarser cohort is the
+#sum of its cells at request time. Profile writes move one count between bins, and a periodic rebuild replaces
+#everything with a single GROUP BY over USER_PROFILES, so only counts ever leave Snowflake
+import os
+import time
+import asyncio
+import threading
+
+import numpy as np
+
+from db_pool import get_conn
+from executor import run_blocking
+
+COHORT_BINS             = int(os.getenv("COHORT_BINS", "100"))               # bins over [0, 1]; 100 resolves 2-dp scores exactly
+COHORT_AGE_EDGES        = tuple(int(a) for a in os.getenv("COHORT_AGE_EDGES", "25,35,45,55,65").split(","))
+COHORT_MIN_SIZE         = int(os.getenv("COHORT_MIN_SIZE", "20"))            # smaller cohorts report no percentile
+COHORT_REBUILD_INTERVAL = float(os.getenv("COHORT_REBUILD_INTERVAL", "3600")) # seconds between full rebuilds
+
+DIMENSIONS = ("age_band", "broad_goal", "experience_level")
+
+
+def age_band(age):
+    if age is None:
+        return ""
+    age = float(age)
+    if age < COHORT_AGE_EDGES[0]:
+        return f"<{COHORT_AGE_EDGES[0]}"
+    for lo, hi in zip(COHORT_AGE_EDGES, COHORT_AGE_EDGES[1:]):
+        if age < hi:
+            return f"{lo}-{hi - 1}"
+    return f"{COHORT_AGE_EDGES[-1]}+"
+
+
+def _age_band_sql():
+    #the same bands as age_band(), evaluated by Snowflake
+    edges = COHORT_AGE_EDGES
+    whens = [f"WHEN AGE < {edges[0]} THEN '<{edges[0]}'"]
+    whens += [f"WHEN AGE < {hi} THEN '{lo}-{hi - 1}'" for lo, hi in zip(edges, edges[1:])]
+    return f"CASE WHEN AGE IS NULL THEN '' {' '.join(whens)} ELSE '{edges[-1]}+' END"
+
+
+def score_bin(score):
+    # the epsilon keeps e.g. 0.29 * 100 = 28.999... in bin 29, matching the SQL below
+    return min(max(int(np.floor(float(score) * COHORT_BINS + 1e-9)), 0), COHORT_BINS - 1)
+
+
+_HISTOGRAM_SQL = f"""
+    SELECT {_age_band_sql()} AS AGE_BAND,
+           COALESCE(BROAD_GOAL, '') AS BROAD_GOAL,
+           COALESCE(EXPERIENCE_LEVEL, -1) AS EXPERIENCE_LEVEL,
+           LEAST(GREATEST(FLOOR(FITNESS_SCORE * {COHORT_BINS} + 1e-9), 0), {COHORT_BINS - 1}) AS BIN,
+           COUNT(*)
+    FROM USER_PROFILES
+    WHERE FITNESS_SCORE IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+def cell_of(profile):
+    """(age band, goal, level) cell and score bin of a profile dict, or None if it has no score."""
+    if not profile or profile.get("fitness_score") is None:
+        return None
+    level = profile.get("experience_level")
+    return ((age_band(profile.get("age")), profile.get("broad_goal") or "", -1 if level is None else int(level)),
+            score_bin(profile["fitness_score"]))
+
+
+def load_histograms():
+    """Blocking rebuild: {cell: counts per bin} from one aggregate query."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(_HISTOGRAM_SQL)
+        cells = {}
+        for band, goal, level, b, n in cur.fetchall():
+            hist = cells.get((band, goal, int(level)))
+            if hist is None:
+                hist = cells[(band, goal, int(level))] = np.zeros(COHORT_BINS, dtype=np.int64)
+            hist[int(b)] += int(n)
+        return cells
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _percentile(hist, b):
+    #mid-rank: everyone in lower bins plus half of the user's own bin
+    total = int(hist.sum())
+    if total < COHORT_MIN_SIZE:
+        return total, None
+    return total, round(100.0 * (int(hist[:b].sum()) + int(hist[b]) / 2) / total, 1)
+
+
+class CohortStore:
+    def __init__(self, loader=load_histograms, interval=COHORT_REBUILD_INTERVAL):
+        self.interval = interval
+        self._loader = loader
+        self._cells = None  # cell -> np.int64[COHORT_BINS]; None until the first rebuild
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.RLock()
+        self._replay = None  # deltas seen while a rebuild's query is running, applied on top of its result
+        self._built_at = None
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self._stats = {"updates": 0, "skipped": 0, "rebuilds": 0, "rebuild_errors": 0, "last_rebuild_ms": 0.0}
+
+    def _apply(self, cell, b, delta):
+        hist = self._cells.get(cell)
+        if hist is None:
+            hist = self._cells[cell] = np.zeros(COHORT_BINS, dtype=np.int64)
+        hist[b] = max(hist[b] + delta, 0)
+
+    def record(self, old, new):
+        """Move a profile from its old (cell, bin) to its new one. old=None for a new profile.
+        Before the first rebuild has started there is nothing to update; that rebuild will read the row."""
+        before, after = cell_of(old), cell_of(new)
+        if before == after:
+            return
+        with self._lock:
+            if self._cells is None and self._replay is None:
+                return
+            for placed, delta in ((before, -1), (after, 1)):
+                if placed is None:
+                    continue
+                if self._cells is not None:
+                    self._apply(*placed, delta)
+                if self._replay is not None:
+                    self._replay.append((*placed, delta))
+            self._stats["updates"] += 1
+
+    def skipped(self, n=1):
+        """Count writes whose previous cohort wasn't known; the next rebuild picks them up."""
+        with self._lock:
+            self._stats["skipped"] += n
+
+    def rebuild(self):
+        """Replace every histogram from USER_PROFILES (blocking). Returns the number of scored profiles.
+        A write that commits just before the query's snapshot may be counted twice until the next rebuild."""
+        with self._rebuild_lock:
+            started = time.perf_counter()
+            with self._lock:
+                self._replay = []
+            try:
+                cells = self._loader()
+            except Exception:
+                with self._lock:
+                    self._replay = None
+                    self._stats["rebuild_errors"] += 1
+                raise
+            with self._lock:
+                replay, self._replay = self._replay, None
+                self._cells = cells
+                for cell, b, delta in replay:
+                    self._apply(cell, b, delta)
+                self._built_at = time.time()
+                self._stats["rebuilds"] += 1
+                self._stats["last_rebuild_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                return int(sum(int(h.sum()) for h in cells.values()))
+
+    def _ensure_built(self):
+        with self._rebuild_lock:
+            if self._cells is None:
+                self.rebuild()
+
+    async def percentiles(self, profile):
+        """The profile's percentile in every single-dimension cohort, in its exact cell, and overall."""
+        if self._cells is None:
+            await run_blocking("db", self._ensure_built)
+        placed = cell_of(profile)
+        if placed is None:
+            raise ValueError("profile has no fitness_score yet")
+        cell, b = placed
+
+        def merged(match):
+            hists = [h for c, h in self._cells.items() if match(c)]
+            return np.sum(hists, axis=0) if hists else np.zeros(COHORT_BINS, dtype=np.int64)
+
+        cohorts = {}
+        with self._lock:
+            size, pct = _percentile(merged(lambda c: True), b)
+            cohorts["all"] = {"size": size, "percentile": pct}
+            for i, dim in enumerate(DIMENSIONS):
+                size, pct = _percentile(merged(lambda c: c[i] == cell[i]), b)
+                cohorts[dim] = {"value": _shown(cell[i]), "size": size, "percentile": pct}
+            size, pct = _percentile(merged(lambda c: c == cell), b)
+            cohorts["combined"] = {"value": dict(zip(DIMENSIONS, map(_shown, cell))), "size": size, "percentile": pct}
+            built_at = self._built_at
+        return {"fitness_score": profile["fitness_score"], "cohorts": cohorts, "built_at": built_at}
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await run_blocking("db", self.rebuild)
+            except Exception as e:
+                print(f"[ERROR] Cohort histogram rebuild failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    def stats(self):
+        with self._lock:
+            cells = self._cells or {}
+            return {
+                "cells": len(cells),
+                "profiles": int(sum(int(h.sum()) for h in cells.values())),
+                "bins": COHORT_BINS,
+                "built_at": self._built_at,
+                "rebuild_interval": self.interval,
+                **self._stats,
+            }
+
+
+def _shown(value):
+    return None if value in ("", -1) else value
+
+
+cohort_store = CohortStore()
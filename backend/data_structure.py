@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 import json
 
@@ -15,6 +15,7 @@ class UserProfile(BaseModel):
     experience_level: int
     ai_extracted_data: Dict[str, Any]
     fitness_score: float = 0.0
+    model_version: Optional[int] = None  # fitness model version that produced fitness_score
     
     def to_snowflake_query(self):
         return (
@@ -28,7 +29,8 @@ class UserProfile(BaseModel):
             self.age,                 # %s 8
             self.resting_bpm,         # %s 9
             self.experience_level,    # %s 10
-            self.broad_goal           # %s 11
+            self.broad_goal,          # %s 11
+            self.model_version        # %s 12
         )
 
 class UserJournal(BaseModel):
@@ -53,4 +55,45 @@ class UserJournal(BaseModel):
             self.safety_flag,
             json.dumps(self.analysis_results),
             self.created_at
-        )
\ No newline at end of file
+        )
+
+class WorkoutEvent(BaseModel):
+    user_id: str
+    completed_at: datetime = Field(default_factory=datetime.utcnow)  # naive UTC (see SNOWFLAKE_TIMEZONE in db_pool.py)
+    activity: str = "Workout"
+    duration_min: int = Field(0, ge=0)
+
+# --- LLM output schemas, validated by extractor.py ---
+
+class OnboardingExtract(BaseModel):
+    # The part of UserProfile the onboarding chat produces; user_id and the metrics are collected separately
+    broad_goal: str
+    goals: List[str]
+    workouts_per_week: int = Field(..., ge=0, le=14)
+    ai_extracted_data: Dict[str, Any] = Field(default_factory=dict)
+
+class OnboardingTurn(BaseModel):
+    # A mid-conversation onboarding reply (ONBOARD_STATE_PROMPT): the slots the user's message answered and the next question
+    filled: Dict[str, Any] = Field(default_factory=dict)
+    reply: str = Field(..., min_length=1)
+
+class JournalClean(BaseModel):
+    cleaned_text: str = Field(..., min_length=1)
+    context_tags: List[str] = Field(default_factory=list)
+    safety_flag: bool = False
+
+    @field_validator("safety_flag", mode="before")
+    @classmethod
+    def _flag_words(cls, v):
+        # JOURNAL_INPUT_PROMPT asks for a boolean but also mentions 'high_priority'; models emit either
+        if isinstance(v, str) and v.strip().lower() in ("high_priority", "high", "flagged"):
+            return True
+        return v
+
+class ScheduleDay(BaseModel):
+    day: str
+    activity: str
+    duration_min: int = Field(0, ge=0)
+    intensity: str = "Moderate"
+    focus: str = ""
+    emoji: str = ""
@@ -0,0 +1,278 @@
+#bounded, thread-safe pool of Snowflake connections shared by every endpoint and the Cortex helpers
+import os
+import time
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+import metrics
+from deadline import DeadlineCursor
+
+load_dotenv()
+
+SNOWFLAKE_CONFIG = {
+    "user":      os.getenv("SNOWFLAKE_USER"),
+    "password":  os.getenv("SNOWFLAKE_PASSWORD"),
+    "account":   os.getenv("SNOWFLAKE_ACCOUNT"),
+    "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+    "database":  os.getenv("SNOWFLAKE_DATABASE"),
+    "schema":    os.getenv("SNOWFLAKE_SCHEMA"),
+    "role":      os.getenv("SNOWFLAKE_ROLE"),
+}
+
+#session parameters are applied once at login and then reused for the lifetime of the pooled session
+SESSION_PARAMETERS = {
+    "QUERY_TAG": os.getenv("SNOWFLAKE_QUERY_TAG", "cadence-ai"),
+}
+#opt-in: unset, sessions keep the account's TIMEZONE. Rows this app stamps in Python (workout log, locally scored
+#journals) are naive UTC, so "UTC" keeps them comparable with CURRENT_TIMESTAMP() on accounts that default elsewhere
+if os.getenv("SNOWFLAKE_TIMEZONE"):
+    SESSION_PARAMETERS["TIMEZONE"] = os.getenv("SNOWFLAKE_TIMEZONE")
+
+POOL_MIN_SIZE     = int(os.getenv("SNOWFLAKE_POOL_MIN", "1"))
+POOL_MAX_SIZE     = int(os.getenv("SNOWFLAKE_POOL_MAX", "24"))  # >= db + llm executor limits
+POOL_IDLE_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_IDLE_TIMEOUT", "600"))  # seconds before an idle session is closed
+POOL_PING_AFTER   = float(os.getenv("SNOWFLAKE_POOL_PING_AFTER", "60"))     # idle seconds before a checkout runs SELECT 1
+POOL_CHECKOUT_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_CHECKOUT_TIMEOUT", "30"))
+SNOWFLAKE_CONNECTOR   = os.getenv("SNOWFLAKE_CONNECTOR", "snowflake")  # "fake": the local stand-in in fake_snowflake.py
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PooledConnection:
+    """Proxy handed out by the pool; close() returns the session to the pool instead of logging out."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"connection already returned to pool ({name})")
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise AttributeError("connection already returned to pool (cursor)")
+        return metrics.InstrumentedCursor(DeadlineCursor(self._raw.cursor(*args, **kwargs)))
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def invalidate(self):
+        """Drop the underlying session instead of reusing it (e.g. after a broken socket)."""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.discard(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, config, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, ping_after=POOL_PING_AFTER,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, session_parameters=None, connect_fn=None):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("pool requires 1 <= max_size and min_size <= max_size")
+        self.config = {k: v for k, v in config.items() if v is not None}
+        self.session_parameters = dict(session_parameters or {})
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.checkout_timeout = checkout_timeout
+        self._connect_fn = connect_fn  # None -> SNOWFLAKE_CONNECTOR's connect, imported on first login
+        self._control = None  # unpooled session for control statements, see control_conn()
+        self._idle = deque()  # (raw connection, last returned at)
+        self._size = 0        # idle + checked out
+        self._cond = threading.Condition()
+        self._stats = {
+            "created": 0, "reused": 0, "closed_idle": 0, "closed_dead": 0,
+            "checkouts": 0, "waits": 0, "timeouts": 0,
+        }
+
+    def _open(self):
+        if self._connect_fn is None:
+            if SNOWFLAKE_CONNECTOR == "fake":
+                from fake_snowflake import connect
+            else:
+                from snowflake.connector import connect
+            self._connect_fn = connect
+        with metrics.stage(metrics.scoped("connect")):
+            conn = self._connect_fn(**self.config, session_parameters=self.session_parameters)
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _evict_idle_locked(self, now):
+        #oldest sessions sit at the left; only trim while we stay above min_size
+        evicted = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats["closed_idle"] += 1
+            evicted.append(conn)
+        return evicted
+
+    def _is_alive(self, conn, idle_for):
+        try:
+            if conn.is_closed():
+                return False
+            if idle_for >= self.ping_after:
+                cur = conn.cursor()
+                try:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+                finally:
+                    cur.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                evicted = self._evict_idle_locked(now)
+                candidate = None
+                if self._idle:
+                    candidate = self._idle.pop()  # most recently used session is warmest
+                elif self._size < self.max_size:
+                    self._size += 1  # reserve a slot, then log in outside the lock
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolExhausted(f"no Snowflake connection available after {self.checkout_timeout}s")
+                    self._stats["waits"] += 1
+                    self._cond.wait(remaining)
+                    continue
+            _close_quietly(evicted)
+
+            if candidate is not None:
+                conn, returned_at = candidate
+                if self._is_alive(conn, time.monotonic() - returned_at):
+                    with self._cond:
+                        self._stats["reused"] += 1
+                        self._stats["checkouts"] += 1
+                    return PooledConnection(self, conn)
+                self.discard(conn)
+                continue
+
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["checkouts"] += 1
+            return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            closed = conn.is_closed()
+        except Exception:
+            closed = True
+        if closed:
+            self.discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, conn):
+        with self._cond:
+            self._size -= 1
+            self._stats["closed_dead"] += 1
+            self._cond.notify()
+        _close_quietly([conn])
+
+    def control_conn(self):
+        """A session outside the pool for control statements (SYSTEM$CANCEL_QUERY) that must not queue behind
+        checkouts held by the very queries they target; opened on first use, reopened if it died."""
+        with self._cond:
+            conn = self._control
+        if conn is None or conn.is_closed():
+            conn = self._open()
+            with self._cond:
+                stale, self._control = self._control, conn
+            if stale is not None:
+                _close_quietly([stale])
+        return conn
+
+    def close_all(self):
+        with self._cond:
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            control, self._control = self._control, None
+        _close_quietly(idle + ([control] if control is not None else []))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                **self._stats,
+            }
+
+
+def _close_quietly(conns):
+    for conn in conns:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(SNOWFLAKE_CONFIG, session_parameters=SESSION_PARAMETERS)
+    return _pool
+
+
+def get_conn():
+    """Check out a pooled connection; call .close() (or use `with`) to hand it back."""
+    with metrics.stage(metrics.scoped("checkout")):
+        return get_pool().acquire()
+
+
+_engine = None
+
+
+def get_engine():
+    """SQLAlchemy engine whose DBAPI connections come from the shared pool."""
+    global _engine
+    if _engine is None:
+        with _pool_lock:
+            if _engine is None:
+                from snowflake.sqlalchemy import URL
+                from sqlalchemy import create_engine
+                from sqlalchemy.pool import NullPool
+
+                url = URL(**{k: v for k, v in SNOWFLAKE_CONFIG.items() if v is not None})
+                #NullPool: SQLAlchemy "closes" the DBAPI connection on release, which hands it back to our pool
+                _engine = create_engine(url, creator=get_conn, poolclass=NullPool,
+                                        echo=os.getenv("SNOWFLAKE_SQL_ECHO") == "1")
+    return _engine
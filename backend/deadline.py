@@ -0,0 +1,296 @@
+#per-request deadline budgets: DeadlineMiddleware gives each request a Deadline (REQUEST_DEADLINE seconds, or less via an
+#X-Request-Timeout header) in a contextvar, which run_blocking carries into the worker threads. Every statement checks it
+#and hands the remaining budget to the connector as its server-side timeout; Cortex completions run as async queries so
+#they can be cancelled by query id the moment the deadline expires, the client disconnects or a hedge wins
+import os
+import math
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+
+import metrics
+
+REQUEST_DEADLINE     = float(os.getenv("REQUEST_DEADLINE", "30"))       # seconds per request
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", "120"))  # cap on a client's X-Request-Timeout
+#path prefix -> seconds, longest prefix wins; 0 runs the route without a deadline (long-lived streams)
+ROUTE_DEADLINES = {
+    prefix.strip(): float(seconds)
+    for prefix, seconds in (item.split("=") for item in os.getenv("ROUTE_DEADLINES", "/export=0,/metrics=0").split(",") if item)
+}
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, reason: str):
+        super().__init__("request deadline exceeded" if reason == "deadline" else f"request cancelled ({reason})")
+        self.reason = reason
+
+
+_stats = {"requests": 0, "cancelled": {}, "queries_cancelled": 0, "cancel_errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _bump(field, key=None):
+    with _stats_lock:
+        if key is None:
+            _stats[field] += 1
+        else:
+            _stats[field][key] = _stats[field].get(key, 0) + 1
+
+
+class Deadline:
+    """An expiry time plus a cancellation signal; on_cancel hooks (e.g. cancelling a running query) fire once."""
+
+    def __init__(self, seconds=None, expires_at=None, parent=None):
+        if expires_at is None:
+            expires_at = math.inf if seconds is None else time.monotonic() + seconds
+        self.expires_at = expires_at
+        self.reason = None
+        self._hooks = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._detach = None
+        if parent is not None:
+            # a child expires no later than its parent and is cancelled with it, but can also be cancelled alone
+            self.expires_at = min(self.expires_at, parent.expires_at)
+            self._detach = parent.on_cancel(lambda: self.cancel(parent.reason))
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self):
+        if self.reason is None and self.remaining() <= 0:
+            self.cancel("deadline")
+        if self.reason is not None:
+            raise DeadlineExceeded(self.reason)
+
+    def on_cancel(self, hook):
+        """Register hook() to run (on its own thread) when this deadline is cancelled; returns the unregister call."""
+        with self._lock:
+            hook_id = next(self._ids)
+            self._hooks[hook_id] = hook
+        return lambda: self._hooks.pop(hook_id, None)
+
+    def cancel(self, reason: str):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            hooks, self._hooks = list(self._hooks.values()), {}
+        if self._detach is None:
+            _bump("cancelled", reason)  # children are counted through their root
+        for hook in hooks:
+            threading.Thread(target=hook, daemon=True).start()  # cancelling a query is a round trip; never block here
+
+    def close(self):
+        if self._detach is not None:
+            self._detach()
+
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+def current():
+    return _current.get()
+
+
+def set_current(deadline):
+    return _current.set(deadline)
+
+
+def background_context():
+    """A copy of the current context without the request's deadline, for work that outlives the response."""
+    ctx = contextvars.copy_context()
+    ctx.run(_current.set, None)
+    return ctx
+
+
+async def detach(fn):
+    """Await fn() under a deadline with the same expiry that isn't tied to the calling request's disconnect:
+    work other callers may join (single-flight, idempotent retries) must not die with the request that started it."""
+    deadline = current()
+    if deadline is not None:
+        _current.set(Deadline(expires_at=deadline.expires_at))
+    return await fn()
+
+
+@asynccontextmanager
+async def bounded():
+    """Give up with DeadlineExceeded rather than wait past the deadline (e.g. in the Cortex admission queue)."""
+    deadline = current()
+    if deadline is None or math.isinf(deadline.expires_at):
+        yield
+        return
+    deadline.check()
+    try:
+        async with asyncio.timeout(deadline.remaining()):
+            yield
+    except TimeoutError:
+        deadline.cancel("deadline")
+        raise DeadlineExceeded("deadline") from None
+
+
+# --- statement enforcement ---
+
+_control_lock = threading.Lock()
+
+
+def cancel_query(query_id):
+    #runs on the control session: the pool may be full of exactly the queries being cancelled
+    from db_pool import get_pool
+    try:
+        with _control_lock:
+            cur = get_pool().control_conn().cursor()
+            try:
+                cur.execute("SELECT SYSTEM$CANCEL_QUERY(%s)", (query_id,))
+            finally:
+                cur.close()
+        _bump("queries_cancelled")
+    except Exception as e:
+        _bump("cancel_errors")
+        print(f"[ERROR] Cancelling query {query_id} failed: {str(e)}")
+
+
+def _raise_for(deadline, error):
+    if deadline.reason is not None or deadline.remaining() <= 0:
+        deadline.cancel("deadline")  # no-op if it already has a reason
+        raise DeadlineExceeded(deadline.reason) from error
+    raise error
+
+
+class DeadlineCursor:
+    """Cursor proxy that holds each statement to the current deadline; everything else passes straight through."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def execute(self, *args, **kwargs):
+        deadline = current()
+        if deadline is None:
+            return self._raw.execute(*args, **kwargs)
+        deadline.check()
+        if not math.isinf(deadline.expires_at):
+            kwargs.setdefault("timeout", max(1, math.ceil(deadline.remaining())))  # cancelled server-side
+        try:
+            return self._raw.execute(*args, **kwargs)
+        except Exception as e:
+            _raise_for(deadline, e)
+
+    def execute_cancellable(self, sql, params=()):
+        """execute() for long statements such as Cortex completions: submitted async, so the query id is known and
+        the statement is cancelled as soon as the deadline expires or is cancelled, instead of running to the end."""
+        deadline = current()
+        if deadline is None:
+            with metrics.stage(metrics.scoped("execute")):
+                self._raw.execute(sql, params)
+            return self
+        deadline.check()
+        with metrics.stage(metrics.scoped("execute")):
+            self._raw.execute_async(sql, params)
+            query_id = self._raw.sfqid
+            unregister = deadline.on_cancel(lambda: cancel_query(query_id))
+            timer = None
+            if not math.isinf(deadline.expires_at):
+                timer = threading.Timer(max(0.0, deadline.remaining()), deadline.cancel, ("deadline",))
+                timer.daemon = True
+                timer.start()
+            try:
+                self._raw.get_results_from_sfqid(query_id)
+            except Exception as e:
+                _raise_for(deadline, e)
+            finally:
+                unregister()
+                if timer is not None:
+                    timer.cancel()
+        return self
+
+
+# --- middleware ---
+
+def _budget(scope):
+    path = scope["path"]
+    matches = [p for p in ROUTE_DEADLINES if path.startswith(p)]
+    budget = ROUTE_DEADLINES[max(matches, key=len)] if matches else REQUEST_DEADLINE
+    if budget <= 0:
+        return None
+    for name, value in scope.get("headers", ()):
+        if name == b"x-request-timeout":
+            try:
+                budget = min(budget, float(value), REQUEST_DEADLINE_MAX)
+            except ValueError:
+                pass
+    return max(budget, 0.001)
+
+
+class DeadlineMiddleware:
+    """Pure ASGI middleware: a Deadline per request, cancelled together with the request when the client disconnects.
+    The (small) request body is read up front so a watcher can own receive() while the handler runs."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        budget = _budget(scope) if scope["type"] == "http" else None
+        if budget is None:
+            return await self.app(scope, receive, send)
+        _bump("requests")
+        deadline = Deadline(budget)
+        token = _current.set(deadline)
+
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                _current.reset(token)
+                return
+            body.append(message)
+            if not message.get("more_body"):
+                break
+
+        disconnected = asyncio.Event()
+        finished = {"sent": False}
+
+        async def replay():
+            if body:
+                return body.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                finished["sent"] = True
+            await send(message)
+
+        handler = asyncio.ensure_future(self.app(scope, replay, send_wrapper))
+
+        async def watch():
+            message = await receive()
+            while message["type"] != "http.disconnect":
+                message = await receive()
+            disconnected.set()
+            if not finished["sent"] and not handler.done():
+                deadline.cancel("disconnected")  # running queries first, then the handler itself
+                handler.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not disconnected.is_set():
+                handler.cancel()
+                raise
+        finally:
+            watcher.cancel()
+            _current.reset(token)
+
+
+def stats():
+    with _stats_lock:
+        return {"default_s": REQUEST_DEADLINE, "routes": dict(ROUTE_DEADLINES), "requests": _stats["requests"],
+                "cancelled": dict(_stats["cancelled"]), "queries_cancelled": _stats["queries_cancelled"],
+                "cancel_errors": _stats["cancel_errors"]}
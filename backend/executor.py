@@ -0,0 +1,104 @@
+#offloads blocking Snowflake / Cortex / sklearn work from the event loop onto a bounded thread pool
+import os
+import time
+import asyncio
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+#per-kind concurrency caps; the pool is sized to their sum so one kind can never starve another of threads
+#a slot is held until the worker thread returns, not until the caller stops waiting: a cancelled caller (a lost hedge,
+#an expired deadline, a client disconnect) leaves its thread running until the query is cancelled or finishes
+CONCURRENCY_LIMITS = {
+    "db":  int(os.getenv("EXEC_DB_CONCURRENCY", "8")),    # short reads / writes
+    "llm": int(os.getenv("EXEC_LLM_CONCURRENCY", "16")),  # SNOWFLAKE.CORTEX.COMPLETE, 5-10 s each
+    "cpu": int(os.getenv("EXEC_CPU_CONCURRENCY", "2")),   # model inference
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=sum(CONCURRENCY_LIMITS.values()),
+    thread_name_prefix="blocking",
+)
+
+_semaphores = {}
+_counters = {kind: {"in_flight": 0, "waiting": 0, "completed": 0, "failed": 0, "abandoned": 0,
+                    "running": 0, "running_max": 0} for kind in CONCURRENCY_LIMITS}
+_counters_lock = threading.Lock()
+
+
+def _semaphore(kind):
+    #semaphores are created lazily so they bind to the running event loop
+    sem = _semaphores.get(kind)
+    if sem is None:
+        sem = _semaphores[kind] = asyncio.Semaphore(CONCURRENCY_LIMITS[kind])
+    return sem
+
+
+def _bump(kind, field, delta=1):
+    with _counters_lock:
+        _counters[kind][field] += delta
+
+
+def _tracked(kind, call):
+    #worker thread side: counts the threads really busy with `kind`, whatever the callers are doing
+    with _counters_lock:
+        counters = _counters[kind]
+        counters["running"] += 1
+        counters["running_max"] = max(counters["running_max"], counters["running"])
+    try:
+        return call()
+    finally:
+        _bump(kind, "running", -1)
+
+
+def _finished(kind, sem, future):
+    #event loop side, once the worker thread is done with the call
+    _bump(kind, "failed" if future.cancelled() or future.exception() is not None else "completed")
+    _bump(kind, "in_flight", -1)
+    sem.release()
+
+
+async def run_blocking(kind: str, fn, /, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the worker pool under the `kind` concurrency cap."""
+    if kind not in CONCURRENCY_LIMITS:
+        raise ValueError(f"unknown executor kind: {kind}")
+    sem = _semaphore(kind)
+    _bump(kind, "waiting")
+    t0 = time.perf_counter()
+    try:
+        await sem.acquire()
+    finally:
+        _bump(kind, "waiting", -1)
+    metrics.record_stage(f"{kind}.wait", time.perf_counter() - t0)
+    _bump(kind, "in_flight")
+    #copy contextvars so request-scoped state is visible inside the worker thread
+    ctx = contextvars.copy_context()
+    call = functools.partial(_tracked, kind, functools.partial(ctx.run, fn, *args, **kwargs))
+    try:
+        future = asyncio.get_running_loop().run_in_executor(_executor, call)
+    except BaseException:
+        _bump(kind, "in_flight", -1)
+        sem.release()
+        raise
+    future.add_done_callback(functools.partial(_finished, kind, sem))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if not future.done():
+            _bump(kind, "abandoned")  # the slot stays taken until the thread returns
+        raise
+
+
+def stats():
+    with _counters_lock:
+        return {
+            kind: {"limit": CONCURRENCY_LIMITS[kind], **counters}
+            for kind, counters in _counters.items()
+        }
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
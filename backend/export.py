@@ -0,0 +1,338 @@
+#bulk export of USER_JOURNALS / USER_PROFILES as NDJSON, CSV or Parquet, streamed in constant memory
+#rows are read in keyset pages ordered on (USER_ID, CREATED_AT), each page drained with fetchmany, and every batch is
+#encoded and handed on before the next is fetched; a cut-off export resumes after the last row it delivered
+#usage: python export.py journals|profiles [--format ndjson|csv|parquet] [--out FILE] [--user ID ...]
+#                        [--after-user-id ID --after-created-at TS | --resume]
+import io
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import threading
+from decimal import Decimal
+from datetime import datetime
+
+from db_pool import get_conn, get_pool
+
+EXPORT_PAGE_SIZE  = int(os.getenv("EXPORT_PAGE_SIZE", "50000"))  # rows per keyset query
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))  # rows per fetchmany, i.e. per encoded chunk
+EXPORT_MAX_ACTIVE = int(os.getenv("EXPORT_MAX_ACTIVE", "2"))     # concurrent exports; each holds a pooled connection
+
+TABLES = {
+    "journals": ("USER_JOURNALS", ["USER_ID", "CREATED_AT", "JOURNAL", "SENTIMENT_ANALYSIS"]),
+    "profiles": ("USER_PROFILES", ["USER_ID", "CREATED_AT", "BROAD_GOAL", "GOALS", "WORKOUTS_PER_WEEK", "AI_EXTRACTED_DATA",
+                                   "FITNESS_SCORE", "WEIGHT_KG", "HEIGHT_CM", "AGE", "RESTING_BPM", "EXPERIENCE_LEVEL",
+                                   "MODEL_VERSION"]),
+}
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")  # same form the keyset parameters take
+    return value
+
+
+def resume_after(after_user_id=None, after_created_at=None):
+    """The keyset cursor for a resumed export: both keys of the last delivered row, or neither.
+    A user id alone would compare CREATED_AT with an empty string, which Snowflake rejects mid-stream."""
+    if not after_user_id and not after_created_at:
+        return None
+    if not (after_user_id and after_created_at):
+        raise ValueError("after_user_id and after_created_at must be given together")
+    return after_user_id, after_created_at
+
+
+def page_query(kind, users=None, after=None, limit=EXPORT_PAGE_SIZE):
+    """(sql, params) for the next keyset page after `after` = (user_id, created_at)."""
+    table, columns = TABLES[kind]
+    where, params = [], []
+    if users:
+        where.append(f"USER_ID IN ({', '.join(['%s'] * len(users))})")
+        params.extend(users)
+    if after is not None:
+        where.append("(USER_ID > %s OR (USER_ID = %s AND CREATED_AT > %s))")
+        params.extend((after[0], after[0], after[1]))
+    sql = (f"SELECT {', '.join(columns)} FROM {table}"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + " ORDER BY USER_ID, CREATED_AT LIMIT %s")
+    return sql, tuple(params) + (limit,)
+
+
+def iter_batches(kind, users=None, after=None, page_size=EXPORT_PAGE_SIZE, fetch_size=EXPORT_FETCH_SIZE):
+    """Blocking generator of row batches in (USER_ID, CREATED_AT) order, on one pooled connection."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        while True:
+            cur.execute(*page_query(kind, users, after, page_size))
+            rows_in_page = 0
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                rows = [tuple(_plain(v) for v in row) for row in rows]
+                rows_in_page += len(rows)
+                after = (rows[-1][0], rows[-1][1])
+                yield rows
+            if rows_in_page < page_size:
+                return
+    finally:
+        cur.close()
+        conn.close()
+
+
+# --- encoders: header(), encode(rows) and close() each return bytes ready to send ---
+
+class NdjsonEncoder:
+    media_type = "application/x-ndjson"
+
+    def __init__(self, names):
+        self.names = names
+
+    def header(self):
+        return b""
+
+    def encode(self, rows):
+        return "".join(json.dumps(dict(zip(self.names, row)), ensure_ascii=False, default=str) + "\n"
+                       for row in rows).encode("utf-8")
+
+    def close(self):
+        return b""
+
+
+class CsvEncoder:
+    media_type = "text/csv"
+
+    def __init__(self, names, header=True):
+        self.names = names
+        self.with_header = header
+
+    def _rows(self, rows):
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue().encode("utf-8")
+
+    def header(self):
+        return self._rows([self.names]) if self.with_header else b""
+
+    def encode(self, rows):
+        return self._rows(rows)
+
+    def close(self):
+        return b""
+
+
+class _Chunks(io.RawIOBase):
+    #write-only sink that hands back whatever was written since the last drain
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+class ParquetEncoder:
+    media_type = "application/vnd.apache.parquet"
+
+    _TYPES = {"CREATED_AT": "timestamp", "SENTIMENT_ANALYSIS": "float64", "FITNESS_SCORE": "float64",
+              "WEIGHT_KG": "float64", "HEIGHT_CM": "float64", "WORKOUTS_PER_WEEK": "int64", "AGE": "int64",
+              "RESTING_BPM": "int64", "EXPERIENCE_LEVEL": "int64", "MODEL_VERSION": "int64"}
+
+    def __init__(self, names):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("parquet export needs pyarrow installed")
+        self.pa = pa
+        self.names = names
+        types = {"timestamp": pa.timestamp("us"), "float64": pa.float64(), "int64": pa.int64()}
+        self.schema = pa.schema([(n, types.get(self._TYPES.get(n.upper()), pa.string())) for n in names])
+        self.sink = _Chunks()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression="zstd")
+
+    def header(self):
+        return b""
+
+    def encode(self, rows):
+        columns = list(zip(*rows))
+        arrays = []
+        for field, values in zip(self.schema, columns):
+            if field.type == self.pa.timestamp("us"):
+                values = [datetime.fromisoformat(v) if isinstance(v, str) else v for v in values]
+            elif field.type == self.pa.string():
+                values = [v if v is None or isinstance(v, str) else json.dumps(v, default=str) for v in values]
+            arrays.append(self.pa.array(values, type=field.type))
+        self.writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))  # one row group per batch
+        return self.sink.drain()
+
+    def close(self):
+        self.writer.close()  # footer
+        return self.sink.drain()
+
+
+FORMATS = {"ndjson": NdjsonEncoder, "csv": CsvEncoder, "parquet": ParquetEncoder}
+
+
+def encoder(kind, fmt, **kwargs):
+    if kind not in TABLES:
+        raise ValueError(f"unknown export {kind!r}; expected one of {sorted(TABLES)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}; expected one of {sorted(FORMATS)}")
+    return FORMATS[fmt]([c.lower() for c in TABLES[kind][1]], **kwargs)
+
+
+_stats = {}  # kind -> counters
+_stats_lock = threading.Lock()
+_active = 0
+
+
+def export_chunks(kind, enc, users=None, after=None):
+    """Blocking generator of encoded byte chunks; throughput is recorded when it finishes or is closed."""
+    rows = size = 0
+    started = time.perf_counter()
+    try:
+        chunk = enc.header()
+        size += len(chunk)
+        yield chunk
+        for batch in iter_batches(kind, users, after):
+            chunk = enc.encode(batch)
+            rows += len(batch)
+            size += len(chunk)
+            yield chunk
+        chunk = enc.close()
+        size += len(chunk)
+        yield chunk
+    finally:
+        elapsed = time.perf_counter() - started
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        with _stats_lock:
+            s = _stats.setdefault(kind, {"exports": 0, "rows": 0, "bytes": 0, "seconds": 0.0, "last_rows_per_s": 0.0})
+            s["exports"] += 1
+            s["rows"] += rows
+            s["bytes"] += size
+            s["seconds"] += elapsed
+            s["last_rows_per_s"] = round(rate, 1)
+        # stderr: the CLI writes the export itself to stdout by default
+        print(f"[EXPORT] {kind}: {rows} rows, {size} bytes in {elapsed:.2f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+
+
+def reserve() -> bool:
+    """Claim one of the EXPORT_MAX_ACTIVE slots before an export starts; False if all are taken.
+    Checking and claiming under one lock keeps concurrent requests from all slipping past the limit."""
+    global _active
+    with _stats_lock:
+        if _active >= EXPORT_MAX_ACTIVE:
+            return False
+        _active += 1
+        return True
+
+
+def release():
+    global _active
+    with _stats_lock:
+        _active -= 1
+
+
+def active():
+    with _stats_lock:
+        return _active
+
+
+def stats():
+    with _stats_lock:
+        out = {"active": _active, "max_active": EXPORT_MAX_ACTIVE}
+        for kind, s in _stats.items():
+            out[kind] = {**s, "seconds": round(s["seconds"], 3),
+                         "rows_per_s": round(s["rows"] / s["seconds"], 1) if s["seconds"] else 0.0}
+        return out
+
+
+# --- CLI ---
+
+def _last_line(path):
+    #last non-empty line of a file, read backwards in blocks so a huge export isn't re-read
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        while end > 0:
+            step = min(65536, end)
+            end -= step
+            f.seek(end)
+            data = f.read(step) + data
+            lines = data.rstrip(b"\n").split(b"\n")
+            if len(lines) > 1 or end == 0:
+                return lines[-1].decode("utf-8") if lines[-1] else None
+    return None
+
+
+def resume_point(path, fmt):
+    """(user_id, created_at) of the last row in an earlier partial export, or None if there's nothing to resume."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    line = _last_line(path)
+    if fmt == "ndjson":
+        row = json.loads(line)
+        return row["user_id"], row["created_at"]
+    if fmt == "csv":
+        row = next(csv.reader([line]))
+        return None if row[:2] == ["user_id", "created_at"] else (row[0], row[1])
+    raise ValueError("parquet exports can't be appended to; pass --after-user-id / --after-created-at with a new --out")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream USER_JOURNALS or USER_PROFILES out as NDJSON, CSV or Parquet")
+    parser.add_argument("kind", choices=sorted(TABLES))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--out", help="output file (default: stdout; required for parquet and --resume)")
+    parser.add_argument("--user", action="append", help="only these users (repeatable)")
+    parser.add_argument("--after-user-id")
+    parser.add_argument("--after-created-at")
+    parser.add_argument("--resume", action="store_true", help="append to --out after its last row")
+    args = parser.parse_args()
+
+    try:
+        after = resume_after(args.after_user_id, args.after_created_at)
+    except ValueError as e:
+        parser.error(str(e))
+    appending = False
+    if args.resume:
+        if not args.out:
+            parser.error("--resume needs --out")
+        after = resume_point(args.out, args.format)
+        appending = after is not None
+    if args.format == "parquet" and not args.out:
+        parser.error("parquet needs --out")
+
+    try:
+        enc = encoder(args.kind, args.format, **({"header": False} if args.format == "csv" and appending else {}))
+    except ValueError as e:
+        parser.error(str(e))
+    out = open(args.out, "ab" if appending else "wb") if args.out else sys.stdout.buffer
+    try:
+        started = time.perf_counter()
+        rows_before = stats().get(args.kind, {}).get("rows", 0)
+        for chunk in export_chunks(args.kind, enc, args.user, after):
+            out.write(chunk)
+        rows = stats()[args.kind]["rows"] - rows_before
+        elapsed = time.perf_counter() - started
+        print(f"{rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)"
+              + (f", resumed after {after}" if appending else ""), file=sys.stderr)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        get_pool().close_all()
@@ -0,0 +1,258 @@
+#structured-output extraction for LLM responses: incremental balanced-bracket scanning, cheap local repair, schema validation
+#the scanner works on chunks, so the same code serves a whole response or a token stream;
+#the first candidate span that parses (as-is or repaired) and validates wins, so stray braces in prose are skipped;
+#a span that doesn't parse or never closes is rescanned from the next opener inside it, since an unbalanced brace
+#in prose would otherwise swallow the real object that follows
+import os
+import re
+import json
+import threading
+
+from pydantic import ValidationError
+
+EXTRACTOR_RECORD_PATH = os.getenv("EXTRACTOR_RECORD_PATH", "")  # jsonl of raw responses, the corpus for bench_extractor.py
+
+_CLOSERS = {"{": "}", "[": "]"}
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL = re.compile(r"\b(True|False|None)\b")
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)  # the rest of a string after its opening quote
+
+
+class ExtractionError(ValueError):
+    def __init__(self, message, candidates=0):
+        super().__init__(message)
+        self.candidates = candidates  # bracketed spans seen; 0 means the response had no JSON at all
+
+
+def repair(text: str) -> str:
+    """Trailing commas and Python literals outside of strings; code fences never reach here (the scanner skips them)."""
+    out, pos = [], 0
+    for m in _STRING.finditer(text):
+        out.append(_fix_bare(text[pos:m.start()]))
+        out.append(m.group())
+        pos = m.end()
+    out.append(_fix_bare(text[pos:]))
+    return "".join(out)
+
+
+def _fix_bare(segment):
+    segment = _TRAILING_COMMA.sub(r"\1", segment)
+    return _PY_LITERAL.sub(lambda m: _PY_LITERALS[m.group()], segment)
+
+
+def _loads(span):
+    """(value, repaired) or raise ValueError."""
+    try:
+        return json.loads(span), False
+    except ValueError:
+        return json.loads(repair(span)), True
+
+
+class BracketScanner:
+    """Feeds on chunks and reports spans as they close, as (kind, text, start): "item" for each bracketed element of a
+    top-level array, "value" for each complete top-level object/array, "dropped" (empty text) for a top-level span cut
+    off by a mismatched closer. Prose outside brackets is ignored."""
+
+    def __init__(self, opener="{"):
+        self.opener = opener
+        self.text = ""
+        self.pos = 0             # where the next feed resumes; parked on an unterminated string's opening quote
+        self.stack = []          # open brackets of the current span
+        self.in_string = False
+        self.start = None        # offset of the current top-level span
+        self.item_start = None   # offset of the current depth-1 element inside a top-level array
+        self.spans = 0
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        events = []
+        text, stack = self.text, self.stack
+        i = self.pos
+        while i < len(text):
+            if not stack:
+                # prose between spans: jump straight to the next opener
+                i = text.find(self.opener, i)
+                if i < 0:
+                    i = len(text)
+                    break
+                stack.append(self.opener)
+                self.start = i
+                self.spans += 1
+                i += 1
+                continue
+            m = _STRUCTURAL.search(text, i)
+            if m is None:
+                i = len(text)
+                break
+            c = m.group()
+            if c == '"':
+                # skip the whole string literal at once; if it isn't closed yet, wait here for more input
+                end = _STRING_REST.match(text, m.end())
+                if end is None:
+                    self.in_string = True
+                    i = m.start()
+                    break
+                self.in_string = False
+                i = end.end()
+                continue
+            i = m.end()
+            if c in _CLOSERS:
+                if len(stack) == 1 and stack[0] == "[":
+                    self.item_start = m.start()
+                stack.append(c)
+            else:
+                if _CLOSERS[stack[-1]] != c:
+                    stack.clear()  # mismatched: not JSON, drop the span and keep scanning
+                    self.item_start = None
+                    events.append(("dropped", "", self.start))
+                    continue
+                stack.pop()
+                if len(stack) == 1 and self.item_start is not None:
+                    events.append(("item", text[self.item_start:i], self.item_start))
+                    self.item_start = None
+                elif not stack:
+                    events.append(("value", text[self.start:i], self.start))
+        self.pos = i
+        return events
+
+    def rewind(self, start):
+        """Give up on the span opened at `start`; the next feed resumes scanning just after its opener."""
+        self.stack.clear()
+        self.in_string = False
+        self.item_start = None
+        self.pos = start + 1
+
+    def tail(self):
+        """The unterminated span at end of input, closed off (for truncated responses), or None."""
+        if not self.stack:
+            return None
+        if self.item_start is not None:
+            # drop a half-written array element rather than guess at its fields
+            return self.text[self.start:self.item_start].rstrip().rstrip(",") + "]"
+        span = self.text[self.start:].rstrip()
+        if self.in_string:
+            span += '"'
+        span = span.rstrip(",: \t\r\n")
+        return span + "".join(_CLOSERS[b] for b in reversed(self.stack))
+
+
+class StreamExtractor:
+    def __init__(self, model, many=False, name="default", stream_items=True):
+        self.model = model
+        self.many = many
+        self.name = name
+        self.stream_items = many and stream_items
+        self.scanner = BracketScanner("[" if many else "{")
+        self.result = None
+        self.repaired = False
+        self._emitted = False  # items already handed out; rescanning inside their span could repeat them
+
+    def _validate(self, value):
+        if self.many:
+            if not isinstance(value, list):
+                raise ValueError("expected a JSON array")
+            return [self.model.model_validate(v).model_dump() for v in value]
+        if not isinstance(value, dict):
+            raise ValueError("expected a JSON object")
+        return self.model.model_validate(value).model_dump()
+
+    def _accept(self, span):
+        try:
+            value, repaired = _loads(span)
+            self.result = self._validate(value)
+        except (ValueError, ValidationError):
+            return False
+        self.repaired = repaired
+        return True
+
+    def feed(self, chunk: str) -> list:
+        """Validated array elements completed by this chunk (many=True only); stops once a result is found."""
+        if self.result is not None:
+            return []
+        items = []
+        events = self.scanner.feed(chunk)
+        while events:
+            kind, span, start = events.pop(0)
+            if kind == "item":
+                if self.stream_items:
+                    try:
+                        items.append(self.model.model_validate(_loads(span)[0]).model_dump())
+                        self._emitted = True
+                    except (ValueError, ValidationError):
+                        pass
+            elif kind == "value" and self._accept(span):
+                break
+            elif not self._emitted:
+                # the span may have opened on a stray bracket in prose: look again from the next opener inside it
+                self.scanner.rewind(start)
+                events = self.scanner.feed("")
+        return items
+
+    def close(self):
+        """The validated object (or list), repairing a truncated tail as a last resort; raises ExtractionError."""
+        if EXTRACTOR_RECORD_PATH:
+            _record(self.name, self.scanner.text)
+        while self.result is None:
+            tail = self.scanner.tail()
+            if tail is not None and self._accept(tail):
+                self.repaired = True
+                break
+            if tail is None or self._emitted:
+                _count(self.name, "failed")
+                raise ExtractionError(
+                    f"no valid {self.model.__name__}{' list' if self.many else ''} in response",
+                    self.scanner.spans,
+                )
+            # an unterminated span that doesn't repair may be a stray opener: rescan from the next one inside it
+            self.scanner.rewind(self.scanner.start)
+            self.feed("")
+        _count(self.name, "repaired" if self.repaired else "clean")
+        return self.result
+
+
+_DECODER = json.JSONDecoder()
+
+
+def extract(text: str, model, many=False, name="default"):
+    """First JSON object (or array, many=True) in `text` that validates against `model`, as plain dicts."""
+    ex = StreamExtractor(model, many=many, name=name, stream_items=False)
+    # fast path for the common well-formed reply: decode straight from the first opener, no scanning
+    first = text.find(ex.scanner.opener)
+    if first >= 0:
+        try:
+            ex.result = ex._validate(_DECODER.raw_decode(text, first)[0])
+        except (ValueError, ValidationError):
+            pass
+        else:
+            if EXTRACTOR_RECORD_PATH:
+                _record(name, text)
+            _count(name, "clean")
+            return ex.result
+    ex.feed(text)
+    return ex.close()
+
+
+_record_lock = threading.Lock()
+
+
+def _record(name, text):
+    with _record_lock, open(EXTRACTOR_RECORD_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"name": name, "text": text}, ensure_ascii=False) + "\n")
+
+
+_stats = {}  # name -> {"clean", "repaired", "failed"}
+_stats_lock = threading.Lock()
+
+
+def _count(name, outcome):
+    with _stats_lock:
+        s = _stats.setdefault(name, {"clean": 0, "repaired": 0, "failed": 0})
+        s[outcome] += 1
+
+
+def stats():
+    with _stats_lock:
+        return {name: dict(s) for name, s in _stats.items()}
@@ -0,0 +1,529 @@
+#local stand-in for snowflake.connector, for load tests and benchmarks: the tables live in one SQLite file and
+#SNOWFLAKE.CORTEX.COMPLETE / SENTIMENT are emulated with configurable latency and canned responses
+#select it with SNOWFLAKE_CONNECTOR=fake (see db_pool.py); the SQL the app sends is translated statement by statement,
+#covering exactly the Snowflake dialect this repo uses (PARSE_JSON, FROM VALUES, MERGE, SET/$vars, DATEADD, ...)
+#usage: python fake_snowflake.py --seed-users N [--journals-per-user N] [--path file.sqlite3]
+import os
+import re
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+FAKE_SNOWFLAKE_PATH    = os.getenv("FAKE_SNOWFLAKE_PATH", "fake_snowflake.sqlite3")
+FAKE_CONNECT_LATENCY   = os.getenv("FAKE_CONNECT_LATENCY", "lognormal:300:0.3")   # login, ms
+FAKE_QUERY_LATENCY     = os.getenv("FAKE_QUERY_LATENCY", "lognormal:40:0.4")     # per execute() round trip, ms
+FAKE_COMPLETE_LATENCY  = os.getenv("FAKE_COMPLETE_LATENCY", "lognormal:2000:0.5")
+FAKE_SENTIMENT_LATENCY = os.getenv("FAKE_SENTIMENT_LATENCY", "lognormal:150:0.3")  # per statement, not per row
+FAKE_MODEL_LATENCY     = os.getenv("FAKE_MODEL_LATENCY", "")  # per-model COMPLETE latency: "model=spec,model=spec"
+FAKE_CORTEX_CANNED     = os.getenv("FAKE_CORTEX_CANNED", "")  # json file of [{"match": substring, "response": text}]
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS USER_PROFILES (
+        USER_ID TEXT PRIMARY KEY, GOALS TEXT, WORKOUTS_PER_WEEK INTEGER, AI_EXTRACTED_DATA TEXT,
+        FITNESS_SCORE REAL, WEIGHT_KG REAL, HEIGHT_CM REAL, AGE INTEGER, RESTING_BPM INTEGER,
+        EXPERIENCE_LEVEL INTEGER, CREATED_AT TEXT, BROAD_GOAL TEXT, MODEL_VERSION INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS USER_JOURNALS (
+        USER_ID TEXT, JOURNAL TEXT, SENTIMENT_ANALYSIS REAL, CREATED_AT TEXT)""",
+    "CREATE INDEX IF NOT EXISTS USER_JOURNALS_BY_USER ON USER_JOURNALS (USER_ID, CREATED_AT)",
+]
+
+
+class ProgrammingError(Exception):
+    pass
+
+
+def latency_sampler(spec: str):
+    """'fixed:MS', 'uniform:LO:HI' or 'lognormal:MEDIAN:SIGMA' (all in ms) -> a function returning seconds."""
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: args[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1]) / 1000
+    if kind == "lognormal":
+        mu = math.log(max(args[0], 1e-3))
+        return lambda: random.lognormvariate(mu, args[1]) / 1000
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+_connect_latency   = latency_sampler(FAKE_CONNECT_LATENCY)
+_query_latency     = latency_sampler(FAKE_QUERY_LATENCY)
+_complete_latency  = latency_sampler(FAKE_COMPLETE_LATENCY)
+_sentiment_latency = latency_sampler(FAKE_SENTIMENT_LATENCY)
+_model_latency     = {model: latency_sampler(spec) for model, spec in
+                      (item.split("=", 1) for item in FAKE_MODEL_LATENCY.split(",") if item)}
+
+
+def _load_canned():
+    if not FAKE_CORTEX_CANNED:
+        return []
+    with open(FAKE_CORTEX_CANNED, encoding="utf-8") as f:
+        return json.load(f)
+
+
+_CANNED = _load_canned()
+
+# --- Cortex emulation ---
+
+_POSITIVE = {"great", "good", "strong", "happy", "energized", "proud", "pr", "love", "fun", "rested", "better", "accomplished"}
+_NEGATIVE = {"tired", "bad", "stressed", "sore", "exhausted", "anxious", "sad", "pain", "injured", "awful", "worse", "burnt"}
+
+
+def sentiment(text) -> float:
+    """Deterministic lexicon score in [-1, 1], shaped like CORTEX.SENTIMENT's output."""
+    words = re.findall(r"[a-z]+", str(text or "").lower())
+    pos = sum(w in _POSITIVE for w in words)
+    neg = sum(w in _NEGATIVE for w in words)
+    if pos == neg:
+        # small noise around neutral, stable across processes and runs (str hashes are salted per process)
+        return round((zlib.crc32(str(text).encode()) % 200 - 100) / 1000, 4)
+    return round((pos - neg) / (pos + neg), 4)
+
+
+def _between(text, start, end):
+    i = text.find(start)
+    if i < 0:
+        return None
+    i += len(start)
+    j = text.find(end, i)
+    return text[i:j if j >= 0 else len(text)].strip()
+
+
+def complete_text(prompt: str) -> str:
+    """A plausible reply for each prompt this app sends, recognized by its template text."""
+    for entry in _CANNED:
+        if entry["match"] in prompt:
+            return entry["response"]
+    if "DRAFT SCHEDULE:" in prompt:
+        return _between(prompt, "DRAFT SCHEDULE:", "CRITICAL INSTRUCTIONS") or "[]"
+    if "ONBOARDING STATE" in prompt:
+        #a well-behaved model: the message answers the first missing slot, and the last one completes the profile
+        missing = [s.strip() for s in (_between(prompt, "Slots still needed:", "\n") or "").split(",") if s.strip() != "nothing"]
+        if len(missing) <= 1:
+            goal = _between(prompt, "- broad_goal (Broad goal):", "\n") or "General Fitness"
+            return json.dumps({
+                "broad_goal": goal.replace("My goal is", "").strip() or "General Fitness",
+                "goals": [_between(prompt, "- objectives (Specific fitness objectives):", "\n") or "get fitter"],
+                "workouts_per_week": 3,
+                "ai_extracted_data": {
+                    "schedule": _between(prompt, "- schedule (Preferred workout schedule):", "\n") or "Monday evening",
+                    "injuries": "none",
+                },
+            })
+        message = prompt.rstrip().rsplit("\n", 1)[-1]
+        return json.dumps({"filled": {missing[0]: message},
+                           "reply": f"Thanks! Next, tell me more about: {missing[1].replace('_', ' ')}?"})
+    if "Entry:" in prompt:
+        entry = prompt.rsplit("Entry:", 1)[1].strip()
+        words = set(re.findall(r"[a-z]+", entry.lower()))
+        tags = [tag for tag, keys in (("stress", {"stressed", "stress", "anxious"}), ("low_sleep", {"tired", "sleep", "exhausted"}),
+                                       ("accomplishment", {"pr", "proud", "accomplished"})) if words & keys]
+        return json.dumps({"cleaned_text": entry, "context_tags": tags, "safety_flag": False})
+    if "Sentiment Score:" in prompt:
+        return "Observation: Moderate-recovery state detected. Recommendation: 20 minutes of mobility work and an early night."
+    return "OK"
+
+
+class _Session:
+    #what the Cortex UDFs did during the current statement; the latency is slept once, after it finishes
+    def __init__(self):
+        self.complete_calls = 0
+        self.sentiment_calls = 0
+        self.complete_model = None
+
+    def reset(self):
+        self.complete_calls = self.sentiment_calls = 0
+        self.complete_model = None
+
+
+def _udfs(session):
+    def sf_complete(model, prompt, options=None):
+        session.complete_calls += 1
+        session.complete_model = model
+        if options is None:
+            return complete_text(prompt)
+        messages = json.loads(prompt)
+        text = complete_text("\n".join(m.get("content", "") for m in messages))
+        return json.dumps({"choices": [{"messages": text}], "model": model, "usage": {}})
+
+    def sf_sentiment(text):
+        session.sentiment_calls += 1
+        return sentiment(text)
+
+    def sf_json(value):
+        if value is None:
+            return None
+        try:
+            return json.dumps(json.loads(value))
+        except (TypeError, ValueError):
+            return None
+
+    def sf_object_insert(obj, key, value, overwrite=False):
+        data = json.loads(obj) if obj else {}
+        if key not in data or overwrite:
+            data[key] = value
+        return json.dumps(data)
+
+    def sf_dateadd(unit, n, ts):
+        return (_parse_ts(ts) + timedelta(**{f"{unit.lower()}s": n})).isoformat(sep=" ")
+
+    def sf_epoch(ts):
+        return _parse_ts(ts).timestamp()
+
+    def sf_to_char(ts, fmt):
+        dt = _parse_ts(ts)
+        return dt.strftime({"Dy": "%a", "YYYY-MM-DD": "%Y-%m-%d"}.get(fmt, "%Y-%m-%d %H:%M:%S"))
+
+    return {
+        "SF_CANCEL_QUERY": cancel_query,
+        "SF_COMPLETE": sf_complete, "SF_SENTIMENT": sf_sentiment, "SF_JSON": sf_json,
+        "SF_OBJECT_INSERT": sf_object_insert, "SF_DATEADD": sf_dateadd, "SF_EPOCH": sf_epoch,
+        "SF_TO_CHAR": sf_to_char, "SF_NOW": lambda: datetime.utcnow().isoformat(sep=" "),
+        "CURRENT_VERSION": lambda: "fake-snowflake",
+    }
+
+
+def _parse_ts(ts):
+    if isinstance(ts, datetime):
+        return ts
+    return datetime.fromisoformat(str(ts))
+
+
+# --- SQL translation ---
+
+_REWRITES = [
+    (re.compile(r"SNOWFLAKE\.CORTEX\.COMPLETE\(", re.I), "SF_COMPLETE("),
+    (re.compile(r"SNOWFLAKE\.CORTEX\.SENTIMENT\(", re.I), "SF_SENTIMENT("),
+    (re.compile(r"\b(?:TRY_)?PARSE_JSON\(", re.I), "SF_JSON("),
+    (re.compile(r"\bOBJECT_INSERT\(", re.I), "SF_OBJECT_INSERT("),
+    (re.compile(r"\bOBJECT_CONSTRUCT\(\)", re.I), "'{}'"),
+    (re.compile(r"\bCURRENT_TIMESTAMP\(\)", re.I), "SF_NOW()"),
+    (re.compile(r"\bDATEADD\(\s*(\w+)\s*,", re.I), r"SF_DATEADD('\1',"),
+    (re.compile(r"\bDATE_PART\(\s*EPOCH_SECOND\s*,", re.I), "SF_EPOCH("),
+    (re.compile(r"\bTO_CHAR\(", re.I), "SF_TO_CHAR("),
+    (re.compile(r"\bSYSTEM\$CANCEL_QUERY\(", re.I), "SF_CANCEL_QUERY("),
+    (re.compile(r"\bLEAST\(", re.I), "MIN("),  # sqlite's multi-argument min/max are the scalar forms
+    (re.compile(r"\bGREATEST\(", re.I), "MAX("),
+    (re.compile(r"::\w+"), ""),
+    (re.compile(r"\bFROM\s+VALUES\s+((?:\([^()]*\)\s*,?\s*)+)", re.I), r"FROM (VALUES \1)"),
+    (re.compile(r"%s"), "?"),
+]
+
+_MERGE = re.compile(
+    r"MERGE\s+INTO\s+(?P<table>\w+)\s+(?P<t>\w+)\s+USING\s+(?P<source>\(.*?\))\s+(?P<s>\w+)\s+"
+    r"ON\s+(?P<on>.*?)\s+WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(?P<set>.*?)\s+"
+    r"WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\((?P<cols>[^)]*)\)\s*VALUES\s*\((?P<vals>[^)]*)\)",
+    re.I | re.S,
+)
+_SET_VAR = re.compile(r"^\s*SET\s+(\w+)\s*=\s*(.*)$", re.I | re.S)
+_VAR_REF = re.compile(r"(?<!\w)\$(\w+)")  # not SYSTEM$FUNCTIONS
+_ADD_COLUMN = re.compile(r"^\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\s+(\w+)\s+(\w+)\s*$", re.I)  # sqlite has no IF NOT EXISTS here
+
+
+def _merge_to_upsert(m):
+    #MERGE ... WHEN MATCHED UPDATE / WHEN NOT MATCHED INSERT -> INSERT ... SELECT ... ON CONFLICT DO UPDATE;
+    #relies on the target's primary key matching the ON condition, which holds for every MERGE in this repo
+    t, s = m["t"], m["s"]
+    keys = [c.split(".")[-1].strip() for c in re.findall(rf"\b{t}\.(\w+)\s*=", m["on"])]
+    sets = re.sub(rf"\b{s}\.(\w+)", r"excluded.\1", m["set"])
+    sets = re.sub(rf"\b{t}\.", f"{m['table']}.", sets)
+    vals = re.sub(rf"\b{s}\.", f"{s}.", m["vals"])
+    return (f"INSERT INTO {m['table']} ({m['cols']}) SELECT {vals} FROM {m['source']} {s} WHERE true "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {sets}")
+
+
+def translate(sql: str) -> str:
+    m = _MERGE.search(sql)
+    if m:
+        sql = _merge_to_upsert(m)
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def split_statements(sql: str):
+    """Split on ';' outside quoted strings; empty statements are dropped."""
+    parts, buf, quote = [], [], None
+    for c in sql:
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == ";":
+            parts.append("".join(buf))
+            buf = []
+            continue
+        buf.append(c)
+    parts.append("".join(buf))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# --- DB-API surface ---
+
+class FakeCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._pending = []  # results of the statements after the current one
+        self._rows = []
+        self._pos = 0
+        self.rowcount = -1
+        self.description = None
+        self.sfqid = None
+        self.closed = False
+        self._submitted = {}  # query id -> (sql, params, kwargs) from execute_async
+
+    def execute(self, sql, params=None, num_statements=1, timeout=None, _query_id=None, **kwargs):
+        statements = split_statements(sql)
+        if len(statements) > 1 and num_statements not in (0, len(statements)):
+            raise ProgrammingError(f"expected {num_statements} statements, got {len(statements)}")
+        params = list(params or ())
+        self.sfqid = _query_id or _new_query_id()
+        with self._conn._running(self.sfqid, timeout):
+            self._conn._pause(_query_latency())
+            results = []
+            for statement in statements:
+                n = statement.count("%s")
+                results.append(self._conn._run(statement, params[:n]))
+                params = params[n:]
+        self._pending = results[1:]
+        self._load(results[0])
+        return self
+
+    def execute_async(self, sql, params=None, **kwargs):
+        #submitted, not run: the statement runs when its results are asked for, and can be cancelled before then
+        self.sfqid = _new_query_id()
+        self._submitted[self.sfqid] = (sql, params, kwargs)
+        with _queries_lock:
+            _queries[self.sfqid] = None
+        return {"queryId": self.sfqid}
+
+    def get_results_from_sfqid(self, query_id):
+        sql, params, kwargs = self._submitted.pop(query_id)
+        self.execute(sql, params, _query_id=query_id, **kwargs)
+
+    def executemany(self, sql, seq_of_params):
+        for params in seq_of_params:
+            self.execute(sql, params)
+        return self
+
+    def _load(self, result):
+        self._rows, self.description, self.rowcount = result
+        self._pos = 0
+
+    def nextset(self):
+        if not self._pending:
+            return None
+        self._load(self._pending.pop(0))
+        return self
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+_queries = {}  # running or submitted query id -> its connection (None until it starts), for SYSTEM$CANCEL_QUERY
+_queries_lock = threading.Lock()
+_query_ids = itertools.count(1)
+_session_ids = itertools.count(1)
+
+CANCELED = "000604 (57014): SQL execution canceled"
+
+
+def _new_query_id():
+    return f"01fake-{next(_query_ids):012d}"
+
+
+def cancel_query(query_id):
+    with _queries_lock:
+        if query_id not in _queries:
+            return f"Uncaught exception of type 'STATEMENT_ERROR': Query {query_id} is not running"
+        conn = _queries[query_id]
+        if conn is None:
+            _queries[query_id] = "cancelled"  # submitted but not started: it fails as soon as it starts
+        else:
+            conn._cancel.set()
+    return "Identified SQL statement is being canceled."
+
+
+class FakeConnection:
+    def __init__(self, path=FAKE_SNOWFLAKE_PATH, **config):
+        time.sleep(_connect_latency())
+        self.session_id = next(_session_ids)
+        self._cancel = threading.Event()
+        self._stop_at = None
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._session = _Session()
+        for name, fn in _udfs(self._session).items():
+            self._db.create_function(name, -1, fn)
+        self._vars = {}
+        self._closed = False
+        with _schema_lock:
+            if path not in _schema_ready:
+                for ddl in SCHEMA:
+                    self._db.execute(ddl)
+                _schema_ready.add(path)
+
+    @contextmanager
+    def _running(self, query_id, timeout):
+        with _queries_lock:
+            cancelled = _queries.get(query_id) == "cancelled"
+            _queries[query_id] = self
+        self._cancel.clear()
+        self._stop_at = None if timeout is None else time.monotonic() + timeout
+        try:
+            if cancelled:
+                raise ProgrammingError(CANCELED)
+            yield
+        finally:
+            with _queries_lock:
+                _queries.pop(query_id, None)
+            self._stop_at = None
+
+    def _pause(self, seconds):
+        #latency that SYSTEM$CANCEL_QUERY or the statement timeout can cut short, as on a warehouse
+        limit = seconds if self._stop_at is None else min(seconds, max(0.0, self._stop_at - time.monotonic()))
+        if self._cancel.wait(limit) or limit < seconds:
+            raise ProgrammingError(CANCELED)
+
+    def _run(self, statement, params):
+        """(rows, description, rowcount) for one Snowflake statement."""
+        m = _SET_VAR.match(statement)
+        if m:
+            value = self._run(f"SELECT {m[2]}", params)[0][0][0]
+            self._vars[m[1].upper()] = value
+            return [("Statement executed successfully.",)], [("status",)], 1
+        statement = _VAR_REF.sub(lambda v: _literal(self._vars.get(v[1].upper())), statement)
+        if statement.upper() == "ROLLBACK" and not self._db.in_transaction:
+            return [], None, 0
+        m = _ADD_COLUMN.match(statement)
+        if m:
+            columns = {row[1].upper() for row in self._db.execute(f"PRAGMA table_info({m[1]})")}
+            if m[2].upper() not in columns:
+                self._db.execute(f"ALTER TABLE {m[1]} ADD COLUMN {m[2]} {m[3]}")
+            return [("Statement executed successfully.",)], [("status",)], 1
+        self._session.reset()
+        cur = self._db.execute(translate(statement), params)
+        rows = cur.fetchall()
+        # Cortex functions answer instantly here; pay their latency once per statement, like a warehouse would
+        if self._session.complete_calls:
+            self._pause(_model_latency.get(self._session.complete_model, _complete_latency)())
+        if self._session.sentiment_calls:
+            self._pause(_sentiment_latency())
+        description = [(d[0],) for d in cur.description] if cur.description else None
+        return rows, description, cur.rowcount
+
+    def cursor(self):
+        if self._closed:
+            raise ProgrammingError("connection is closed")
+        return FakeCursor(self)
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._db.execute("COMMIT")
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._db.close()
+
+
+def connect(**config):
+    """Drop-in for snowflake.connector.connect; account/user/... are accepted and ignored."""
+    return FakeConnection(config.pop("path", FAKE_SNOWFLAKE_PATH))
+
+
+_GOALS = ["Building Muscle", "Weight Loss", "Endurance", "Flexibility", "General Fitness"]
+_ENTRIES = [
+    "Great session today, felt strong and proud of the new PR.",
+    "Tired and sore after leg day, slept badly.",
+    "Stressed at work but the run helped a bit.",
+    "Rested and energized, yoga was fun.",
+    "Exhausted, skipped the workout, feeling worse.",
+]
+
+
+def seed(path=FAKE_SNOWFLAKE_PATH, users=1000, journals_per_user=20, rng_seed=1):
+    """Fill USER_PROFILES / USER_JOURNALS with synthetic users user_000000... (no latency); returns the ids."""
+    rng = random.Random(rng_seed)
+    db = sqlite3.connect(path, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    for ddl in SCHEMA:
+        db.execute(ddl)
+    now = datetime.utcnow()
+    ids = [f"user_{i:06d}" for i in range(users)]
+    db.execute("BEGIN")
+    db.executemany(
+        "INSERT OR REPLACE INTO USER_PROFILES VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+        [(uid, json.dumps(["get stronger", "run a 10k"]), rng.randint(2, 6),
+          json.dumps({"schedule": rng.choice(["Monday evening, Wednesday evening, Friday morning",
+                                              "Saturday morning, Sunday morning", "Tuesday evening, Thursday evening"]),
+                      "injuries": "none"}),
+          round(rng.random(), 2), rng.uniform(55, 110), rng.uniform(155, 195), rng.randint(18, 65),
+          rng.randint(50, 85), rng.randint(0, 2), now.isoformat(sep=" "), rng.choice(_GOALS))
+         for uid in ids],
+    )
+    journals = []
+    for uid in ids:
+        for _ in range(journals_per_user):
+            text = rng.choice(_ENTRIES)
+            at = now - timedelta(minutes=rng.randrange(90 * 24 * 60))
+            journals.append((uid, text, sentiment(text), at.isoformat(sep=" ")))
+    db.executemany("INSERT INTO USER_JOURNALS VALUES (?, ?, ?, ?)", journals)
+    db.execute("COMMIT")
+    db.close()
+    return ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the local Snowflake stand-in")
+    parser.add_argument("--path", default=FAKE_SNOWFLAKE_PATH)
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--journals-per-user", type=int, default=20)
+    args = parser.parse_args()
+    seed(args.path, args.seed_users, args.journals_per_user)
+    print(json.dumps({"path": args.path, "users": args.seed_users, "journals": args.seed_users * args.journals_per_user}))
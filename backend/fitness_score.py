@@ -1,37 +1,225 @@
 #kaggle exercise training set is used for fitness score calculation via logistic regression
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
-import pandas as pd
-import joblib
-
-#read csv
-data = pd.read_csv('gym_members_exercise_tracking.csv')
+#usage: python fitness_score.py              train on the csv, save the pickles and the compact .npz export
+#       python fitness_score.py --export-only   re-export fitness_model.npz from the existing pickles
+#       python fitness_score.py --update-csv new_rows.csv
+#                                               incremental update of the live version on newly labelled rows
+#                                               (same columns as the training csv), published as the next version
+#       python fitness_score.py --migrate       add USER_PROFILES.MODEL_VERSION (which version scored each row);
+#                                               main.py also runs it on startup
+#USER_PROFILES is not a label source: its EXPERIENCE_LEVEL is this model's own prediction, so training on it would
+#only reinforce the model's mistakes
+#every training path publishes a versioned export into FITNESS_MODEL_DIR; running servers pick it up (see scoring.py)
+import os
+import sys
+import time
+import numpy as np
 
 #drop irrelevant columns, only retaining age, height, weight, bmi, resting_bpm, max_heart_rate
 features = ['Age', 'Weight (kg)', 'Height (m)', 'Resting_BPM', 'Max_BPM', 'Workout_Frequency (days/week)', 'BMI']
 
-#target variable - experience level
-y = (data['Experience_Level'] == 3).astype(int) #3 for expert, 2 for intermediate, 1 for beginner
-X = data[features]
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+def train():
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import accuracy_score
+    import pandas as pd
+    import joblib
+
+    #read csv
+    data = pd.read_csv('gym_members_exercise_tracking.csv')
+
+    #target variable - experience level
+    y = (data['Experience_Level'] == 3).astype(int) #3 for expert, 2 for intermediate, 1 for beginner
+    X = data[features]
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    model = LogisticRegression()
+    model.fit(X_train_scaled, y_train)
+
+    #evaluation
+    y_pred = model.predict(X_test_scaled)
+    y_prob = model.predict_proba(X_test_scaled)[:, 1]
+
+    print(f"Accuracy: {accuracy_score(y_test, y_pred):.2f}")
+
+    #save pickle files
+    joblib.dump(model, 'fitness_model.pkl')
+    joblib.dump(scaler, 'scaler.pkl')
+    print("Model and Scaler saved.")
+    return model, scaler
+
+
+def params_from(model, scaler):
+    """Everything scoring.py needs to evaluate the model with plain NumPy."""
+    return {
+        "mean":      np.asarray(scaler.mean_, dtype=float),
+        "scale":     np.asarray(scaler.scale_, dtype=float),
+        "coef":      np.asarray(model.coef_, dtype=float).ravel(),
+        "intercept": float(np.asarray(model.intercept_).ravel()[0]),
+    }
+
+
+def load_pickled_params(model_path='fitness_model.pkl', scaler_path='scaler.pkl'):
+    import joblib
+    return params_from(joblib.load(model_path), joblib.load(scaler_path))
+
+
+def export_npz(params, path='fitness_model.npz'):
+    np.savez(path, features=np.array(features), **params)
+    print(f"Compact model exported to {path}.")
+
+
+# --- versioned exports ---
+
+MODEL_DIR = os.getenv("FITNESS_MODEL_DIR", "fitness_models")
+BASELINE_ROWS = 973  # rows in the kaggle csv: the weight the first incremental update gives the baseline scaler
+
+def _atomic_write(path, write):
+    #write to a temp name and rename over the target, so readers see the old file or the new one, never a partial one
+    tmp = f"{path}.{os.getpid()}.tmp{os.path.splitext(path)[1]}"  # np.savez insists on the .npz suffix
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _write_text(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def load_live(model_dir=MODEL_DIR):
+    """The version CURRENT points at (or the unversioned baseline export) with its incremental-training state."""
+    from scoring import read_params, current_artifact, MODEL_PATH
+    name = current_artifact(model_dir)
+    path = os.path.join(model_dir, name) if name else MODEL_PATH
+    if not os.path.exists(path):
+        params, extra = dict(load_pickled_params(), version=0), {}
+    else:
+        params = read_params(path)
+        with np.load(path) as npz:
+            extra = {k: npz[k] for k in ("n_seen", "m2") if k in npz}
+    n_seen = int(extra.get("n_seen", BASELINE_ROWS))
+    return {
+        **{k: params[k] for k in ("mean", "scale", "coef", "intercept", "version")},
+        "n_seen": n_seen,
+        "m2": extra.get("m2", params["scale"] ** 2 * n_seen),
+    }
+
+
+def publish(params, model_dir=MODEL_DIR, **meta):
+    """Write params as the next version and point CURRENT at it; returns the new version number."""
+    os.makedirs(model_dir, exist_ok=True)
+    existing = [int(f[1:7]) for f in os.listdir(model_dir) if f.startswith("v") and f.endswith(".npz") and f[1:7].isdigit()]
+    version = max(existing + [int(params.get("version", 0))]) + 1
+    name = f"v{version:06d}.npz"
+    payload = {k: v for k, v in params.items() if k not in ("version", "artifact", "loaded_at")}
+    payload.update(meta, version=version, parent=int(params.get("version", 0)), published_at=time.time())
+    _atomic_write(os.path.join(model_dir, name), lambda tmp: np.savez(tmp, features=np.array(features), **payload))
+    _atomic_write(os.path.join(model_dir, "CURRENT"), lambda tmp: _write_text(tmp, name + "\n"))
+    print(f"Published fitness model v{version} to {os.path.join(model_dir, name)}.")
+    return version
+
+
+# --- incremental updates ---
+
+def partial_fit(state, X, y, epochs=3, learning_rate=0.5, batch_size=8192, C=1.0, seed=0):
+    """One incremental update of the L2 logistic regression on a chunk of new rows (X raw features, y in {0,1}).
+    The running scaler statistics are merged first and the weights re-expressed in the new scaling, so the model's
+    predictions are unchanged until the gradient steps on the new rows move them. Returns the new state."""
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n_a, mean_a, m2_a = state["n_seen"], state["mean"], state["m2"]
+    n_b = len(X)
+    if n_b == 0:
+        return dict(state)
+
+    #Chan et al. parallel merge of (count, mean, sum of squared deviations)
+    mean_b = X.mean(axis=0)
+    m2_b = ((X - mean_b) ** 2).sum(axis=0)
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * n_b / n
+    m2 = m2_a + m2_b + delta ** 2 * n_a * n_b / n
+    scale = np.sqrt(m2 / n)
+    scale[scale == 0] = 1.0
+
+    #same decision function under the new scaler: w_raw = coef / scale_old, then back into the new standardized space
+    w_raw = state["coef"] / state["scale"]
+    b_raw = float(state["intercept"]) - float(w_raw @ state["mean"])
+    coef = w_raw * scale
+    intercept = b_raw + float(w_raw @ mean)
+
+    #mini-batch gradient descent on the new rows; lambda = 1/(C n) matches sklearn's C for the rows seen so far
+    Z = (X - mean) / scale
+    l2 = 1.0 / (C * n)
+    rng = np.random.default_rng(seed)
+    step = 0
+    for _ in range(epochs):
+        order = rng.permutation(n_b)
+        for start in range(0, n_b, batch_size):
+            idx = order[start:start + batch_size]
+            zb, yb = Z[idx], y[idx]
+            err = 1.0 / (1.0 + np.exp(-(zb @ coef + intercept))) - yb
+            lr = learning_rate / np.sqrt(1 + step)
+            coef = coef - lr * (zb.T @ err / len(idx) + l2 * coef)
+            intercept = intercept - lr * float(err.mean())
+            step += 1
+    return {**state, "mean": mean, "scale": scale, "coef": coef, "intercept": intercept, "n_seen": n, "m2": m2}
+
+
+def _xy_from_csv(path):
+    import pandas as pd
+    data = pd.read_csv(path)
+    return data[features].to_numpy(dtype=float), (data['Experience_Level'] == 3).astype(int).to_numpy()
+
+
+MIGRATION_SQL = "ALTER TABLE USER_PROFILES ADD COLUMN IF NOT EXISTS MODEL_VERSION NUMBER"
+
 
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
+def migrate():
+    from db_pool import get_conn
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(MIGRATION_SQL)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    print("USER_PROFILES.MODEL_VERSION is in place.")
 
-model = LogisticRegression()
-model.fit(X_train_scaled, y_train)
 
-#evaluation
-y_pred = model.predict(X_test_scaled)
-y_prob = model.predict_proba(X_test_scaled)[:, 1]
+def update(chunks, model_dir=MODEL_DIR):
+    """Fold chunks of (X, y) into the live version and publish the result as the next version."""
+    state = load_live(model_dir)
+    rows, started = 0, time.perf_counter()
+    for X, y in chunks:
+        state = partial_fit(state, X, y)
+        rows += len(X)
+    if rows == 0:
+        print("No new rows; nothing published.")
+        return None
+    print(f"Updated on {rows} rows in {time.perf_counter() - started:.2f}s.")
+    return publish(state, model_dir, rows_in_update=rows)
 
-print(f"Accuracy: {accuracy_score(y_test, y_pred):.2f}")
 
-#save pickle files
-joblib.dump(model, 'fitness_model.pkl')
-joblib.dump(scaler, 'scaler.pkl')
-print("Model and Scaler saved.")
\ No newline at end of file
+if __name__ == "__main__":
+    if "--migrate" in sys.argv:
+        migrate()
+    elif "--update-csv" in sys.argv:
+        X, y = _xy_from_csv(sys.argv[sys.argv.index("--update-csv") + 1])
+        update([(X, y)])
+    else:
+        if "--export-only" in sys.argv:
+            params = load_pickled_params()
+        else:
+            params = params_from(*train())
+        export_npz(params)
+        #a full retrain restarts the incremental lineage from the training set
+        publish({**params, "version": load_live()["version"], "n_seen": BASELINE_ROWS,
+                 "m2": params["scale"] ** 2 * BASELINE_ROWS})
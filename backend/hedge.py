@@ -0,0 +1,144 @@
+#hedged Cortex completions: when the primary model hasn't answered within CORTEX_HEDGE_AFTER seconds, the same prompt is
+#also sent to CORTEX_HEDGE_MODEL (smaller and faster); the first good answer wins and the other query is cancelled
+#each attempt holds its own admission slot: the primary queues for one like any call, the hedge is only sent if a slot
+#is free right now, so hedging never exceeds CORTEX_MAX_CONCURRENCY and never queues behind the calls it works around
+#a cancelled loser keeps its slot until its worker thread returns (once its query is cancelled), so the admission count
+#matches the COMPLETEs really in flight
+import os
+import time
+import asyncio
+import threading
+
+import deadline
+from admission import admission as default_admission
+from deadline import Deadline
+
+CORTEX_HEDGE_AFTER = float(os.getenv("CORTEX_HEDGE_AFTER", "0"))  # seconds before the fallback is launched; 0 disables
+CORTEX_HEDGE_MODEL = os.getenv("CORTEX_HEDGE_MODEL", "llama3.1-8b")
+CORTEX_HEDGE_KINDS = tuple(k for k in os.getenv("CORTEX_HEDGE_KINDS", "onboard,journal_observation,schedule").split(",") if k)
+
+
+def _retrieve(task):
+    #a cancelled loser finishes on its own later; its error is expected and not worth a "never retrieved" warning
+    if not task.cancelled():
+        task.exception()
+
+
+class _Attempt:
+    #one model's call as its own task, under a child deadline so the loser's query can be cancelled on its own
+    def __init__(self, attempt, model, admitted):
+        parent = deadline.current()
+        self.model = model
+        self.admitted = admitted  # set once the attempt holds its admission slot
+        self.deadline = Deadline(parent=parent) if parent is not None else Deadline()
+        self.task = asyncio.ensure_future(self._run(attempt))
+        self.task.add_done_callback(_retrieve)
+
+    async def _run(self, attempt):
+        deadline.set_current(self.deadline)  # this task's own context
+        try:
+            return await attempt(self.model)
+        finally:
+            self.deadline.close()
+
+    def cancel(self):
+        self.deadline.cancel("hedge_lost")  # kills the running query
+        if not self.admitted.is_set():
+            self.task.cancel()  # still queued for admission, nothing is running yet
+        # otherwise the task ends (and gives back its slot) when its worker thread returns
+
+
+class Hedger:
+    def __init__(self, after=CORTEX_HEDGE_AFTER, model=CORTEX_HEDGE_MODEL, kinds=CORTEX_HEDGE_KINDS,
+                 admission=default_admission):
+        self.after = after
+        self.model = model
+        self.kinds = set(kinds)
+        self.admission = admission
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "hedged": 0, "no_capacity": 0, "primary_wins": 0, "fallback_wins": 0,
+                       "both_failed": 0, "losers_cancelled": 0}
+
+    def _bump(self, field):
+        with self._lock:
+            self._stats[field] += 1
+
+    def applies(self, kind, primary_model):
+        return self.after > 0 and kind in self.kinds and bool(self.model) and self.model != primary_model
+
+    async def run(self, kind: str, primary_model: str, attempt, key=None):
+        """await attempt(model) under an admission slot (rate-limited per `key`), hedged onto the fallback model
+        for the kinds the policy covers."""
+        if not self.applies(kind, primary_model):
+            async with self.admission.slot(kind, key):
+                return await attempt(primary_model)
+        self._bump("calls")
+        admitted = asyncio.Event()
+
+        async def primary_attempt(model):
+            async with self.admission.slot(kind, key):
+                admitted.set()
+                return await attempt(model)
+
+        async def hedge_attempt(model):
+            # the slot was taken by try_acquire before this task started
+            started = time.monotonic()
+            try:
+                return await attempt(model)
+            finally:
+                self.admission.release(time.monotonic() - started)
+
+        primary = _Attempt(primary_attempt, primary_model, admitted)
+        attempts = [primary]
+        try:
+            # the threshold runs from admission: time spent queueing isn't Cortex being slow
+            waiter = asyncio.ensure_future(admitted.wait())
+            try:
+                await asyncio.wait({primary.task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            done, _ = await asyncio.wait({primary.task}, timeout=self.after)
+            if not done:
+                if self.admission.try_acquire():
+                    hedge_admitted = asyncio.Event()
+                    hedge_admitted.set()
+                    attempts.append(_Attempt(hedge_attempt, self.model, hedge_admitted))
+                    self._bump("hedged")
+                else:
+                    self._bump("no_capacity")
+            winner, error = None, None
+            pending = {a.task for a in attempts}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = winner or task
+                    else:
+                        error = error or task.exception()
+        finally:
+            for a in attempts:
+                if not a.task.done():
+                    a.cancel()
+                    self._bump("losers_cancelled")
+        if winner is None:
+            if len(attempts) > 1:
+                self._bump("both_failed")
+            raise error
+        self._bump("primary_wins" if winner is primary.task else "fallback_wins")
+        return winner.result()
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        decided = s["primary_wins"] + s["fallback_wins"]
+        return {
+            "after_s": self.after,
+            "model": self.model,
+            "kinds": sorted(self.kinds),
+            **s,
+            "hedge_rate": round(s["hedged"] / s["calls"], 4) if s["calls"] else 0.0,
+            "fallback_win_rate": round(s["fallback_wins"] / decided, 4) if decided else 0.0,
+        }
+
+
+hedger = Hedger()
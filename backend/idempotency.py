@@ -0,0 +1,119 @@
+#Idempotency-Key support for expensive POSTs: the first request with a key runs, a retry gets its stored result back,
+#and a duplicate that arrives while the first is still running awaits that same task instead of redoing the work
+#results live in a bounded in-process LRU with a TTL; failures (exceptions or {"status": "error"} bodies) aren't kept,
+#so the client's retry runs again
+import os
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+from deadline import detach
+
+IDEMPOTENCY_TTL      = float(os.getenv("IDEMPOTENCY_TTL", "86400"))   # seconds a stored result is replayed
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_WAIT     = float(os.getenv("IDEMPOTENCY_WAIT", "120"))    # seconds a duplicate waits for the original
+IDEMPOTENCY_KEY_MAX  = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+
+def fingerprint(payload) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+
+def _failed(result):
+    return isinstance(result, dict) and result.get("status") == "error"
+
+
+class IdempotencyStore:
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_keys=IDEMPOTENCY_MAX_KEYS, wait=IDEMPOTENCY_WAIT, clock=time.time):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.wait = wait
+        self._clock = clock
+        self._results = OrderedDict()  # (endpoint, key) -> (fingerprint, result, expires_at), most recent at the right
+        self._lock = threading.Lock()
+        self._flights = {}             # (endpoint, key) -> (fingerprint, asyncio.Task); event loop only
+        self._stats = {}               # endpoint -> counters
+
+    def _bump(self, endpoint, outcome):
+        s = self._stats.setdefault(endpoint, {"executed": 0, "replayed": 0, "joined": 0, "conflicts": 0})
+        s[outcome] += 1
+        metrics.IDEMPOTENT_REQUESTS.inc(endpoint, outcome)
+
+    def _stored(self, slot, now):
+        with self._lock:
+            entry = self._results.get(slot)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                del self._results[slot]
+                return None
+            self._results.move_to_end(slot)
+            return entry
+
+    def _store(self, slot, print_, result):
+        with self._lock:
+            self._results[slot] = (print_, copy.deepcopy(result), self._clock() + self.ttl)
+            self._results.move_to_end(slot)
+            while len(self._results) > self.max_keys:
+                self._results.popitem(last=False)
+
+    async def run(self, endpoint: str, key: str, payload, fn):
+        """(result, replayed) for fn() (a coroutine function) under `key`. Raises IdempotencyConflict if the key was
+        used with another payload, asyncio.TimeoutError if the original is still running after `wait` seconds."""
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX:
+            raise ValueError(f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX} characters")
+        slot, print_ = (endpoint, key), fingerprint(payload)
+
+        entry = self._stored(slot, self._clock())
+        if entry is not None:
+            if entry[0] != print_:
+                self._bump(endpoint, "conflicts")
+                raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+            self._bump(endpoint, "replayed")
+            return entry[1], True
+
+        flight = self._flights.get(slot)
+        if flight is not None:
+            if flight[0] != print_:
+                self._bump(endpoint, "conflicts")
+                raise IdempotencyConflict("Idempotency-Key is in use by a different request")
+            self._bump(endpoint, "joined")
+            # shield: a duplicate giving up must not cancel the original
+            return await asyncio.wait_for(asyncio.shield(flight[1]), self.wait), True
+
+        task = asyncio.ensure_future(detach(fn))
+        self._flights[slot] = (print_, task)
+        task.add_done_callback(lambda t: self._landed(slot, print_, t))
+        self._bump(endpoint, "executed")
+        return await asyncio.shield(task), False
+
+    def _landed(self, slot, print_, task):
+        if self._flights.get(slot, (None, None))[1] is task:
+            del self._flights[slot]
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if not _failed(result):
+            self._store(slot, print_, result)
+
+    def stats(self):
+        with self._lock:
+            stored = len(self._results)
+        out = {"stored": stored, "max_keys": self.max_keys, "ttl": self.ttl, "in_flight": len(self._flights)}
+        for endpoint, s in self._stats.items():
+            total = sum(s.values())
+            out[endpoint] = {**s, "hit_rate": round((s["replayed"] + s["joined"]) / total, 4) if total else 0.0}
+        return out
+
+
+idempotency = IdempotencyStore()
@@ -0,0 +1,65 @@
+#in-process registry for work that finishes after the HTTP response has been sent; clients poll GET /jobs/{job_id}
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+
+from deadline import background_context
+
+JOB_TTL      = float(os.getenv("JOB_TTL", "900"))   # seconds a finished result stays pollable
+JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "10000"))
+
+
+class JobRegistry:
+    def __init__(self, ttl=JOB_TTL, max_jobs=JOB_MAX_JOBS):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # job_id -> state dict, oldest first
+        self._tasks = {}            # job_id -> asyncio.Task, held so pending tasks aren't garbage collected
+
+    def submit(self, kind: str, coro) -> str:
+        """Schedule `coro` on the running loop and return the id to poll."""
+        self._evict(time.time())
+        job_id = f"{kind}_{uuid.uuid4().hex[:12]}"
+        self._jobs[job_id] = {"job_id": job_id, "kind": kind, "status": "pending", "submitted_at": time.time()}
+        # the job outlives the request, so it must not inherit the request's deadline
+        task = asyncio.get_running_loop().create_task(coro, context=background_context())
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda t, job_id=job_id: self._finish(job_id, t))
+        return job_id
+
+    def _finish(self, job_id, task):
+        self._tasks.pop(job_id, None)
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job["finished_at"] = time.time()
+        if task.cancelled():
+            job["status"] = "cancelled"
+        elif task.exception() is not None:
+            job["status"] = "error"
+            job["error"] = str(task.exception())
+        else:
+            job["status"] = "done"
+            job["result"] = task.result()
+
+    def _evict(self, now):
+        #expired finished jobs first, then the oldest finished ones if we are still over the cap
+        for job_id in [j for j, s in self._jobs.items() if s.get("finished_at", now) < now - self.ttl]:
+            del self._jobs[job_id]
+        if len(self._jobs) >= self.max_jobs:
+            for job_id in [j for j, s in self._jobs.items() if "finished_at" in s][:len(self._jobs) - self.max_jobs + 1]:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        counts = {}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"tracked": len(self._jobs), **counts}
+
+
+jobs = JobRegistry()
@@ -0,0 +1,309 @@
+#queued journal ingestion: entries land in a local sqlite queue and a background worker drains it in micro-batches,
+#scoring each batch with one CORTEX.SENTIMENT statement over a VALUES list and storing it with one multi-row INSERT
+#entries go through the same JOURNAL_INPUT_PROMPT clean-up and safety check as /journal (one COMPLETE statement per
+#batch) before they are stored; the safety flag and tags are reported on the entry's status
+#a durable queue file is shared by every uvicorn worker: batches are claimed atomically under a per-worker lease
+import os
+import time
+import uuid
+import sqlite3
+import json
+import asyncio
+import threading
+
+import metrics
+from admission import admission, AdmissionRejected
+from data_structure import JournalClean
+from db_pool import get_conn
+from executor import run_blocking
+from extractor import extract, ExtractionError
+from system_prompts import JOURNAL_INPUT_PROMPT
+
+JOURNAL_QUEUE_PATH     = os.getenv("JOURNAL_QUEUE_PATH", "")          # sqlite file; empty keeps the queue in memory
+JOURNAL_FLUSH_SIZE     = int(os.getenv("JOURNAL_FLUSH_SIZE", "100"))   # entries per batch
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "2"))  # max seconds an entry waits for a batch
+JOURNAL_QUEUE_MAX      = int(os.getenv("JOURNAL_QUEUE_MAX", "5000"))   # pending entries before enqueue is refused
+JOURNAL_MAX_ATTEMPTS   = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "5"))
+JOURNAL_STATUS_TTL     = float(os.getenv("JOURNAL_STATUS_TTL", "86400"))  # seconds a stored / failed entry stays pollable
+JOURNAL_LEASE          = float(os.getenv("JOURNAL_LEASE", "300"))      # seconds a claimed batch is left to its worker
+
+
+class QueueFull(Exception):
+    pass
+
+
+def clean_batch(cur, batch, model):
+    """batch: [(journal_id, user_id, text)] -> ({journal_id: JournalClean dict}, {journal_id: error}); one statement."""
+    values = ", ".join(["(%s, %s)"] * len(batch))
+    with metrics.scope("journal_clean"):
+        cur.execute(f"""
+            SELECT column1, SNOWFLAKE.CORTEX.COMPLETE(%s, %s || column2)
+            FROM VALUES {values}
+        """, (model, f"{JOURNAL_INPUT_PROMPT}\n\nEntry: ",
+              *(v for journal_id, _, text in batch for v in (journal_id, text))))
+        replies = dict(cur.fetchall())
+    cleaned, rejected = {}, {}
+    for journal_id, _, _ in batch:
+        try:
+            cleaned[journal_id] = extract(replies.get(journal_id) or "", JournalClean, name="journal_clean")
+        except ExtractionError:
+            rejected[journal_id] = "Journal parsing error"
+    return cleaned, rejected
+
+
+def score_and_insert(batch, model):
+    """batch: [(journal_id, user_id, text)] -> ({journal_id: (score, cleaned)}, {journal_id: error}); model cleans the entries.
+    Three statements per batch: clean-up, sentiment of the cleaned texts, one INSERT of the entries that passed."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cleaned, rejected = clean_batch(cur, batch, model)
+        passed = [(journal_id, user_id, cleaned[journal_id]["cleaned_text"])
+                  for journal_id, user_id, _ in batch if journal_id in cleaned]
+        if not passed:
+            return {}, rejected
+        values = ", ".join(["(%s, %s, %s)"] * len(passed))
+        params = tuple(v for entry in passed for v in entry)
+        with metrics.scope("sentiment"):
+            cur.execute(f"""
+                SELECT column1, SNOWFLAKE.CORTEX.SENTIMENT(column3)
+                FROM VALUES {values}
+            """, params)
+            scores = {r[0]: r[1] for r in cur.fetchall()}
+
+        # CURRENT_TIMESTAMP() is fixed for the statement; a microsecond apart keeps (USER_ID, CREATED_AT) unique
+        # when one user has several entries in the batch, since exports page and the reconciler match on that key
+        rows = ", ".join(["(%s, %s, %s, DATEADD(microsecond, %s, CURRENT_TIMESTAMP()))"] * len(passed))
+        cur.execute(
+            f"INSERT INTO USER_JOURNALS (USER_ID, JOURNAL, SENTIMENT_ANALYSIS, CREATED_AT) VALUES {rows}",
+            tuple(v for i, (journal_id, user_id, text) in enumerate(passed) for v in (user_id, text, scores[journal_id], i)),
+        )
+        conn.commit()
+        return {journal_id: (scores[journal_id], cleaned[journal_id]) for journal_id, _, _ in passed}, rejected
+    finally:
+        cur.close()
+        conn.close()
+
+
+class JournalQueue:
+    def __init__(self, path=JOURNAL_QUEUE_PATH, flush_size=JOURNAL_FLUSH_SIZE, flush_interval=JOURNAL_FLUSH_INTERVAL,
+                 max_pending=JOURNAL_QUEUE_MAX, max_attempts=JOURNAL_MAX_ATTEMPTS, status_ttl=JOURNAL_STATUS_TTL,
+                 lease=JOURNAL_LEASE, sink=score_and_insert):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.status_ttl = status_ttl
+        self.lease = lease
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # this worker's claim on the batches it flushes
+        self.durable = bool(path)
+        self._sink = sink
+        self.model = None  # the Cortex model entries are cleaned with; main.py sets its CORTEX_MODEL
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS journal_queue (
+                journal_id TEXT PRIMARY KEY, user_id TEXT, text TEXT, status TEXT,
+                score REAL, error TEXT, attempts INTEGER DEFAULT 0, enqueued_at REAL, updated_at REAL
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(journal_queue)")}
+        for column, kind in (("safety_flag", "INTEGER"), ("context_tags", "TEXT"), ("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:  # queue files written before the clean-up step / batch leases
+                self._db.execute(f"ALTER TABLE journal_queue ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS journal_queue_status ON journal_queue (status, enqueued_at)")
+        #a batch whose worker died is retried once its lease runs out; batches other live workers hold are left alone
+        self._db.execute(
+            "UPDATE journal_queue SET status = 'queued', owner = NULL WHERE status = 'flushing' AND (lease_until IS NULL OR lease_until < ?)",
+            (time.time(),),
+        )
+        self._db.commit()
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+        self._stopping = False
+        self.on_stored = []  # callbacks([(user_id, score)]) run after each stored batch, e.g. cache invalidation
+        self._stats = {"enqueued": 0, "rejected": 0, "stored": 0, "flagged": 0, "unparsed": 0, "failed": 0,
+                       "batches": 0, "batch_errors": 0, "deferred": 0}
+
+    # --- producer side ---
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM journal_queue WHERE status IN ('queued', 'flushing')").fetchone()[0]
+
+    def enqueue(self, user_id: str, text: str) -> str:
+        journal_id = "jrnl_" + uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            pending = self._db.execute("SELECT COUNT(*) FROM journal_queue WHERE status IN ('queued', 'flushing')").fetchone()[0]
+            if pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise QueueFull(f"{pending} journal entries already queued")
+            self._db.execute(
+                "INSERT INTO journal_queue (journal_id, user_id, text, status, enqueued_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (journal_id, user_id, text, now, now),
+            )
+            self._db.commit()
+            self._stats["enqueued"] += 1
+            pending += 1
+        if pending >= self.flush_size and self._wakeup is not None:
+            # enqueue runs on an executor thread; Event isn't thread-safe
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return journal_id
+
+    def status(self, journal_id: str):
+        with self._lock:
+            row = self._db.execute(
+                """SELECT journal_id, user_id, status, score, safety_flag, context_tags, error, attempts, enqueued_at, updated_at
+                   FROM journal_queue WHERE journal_id = ?""",
+                (journal_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("journal_id", "user_id", "status", "score", "safety_flag", "tags", "error", "attempts", "enqueued_at", "updated_at")
+        status = dict(zip(keys, row))
+        status["safety_flag"] = None if status["safety_flag"] is None else bool(status["safety_flag"])
+        status["tags"] = json.loads(status["tags"]) if status["tags"] else None
+        return status
+
+    # --- worker side ---
+
+    def _take_batch(self):
+        #one UPDATE ... RETURNING, so two workers sharing the queue file can never claim the same entry;
+        #entries left 'flushing' by a worker whose lease ran out are claimed again
+        now = time.time()
+        with self._lock:
+            batch = self._db.execute(
+                """UPDATE journal_queue SET status = 'flushing', owner = ?, lease_until = ?
+                   WHERE journal_id IN (
+                       SELECT journal_id FROM journal_queue
+                       WHERE status = 'queued' OR (status = 'flushing' AND lease_until < ?)
+                       ORDER BY enqueued_at LIMIT ?
+                   )
+                   RETURNING journal_id, user_id, text""",
+                (self.owner, now + self.lease, now, self.flush_size),
+            ).fetchall()
+            self._db.commit()
+            return batch
+
+    def _mark_stored(self, stored):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                """UPDATE journal_queue SET status = 'stored', score = ?, safety_flag = ?, context_tags = ?, text = NULL,
+                   error = NULL, updated_at = ? WHERE journal_id = ?""",
+                [(score, int(cleaned["safety_flag"]), json.dumps(cleaned["context_tags"]), now, journal_id)
+                 for journal_id, (score, cleaned) in stored.items()],
+            )
+            self._db.commit()
+            self._stats["stored"] += len(stored)
+            self._stats["flagged"] += sum(cleaned["safety_flag"] for _, cleaned in stored.values())
+
+    def _requeue(self, batch):
+        #nothing ran (Cortex was busy), so the attempt isn't counted
+        with self._lock:
+            self._db.executemany(
+                "UPDATE journal_queue SET status = 'queued', owner = NULL WHERE journal_id = ? AND owner = ?",
+                [(journal_id, self.owner) for journal_id, _, _ in batch],
+            )
+            self._db.commit()
+
+    def _mark_failed_attempt(self, batch, error):
+        now = time.time()
+        ids = [journal_id for journal_id, _, _ in batch]
+        marks = ", ".join("?" * len(ids))
+        with self._lock:
+            self._db.execute(
+                f"""UPDATE journal_queue SET attempts = attempts + 1, error = ?, updated_at = ?, owner = NULL,
+                    status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'queued' END
+                    WHERE owner = ? AND journal_id IN ({marks})""",
+                (error, now, self.max_attempts, self.owner, *ids),
+            )
+            self._stats["failed"] += self._db.execute(
+                f"SELECT COUNT(*) FROM journal_queue WHERE status = 'failed' AND journal_id IN ({marks})", ids
+            ).fetchone()[0]
+            self._db.commit()
+
+    def _prune(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM journal_queue WHERE status != 'queued' AND updated_at < ?",
+                (time.time() - self.status_ttl,),
+            )
+            self._db.commit()
+
+    async def flush(self) -> int:
+        """Drain one batch; returns how many entries were stored."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        self._stats["batches"] += 1
+        try:
+            # the clean-up completion counts against the Cortex cap like any other, at background priority
+            async with admission.slot("journal_batch"):
+                stored, rejected = await run_blocking("llm", self._sink, batch, self.model)
+        except AdmissionRejected as e:
+            self._stats["deferred"] += 1
+            self._requeue(batch)
+            print(f"[DEBUG] Journal batch of {len(batch)} deferred: {str(e)}")
+            return 0
+        except Exception as e:
+            self._stats["batch_errors"] += 1
+            print(f"[ERROR] Journal batch of {len(batch)} failed: {str(e)}")
+            self._mark_failed_attempt(batch, str(e))
+            return 0
+        if rejected:
+            # an unparseable clean-up reply is retried like a failed batch; the entry isn't stored uncleaned
+            self._stats["unparsed"] += len(rejected)
+            for error in set(rejected.values()):
+                self._mark_failed_attempt([entry for entry in batch if rejected.get(entry[0]) == error], error)
+        if stored:
+            self._mark_stored(stored)
+            entries = [(user_id, stored[journal_id][0]) for journal_id, user_id, _ in batch if journal_id in stored]
+            for callback in self.on_stored:
+                callback(entries)
+        return len(stored) + len(rejected)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._prune()
+            #keep draining while full batches are waiting; a partial batch waits for the next interval
+            while await self.flush() >= self.flush_size:
+                pass
+        #shutting down: drain what is left so in-memory entries are not lost
+        while await self.flush():
+            pass
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "max_pending": self.max_pending,
+            "flush_size": self.flush_size,
+            "flush_interval": self.flush_interval,
+            "durable": self.durable,
+            **self._stats,
+        }
+
+
+journal_queue = JournalQueue()
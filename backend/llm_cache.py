@@ -0,0 +1,177 @@
+#content-addressed cache for SNOWFLAKE.CORTEX.COMPLETE responses: in-memory LRU + TTL, optional sqlite tier on disk
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))        # entries kept in memory
+LLM_CACHE_TTL  = float(os.getenv("LLM_CACHE_TTL", "86400"))     # seconds
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")                # sqlite file; empty disables the disk tier
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    enabled: bool = True
+    max_temperature: float = 0.3  # sampling above this is meant to vary, so don't pin one answer
+    ttl: float = LLM_CACHE_TTL
+
+
+#per-prompt-type policies; anything not listed falls back to "default"
+POLICIES = {
+    "default":             CachePolicy(),
+    "onboard":             CachePolicy(),
+    "journal_clean":       CachePolicy(),
+    "journal_observation": CachePolicy(enabled=False),  # reads the user's own history, never shared
+    "schedule":            CachePolicy(max_temperature=1.0, ttl=6 * 3600),
+}
+
+
+def _normalize_messages(messages):
+    #role + content only, CRLF folded and outer whitespace stripped so trivially different payloads share a key
+    return [
+        {"role": m["role"].strip().lower(), "content": m["content"].replace("\r\n", "\n").strip()}
+        for m in messages
+    ]
+
+
+def make_key(model: str, messages, options: Optional[dict] = None) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": _normalize_messages(messages), "options": options or {}},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self._db.commit()
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            return row
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, value, expires_at))
+            self._db.commit()
+
+    def purge_expired(self, now):
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=LLM_CACHE_SIZE, path=LLM_CACHE_PATH, policies=None, clock=time.time):
+        self.max_entries = max_entries
+        self.policies = dict(POLICIES if policies is None else policies)
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires_at), most recently used at the right
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(path) if path else None
+        if self._disk is not None:
+            self._disk.purge_expired(clock())
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+    def policy(self, kind: str) -> CachePolicy:
+        return self.policies.get(kind) or self.policies["default"]
+
+    def cacheable(self, kind: str, temperature: float) -> bool:
+        policy = self.policy(kind)
+        cacheable = policy.enabled and temperature <= policy.max_temperature
+        if not cacheable:
+            with self._lock:
+                self._stats["bypassed"] += 1
+        return cacheable
+
+    def get(self, key: str) -> Optional[str]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+        row = self._disk.get(key, now) if self._disk is not None else None
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._insert_locked(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key: str, value: str, kind: str = "default"):
+        expires_at = self._clock() + self.policy(kind).ttl
+        with self._lock:
+            self._insert_locked(key, value, expires_at)
+            self._stats["stores"] += 1
+        if self._disk is not None:
+            self._disk.put(key, value, expires_at)
+
+    def _insert_locked(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self._disk is not None,
+                "hit_rate": round((self._stats["hits"] + self._stats["disk_hits"]) / lookups, 3) if lookups else 0.0,
+                **self._stats,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -1,23 +1,53 @@
 import os
-import re
 import json
+import time
 import uuid
-import joblib
-import numpy as np
-import pandas as pd
+import hashlib
+import asyncio
+from datetime import datetime
 from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, Query, Header
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from snowflake.connector import connect
 
 # Import your models and prompts
-from data_structure import UserProfile, UserJournal
+from data_structure import UserProfile, UserJournal, WorkoutEvent, OnboardingExtract, OnboardingTurn, JournalClean, ScheduleDay
+from db_pool import get_conn, get_pool
+from scoring import score_one, score_profiles, missing_inputs, stats as fitness_model_stats
+from rescore import fetch_profiles, write_scores
+from llm_cache import get_cache, make_key
+from extractor import extract, ExtractionError, stats as extractor_stats
+import metrics
+from timing import StageTimer
+from jobs import jobs
+from singleflight import singleflight
+from idempotency import idempotency, IdempotencyConflict
+from deadline import DeadlineMiddleware, DeadlineExceeded, bounded as within_deadline, stats as deadline_stats
+from hedge import hedger
+from admission import admission, AdmissionRejected
+from sse import sse_response, await_with_progress, stats as stream_stats
+from profile_cache import profile_cache, make_backend, SELECT_PROFILE_SQL, record_from_row
+from sentiment_trends import trend_store
+from sentiment_model import score_text as local_sentiment
+from sentiment_reconcile import sentiment_reconciler
+from schedule_engine import build_schedule, record_latency as record_schedule_latency, stats as schedule_stats
+from workouts import workout_store, week_range, current_week_completed
+from onboarding import onboarding_sessions, ONBOARD_MAX_MESSAGE_CHARS
+from journal_queue import journal_queue, QueueFull
+from executor import run_blocking, stats as executor_stats, shutdown as shutdown_executor
+from cohorts import cohort_store
+from fitness_score import migrate as migrate_schema
+from export import (
+    export_chunks, encoder as export_encoder, resume_after, reserve as reserve_export, release as release_export,
+    stats as export_stats,
+)
 from system_prompts import (
     ONBOARD_PROMPT,
+    ONBOARD_STATE_PROMPT,
     JOURNAL_INPUT_PROMPT,
     JOURNAL_OUTPUT_PROMPT,
-    SCHEDULE_GENERATOR_PROMPT,
+    SCHEDULE_REFINE_PROMPT,
 )
 
 load_dotenv()
@@ -30,107 +60,270 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag", "Idempotent-Replayed"],
 )
-
-SNOWFLAKE_CONFIG = {
-    "user":      os.getenv("SNOWFLAKE_USER"),
-    "password":  os.getenv("SNOWFLAKE_PASSWORD"),
-    "account":   os.getenv("SNOWFLAKE_ACCOUNT"),
-    "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
-    "database":  os.getenv("SNOWFLAKE_DATABASE"),
-    "schema":    os.getenv("SNOWFLAKE_SCHEMA"),
-}
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 CORTEX_MODEL = "gemini-2.5-flash" 
 
-fit_model  = joblib.load("fitness_model.pkl")
-fit_scaler = joblib.load("scaler.pkl")
+DASHBOARD_TTL = float(os.getenv("DASHBOARD_TTL", "60"))  # seconds a rendered dashboard is served without re-querying
+SENTIMENT_SCORER = os.getenv("SENTIMENT_SCORER", "local")  # "local": score in-process, reconcile with Cortex later; "cortex": score inline
 
 def _get_conn():
-    return connect(**SNOWFLAKE_CONFIG)
+    # Pooled session; conn.close() hands it back to the pool instead of logging out
+    return get_conn()
 
-def cortex_complete(prompt: str, system: str = "", temperature: float = 0.3) -> str:
+# Blocking query helpers, meant to be run through run_blocking("db", ...)
+def _query_one(sql: str, params: tuple = ()):
     conn = _get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+
+def _query_all(sql: str, params: tuple = ()):
+    conn = _get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+def _execute(sql: str, params: tuple = ()):
+    conn = _get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+def _execute_with_cursor(fn, *args):
+    # fn(cur, *args) runs on one pooled session and is committed as a unit
+    conn = _get_conn()
+    cur = conn.cursor()
+    try:
+        result = fn(cur, *args)
+        conn.commit()
+        return result
+    finally:
+        cur.close()
+        conn.close()
+
+def _parse_cortex_result(result) -> str:
+    if isinstance(result, str):
+        try:
+            parsed = json.loads(result)
+            if "choices" in parsed:
+                return parsed["choices"][0]["messages"].strip()
+            return result.strip()
+        except Exception:
+            return result.strip()
+    return str(result).strip()
+
+def _cortex_call(messages: List[Dict[str, str]], options: Optional[dict], kind: str, conn=None, model: str = CORTEX_MODEL) -> str:
+    # options=None means the plain-string form of COMPLETE (single user prompt, no system message)
+    cache = get_cache()
+    temperature = (options or {}).get("temperature", 0.0)
+    key = None
+    if cache.cacheable(kind, temperature):
+        key = make_key(model, messages, options)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    with metrics.scope("llm"):
+        text = _cortex_query(messages, options, conn, model)
+
+    if key is not None and text:
+        cache.put(key, text, kind)
+    return text
+
+def _cortex_query(messages: List[Dict[str, str]], options: Optional[dict], conn=None, model: str = CORTEX_MODEL) -> str:
+    owns_conn = conn is None
+    if owns_conn:
+        conn = _get_conn()
     cur  = conn.cursor()
     try:
-        if system:
-            messages = json.dumps([
-                {"role": "system", "content": system},
-                {"role": "user",   "content": prompt},
-            ])
-            options = json.dumps({"temperature": temperature})
-            cur.execute(
-                "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, PARSE_JSON(%s), PARSE_JSON(%s))",
-                (CORTEX_MODEL, messages, options),
+        # Cancellable: a completion stuck past the request's deadline (or one whose client left) is aborted
+        if options is None:
+            cur.execute_cancellable(
+                "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s)",
+                (model, messages[0]["content"]),
             )
         else:
-            cur.execute(
-                "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s)",
-                (CORTEX_MODEL, prompt),
+            cur.execute_cancellable(
+                "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, PARSE_JSON(%s), PARSE_JSON(%s))",
+                (model, json.dumps(messages), json.dumps(options)),
             )
-        
-        result = cur.fetchone()[0]
-        if isinstance(result, str):
-            try:
-                parsed = json.loads(result)
-                if "choices" in parsed:
-                    return parsed["choices"][0]["messages"].strip()
-                return result.strip()
-            except Exception:
-                return result.strip()
-        return str(result).strip()
+        return _parse_cortex_result(cur.fetchone()[0])
     finally:
         cur.close()
-        conn.close()
+        if owns_conn:
+            conn.close()
 
-def cortex_complete_chat(history: List[Dict[str, str]], system: str = "") -> str:
+def cortex_complete(prompt: str, system: str = "", temperature: float = 0.3, conn=None, kind: str = "default",
+                    model: str = CORTEX_MODEL) -> str:
+    if system:
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user",   "content": prompt},
+        ]
+        return _cortex_call(messages, {"temperature": temperature}, kind, conn=conn, model=model)
+    return _cortex_call([{"role": "user", "content": prompt}], None, kind, conn=conn, model=model)
+
+def cortex_complete_chat(history: List[Dict[str, str]], system: str = "", kind: str = "default",
+                         model: str = CORTEX_MODEL) -> str:
     messages = []
     if system:
         messages.append({"role": "system", "content": system})
     for msg in history:
         role = "user" if msg["role"] == "user" else "assistant"
         messages.append({"role": role, "content": msg["content"]})
+    return _cortex_call(messages, {"temperature": 0.1}, kind, model=model)
 
-    conn = _get_conn()
-    cur  = conn.cursor()
+async def run_llm(user_key, fn, /, *args, **kwargs):
+    """run_blocking("llm", ...) behind admission control: priority by prompt kind, rate-limited per user.
+    Bounded by the request deadline, and hedged onto the fallback model per the hedging policy; fn takes model=.
+    The hedger admits each attempt separately, so a hedge needs its own free slot."""
+    kind = kwargs.get("kind", "default")
+    async with within_deadline():
+        return await hedger.run(kind, CORTEX_MODEL, lambda model: run_blocking("llm", fn, *args, model=model, **kwargs),
+                                key=user_key)
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    return JSONResponse({"status": "timeout", "reason": exc.reason, "message": str(exc)}, status_code=504)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        {"status": "busy", "reason": exc.reason, "message": str(exc), "retry_after": exc.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+async def _idempotent(endpoint: str, key: Optional[str], payload, response: Response, fn):
+    """fn() once per Idempotency-Key: retries get the stored result, concurrent duplicates wait for the original"""
+    if not key:
+        return await fn()
     try:
-        options = json.dumps({"temperature": 0.1})
-        cur.execute(
-            "SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, PARSE_JSON(%s), PARSE_JSON(%s))",
-            (CORTEX_MODEL, json.dumps(messages), options),
-        )
-        result = cur.fetchone()[0]
-        if isinstance(result, str):
-            try:
-                parsed = json.loads(result)
-                if "choices" in parsed:
-                    return parsed["choices"][0]["messages"].strip()
-                return result.strip()
-            except Exception:
-                return result.strip()
-        return str(result).strip()
-    finally:
-        cur.close()
-        conn.close()
+        result, replayed = await idempotency.run(endpoint, key, payload, fn)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                            headers={"Retry-After": "5"})
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+def _onboard_session(data: dict):
+    """Session for an /onboard body of {"session_id"?: str, "message": str}; None if it expired"""
+    if not data.get("session_id"):
+        return onboarding_sessions.create()
+    return onboarding_sessions.get(data["session_id"])
+
+def _onboard_message(data: dict) -> str:
+    return (data.get("message") or "").strip()[:ONBOARD_MAX_MESSAGE_CHARS]
+
+async def _onboard_turn(session, message: str) -> str:
+    # Cortex sees the compact slot state plus the pending question, never the raw transcript.
+    # Mid-conversation it replies {"filled", "reply"}: the slots come from the model, the user sees only the reply
+    async with session.lock:
+        history = session.messages(ONBOARD_STATE_PROMPT, message)
+        response_text = await run_llm(session.session_id, cortex_complete_chat, history, system=ONBOARD_PROMPT, kind="onboard")
+        try:
+            turn = extract(response_text, OnboardingTurn, name="onboard_turn")
+        except ExtractionError:
+            turn = None  # the final profile JSON, or a reply that ignored the format
+        if turn is not None:
+            response_text = turn["reply"]
+        session.record_turn(message, response_text, turn["filled"] if turn is not None else None)
+    return response_text
+
+def _onboard_extracted(session, response_text: str):
+    # None while the assistant is still asking questions; a JSON reply that won't validate is an error
+    try:
+        partial_data = extract(response_text, OnboardingExtract, name="onboard")
+    except ExtractionError as e:
+        if e.candidates == 0:
+            return None
+        raise
+    onboarding_sessions.finish(session.session_id)
+    return partial_data
+
+_ONBOARD_EXPIRED = {"status": "expired", "message": "Onboarding session expired, please start again."}
 
 @app.post("/onboard")
-async def onboard_user(data: List[Dict[str, str]]):
+async def onboard_user(data: dict):
+    """One onboarding turn: {"session_id", "message"}; omit session_id on the first turn to start a session"""
     try:
-        response_text = cortex_complete_chat(data, system=ONBOARD_PROMPT)
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            raw_json = json.loads(json_match.group())
+        message = _onboard_message(data)
+        if not message:
+            return {"status": "error", "message": "message required"}
+        session = _onboard_session(data)
+        if session is None:
+            return _ONBOARD_EXPIRED
+        response_text = await _onboard_turn(session, message)
+        partial_data = _onboard_extracted(session, response_text)
+        if partial_data is not None:
             return {
                 "status": "needs_metrics",
-                "partial_data": raw_json,
+                "partial_data": partial_data,
                 "message": "Great! Now let's grab a few measurements.",
             }
-        return {"status": "chatting", "message": response_text}
+        return {"status": "chatting", "session_id": session.session_id, "message": response_text}
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
     except Exception as e:
         return {"status": "error", "message": f"Server Error: {str(e)}"}
 
+@app.post("/onboard/stream")
+async def onboard_user_stream(data: dict):
+    """SSE variant of /onboard: progress while Cortex runs, then the reply or the extracted profile"""
+    message = _onboard_message(data)
+    session = _onboard_session(data) if message else None
+
+    async def events():
+        if not message:
+            yield "error", {"message": "message required"}
+            return
+        if session is None:
+            yield "expired", _ONBOARD_EXPIRED
+            return
+        yield "stage", {"stage": "thinking", "session_id": session.session_id}
+        result = {}
+        async for event in await_with_progress("thinking", _onboard_turn(session, message), result):
+            yield event
+        response_text = result["value"]
+        partial_data = _onboard_extracted(session, response_text)
+        if partial_data is not None:
+            yield "needs_metrics", {
+                "partial_data": partial_data,
+                "message": "Great! Now let's grab a few measurements.",
+            }
+        else:
+            yield "message", {"session_id": session.session_id, "message": response_text}
+
+    return sse_response("onboard", events())
+
 @app.post("/complete_profile")
-async def complete_profile(profile_data: dict):
+async def complete_profile(profile_data: dict, response: Response, idempotency_key: Optional[str] = Header(None)):
+    # A double submit with the same key gets the first call's user back rather than a second new profile
+    return await _idempotent("complete_profile", idempotency_key, profile_data, response,
+                             lambda: _complete_profile(dict(profile_data)))
+
+async def _complete_profile(profile_data: dict):
     try:
         # ALWAYS generate a new unique user_id, don't trust frontend
         user_id = "user_" + uuid.uuid4().hex[:8]
@@ -148,11 +341,9 @@ async def complete_profile(profile_data: dict):
         bmi = weight / (height_m ** 2) if height_m > 0 else 0
         max_bpm = 220 - age
 
-        feats = pd.DataFrame([[age, weight, height_m, resting_bpm, max_bpm, workout_freq, bmi]], 
-            columns=['Age', 'Weight (kg)', 'Height (m)', 'Resting_BPM', 'Max_BPM', 'Workout_Frequency (days/week)', 'BMI'])
-        scaled = fit_scaler.transform(feats)
-        fitness_proba = fit_model.predict_proba(scaled)[0][1]
-        exp_level = int(fit_model.predict(scaled)[0]) + 1
+        fitness_proba, exp_level, model_version = await run_blocking(
+            "cpu", metrics.timed("model.inference", score_one), age, weight, height_m, resting_bpm, max_bpm, workout_freq, bmi
+        )
 
         # Hybrid scoring: combine ML model with vital sign bonuses
         fitness_score = round(float(fitness_proba), 2)
@@ -165,169 +356,402 @@ async def complete_profile(profile_data: dict):
 
         profile_data["fitness_score"] = fitness_score
         profile_data["experience_level"] = exp_level
+        profile_data["model_version"] = model_version
 
         profile = UserProfile(**profile_data)
         
-        conn = _get_conn()
-        cur = conn.cursor()
-        try:
-            query = """
-            INSERT INTO USER_PROFILES (
-                USER_ID, GOALS, WORKOUTS_PER_WEEK, AI_EXTRACTED_DATA,
-                FITNESS_SCORE, WEIGHT_KG, HEIGHT_CM, AGE,
-                RESTING_BPM, EXPERIENCE_LEVEL, CREATED_AT, BROAD_GOAL
-            ) 
-            SELECT 
-                %s, TRY_PARSE_JSON(%s), %s, TRY_PARSE_JSON(%s), 
-                %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP(), %s
-            """
-            cur.execute(query, profile.to_snowflake_query())
-            conn.commit()
-            print(f"[DEBUG] Profile saved successfully for {user_id}")
-        finally:
-            cur.close()
-            conn.close()
+        query = """
+        INSERT INTO USER_PROFILES (
+            USER_ID, GOALS, WORKOUTS_PER_WEEK, AI_EXTRACTED_DATA,
+            FITNESS_SCORE, WEIGHT_KG, HEIGHT_CM, AGE,
+            RESTING_BPM, EXPERIENCE_LEVEL, CREATED_AT, BROAD_GOAL, MODEL_VERSION
+        ) 
+        SELECT 
+            %s, TRY_PARSE_JSON(%s), %s, TRY_PARSE_JSON(%s), 
+            %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP(), %s, %s
+        """
+        await run_blocking("db", _execute, query, profile.to_snowflake_query())
+        profile_cache.put(profile.dict())
+        cohort_store.record(None, profile.dict())
+        print(f"[DEBUG] Profile saved successfully for {user_id}")
 
         return {"status": "complete", "data": profile.dict()}
     except Exception as e:
         print(f"[ERROR] Profile creation failed: {str(e)}")
         return {"status": "error", "message": f"Server Error: {str(e)}"}
 
-@app.post("/journal")
-async def process_journal(user_id: str, entry_text: str):
+# Sentiment is scored inside the same server-side batch as the INSERT: one round trip, one Cortex call
+_STORE_JOURNAL_SQL = """
+SET JOURNAL_SENTIMENT = (SELECT SNOWFLAKE.CORTEX.SENTIMENT(%s));
+INSERT INTO USER_JOURNALS (USER_ID, JOURNAL, SENTIMENT_ANALYSIS, CREATED_AT)
+    SELECT %s, %s, $JOURNAL_SENTIMENT, CURRENT_TIMESTAMP();
+SELECT $JOURNAL_SENTIMENT;
+"""
+
+def _store_journal(user_id: str, cleaned_text: str):
     conn = _get_conn()
     cur = conn.cursor()
     try:
-        clean_prompt = f"{JOURNAL_INPUT_PROMPT}\n\nEntry: {entry_text}"
-        clean_response = cortex_complete(clean_prompt, temperature=0.2)
-        json_match = re.search(r'\{.*\}', clean_response, re.DOTALL)
-        
-        if not json_match:
-            raise HTTPException(status_code=500, detail="Journal parsing error")
-        cleaned_data = json.loads(json_match.group())
-
-        cur.execute("SELECT SNOWFLAKE.CORTEX.SENTIMENT(%s)", (cleaned_data["cleaned_text"],))
+        with metrics.scope("sentiment"):  # CORTEX.SENTIMENT runs inside this batch
+            cur.execute(_STORE_JOURNAL_SQL, (cleaned_text, user_id, cleaned_text), num_statements=3)
+        cur.nextset()
+        cur.nextset()
         sentiment_score = cur.fetchone()[0]
-
-        cur.execute(
-            "INSERT INTO USER_JOURNALS (USER_ID, JOURNAL, SENTIMENT_ANALYSIS, CREATED_AT) VALUES (%s, %s, %s, CURRENT_TIMESTAMP())",
-            (user_id, cleaned_data["cleaned_text"], sentiment_score),
-        )
         conn.commit()
-
-        cur.execute("SELECT GOALS FROM USER_PROFILES WHERE USER_ID = %s", (user_id,))
-        row = cur.fetchone()
-        user_interests = str(row[0]) if row else "General fitness"
-
-        obs_prompt = JOURNAL_OUTPUT_PROMPT.format(
-            cleaned_text=cleaned_data["cleaned_text"],
-            cortex_score=sentiment_score,
-            user_goals_and_activities=user_interests,
-        )
-        observation = cortex_complete(obs_prompt, temperature=0.5)
-
-        return {
-            "score": sentiment_score,
-            "observation": observation,
-            "tags": cleaned_data["context_tags"],
-            "safety_flag": cleaned_data["safety_flag"],
-        }
+        return sentiment_score
     finally:
         cur.close()
         conn.close()
 
+_INSERT_JOURNAL_SQL = """
+INSERT INTO USER_JOURNALS (USER_ID, JOURNAL, SENTIMENT_ANALYSIS, CREATED_AT)
+    VALUES (%s, %s, %s, %s::TIMESTAMP_NTZ)
+"""
+
+def _store_journal_local(user_id: str, cleaned_text: str):
+    # No Cortex round trip: the in-process score goes in now, sentiment_reconciler swaps in Cortex's later.
+    # CREATED_AT is set here so the reconciler can find the row again (USER_JOURNALS has no id column)
+    with metrics.stage("sentiment.local"):
+        sentiment_score = local_sentiment(cleaned_text)
+    created_at = datetime.utcnow().isoformat(sep=" ")
+    _execute(_INSERT_JOURNAL_SQL, (user_id, cleaned_text, sentiment_score, created_at))
+    sentiment_reconciler.submit(user_id, created_at, cleaned_text, sentiment_score)
+    return sentiment_score
+
+async def _journal_observation(user_id: str, cleaned_text: str, sentiment_score, score_source: str,
+                               user_interests: str) -> str:
+    obs_prompt = JOURNAL_OUTPUT_PROMPT.format(
+        cleaned_text=cleaned_text,
+        sentiment_score=sentiment_score,
+        score_source=score_source,
+        user_goals_and_activities=user_interests,
+    )
+    return await run_llm(user_id, cortex_complete, obs_prompt, temperature=0.5, kind="journal_observation")
+
+@app.post("/journal")
+async def process_journal(user_id: str, entry_text: str, response: Response, defer_observation: bool = False,
+                          idempotency_key: Optional[str] = Header(None)):
+    payload = {"user_id": user_id, "entry_text": entry_text, "defer_observation": defer_observation}
+    return await _idempotent("journal", idempotency_key, payload, response,
+                             lambda: _process_journal(user_id, entry_text, response, defer_observation))
+
+async def _process_journal(user_id: str, entry_text: str, response: Response, defer_observation: bool):
+    timer = StageTimer()
+
+    # Stage 1: the clean-up LLM call and the goals lookup don't depend on each other
+    clean_prompt = f"{JOURNAL_INPUT_PROMPT}\n\nEntry: {entry_text}"
+    clean_response, profile = await asyncio.gather(
+        timer.timed("clean", run_llm(user_id, cortex_complete, clean_prompt, temperature=0.2, kind="journal_clean")),
+        timer.timed("goals", profile_cache.get(user_id)),
+    )
+    try:
+        cleaned_data = extract(clean_response, JournalClean, name="journal_clean")
+    except ExtractionError:
+        raise HTTPException(status_code=500, detail="Journal parsing error")
+    goals = profile["goals"] if profile else []
+    user_interests = ", ".join(str(g) for g in goals) if goals else "General fitness"
+
+    # Stage 2: sentiment + insert in one statement batch
+    store = _store_journal_local if SENTIMENT_SCORER == "local" else _store_journal
+    sentiment_score = await timer.timed("store", run_blocking("db", store, user_id, cleaned_data["cleaned_text"]))
+    trend_store.record(user_id, sentiment_score)
+    _forget_user(user_id, profile=False)
+
+    result = {
+        "score": sentiment_score,
+        "score_source": SENTIMENT_SCORER,
+        "tags": cleaned_data["context_tags"],
+        "safety_flag": cleaned_data["safety_flag"],
+    }
+
+    # Stage 3: the observation, either inline or as a job the client polls at GET /jobs/{observation_id}
+    observation = _journal_observation(user_id, cleaned_data["cleaned_text"], sentiment_score, SENTIMENT_SCORER, user_interests)
+    if defer_observation:
+        result["observation"] = None
+        result["observation_id"] = jobs.submit("observation", observation)
+    else:
+        try:
+            result["observation"] = await timer.timed("observe", observation)
+        except (AdmissionRejected, DeadlineExceeded) as e:
+            # The entry is already stored, so a 429 / 504 here would invite a duplicate retry; skip the observation instead
+            result["observation"] = None
+            result["observation_error"] = str(e)
+
+    response.headers["Server-Timing"] = timer.header()
+    return result
+
+@app.post("/journal/queue", status_code=202)
+async def queue_journal(user_id: str, entry_text: str):
+    """Queued ingestion: the next micro-batch cleans, safety-checks, scores and stores the entry; poll /journal/status/{journal_id}"""
+    text = entry_text.strip()
+    if not text:
+        raise HTTPException(status_code=422, detail="entry_text is empty")
+    try:
+        journal_id = await run_blocking("db", journal_queue.enqueue, user_id, text)
+    except QueueFull as e:
+        retry_after = str(max(1, int(journal_queue.flush_interval)))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": retry_after})
+    return {"status": "queued", "journal_id": journal_id}
+
+@app.get("/journal/status/{journal_id}")
+async def get_journal_status(journal_id: str):
+    status = await run_blocking("db", journal_queue.status, journal_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired journal id")
+    return status
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
 # --- ADDED ENDPOINTS FOR DASHBOARD ---
 
+_JOURNAL_HISTORY_SQL = """
+    SELECT TO_CHAR(CREATED_AT, 'Dy') as day, 
+           CAST(SENTIMENT_ANALYSIS AS FLOAT) as sentiment
+    FROM USER_JOURNALS 
+    WHERE USER_ID = %s 
+    ORDER BY CREATED_AT DESC LIMIT 7
+"""
+
+def _history_view(rows):
+    # Convert to format React Chart expects
+    history = [{"day": r[0], "sentiment": r[1]} for r in rows]
+    return list(reversed(history))
+
+async def _journal_history(user_id: str):
+    rows = await run_blocking("db", _query_all, _JOURNAL_HISTORY_SQL, (user_id,))
+    return {"history": _history_view(rows)}
+
 @app.get("/journal_history/{user_id}")
 async def get_journal_history(user_id: str):
-    conn = _get_conn()
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT TO_CHAR(CREATED_AT, 'Dy') as day, 
-                   CAST(SENTIMENT_ANALYSIS AS FLOAT) as sentiment
-            FROM USER_JOURNALS 
-            WHERE USER_ID = %s 
-            ORDER BY CREATED_AT DESC LIMIT 7
-        """, (user_id,))
-        rows = cur.fetchall()
-        # Convert to format React Chart expects
-        history = [{"day": r[0], "sentiment": r[1]} for r in rows]
-        return {"history": list(reversed(history))}
-    finally:
-        cur.close()
-        conn.close()
+        return await singleflight.do("journal_history", user_id, None, lambda: _journal_history(user_id))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out loading journal history")
+
+@app.get("/sentiment_trend/{user_id}")
+async def get_sentiment_trend(user_id: str, window: int = 7):
+    """Rolling sentiment mean, slope, EWMA and burnout signals over the last `window` days"""
+    try:
+        return await trend_store.summary(user_id, window)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/sentiment_trend/backfill")
+async def backfill_sentiment_trends():
+    """Rebuild every user's trend aggregates from USER_JOURNALS in one pass"""
+    users = await run_blocking("db", trend_store.backfill)
+    return {"status": "success", "users": users}
 
 @app.get("/workout_stats/{user_id}")
 async def get_workout_stats(user_id: str):
-    conn = _get_conn()
-    cur = conn.cursor()
+    # This week's count is a single precomputed rollup row, not a scan of the event log
+    profile, completed = await asyncio.gather(
+        profile_cache.get(user_id),
+        run_blocking("db", current_week_completed, user_id),
+    )
+    return _workout_stats_view(profile, completed)
+
+def _workout_stats_view(profile, completed: int = 0):
+    goal = (profile["workouts_per_week"] or 0) if profile else 0
+    
+    percentage = 0 if goal == 0 else int((completed / goal) * 100)
+    remaining = max(0, goal - completed)
+    
+    return {
+        "completed": completed,
+        "goal": goal,
+        "percentage": percentage,
+        "remaining": remaining
+    }
+
+@app.get("/cohort/{user_id}")
+async def get_cohort(user_id: str):
+    """Where the user's fitness_score falls within their age band, goal and experience level cohorts"""
+    profile = await profile_cache.get(user_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found")
     try:
-        cur.execute("SELECT WORKOUTS_PER_WEEK FROM USER_PROFILES WHERE USER_ID = %s", (user_id,))
-        row = cur.fetchone()
-        goal = row[0] if row else 0
-        
-        # TODO: In a real app, track actual completed workouts from a WORKOUTS table
-        # For now, return 0 completed with calculated fields
-        completed = 0
-        percentage = 0 if goal == 0 else int((completed / goal) * 100)
-        remaining = max(0, goal - completed)
-        
-        return {
-            "completed": completed,
-            "goal": goal,
-            "percentage": percentage,
-            "remaining": remaining
-        }
-    finally:
-        cur.close()
-        conn.close()
+        return {"user_id": user_id, **await cohort_store.percentiles(profile)}
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.post("/workouts/log")
+async def log_workouts(data: dict):
+    """Append completed workouts (one or many) and fold them into the weekly rollups"""
+    try:
+        events = [WorkoutEvent(**e) for e in data.get("events", [])]
+        logged = await run_blocking("db", workout_store.log_events, events)
+        for user_id in {e.user_id for e in events}:
+            _forget_user(user_id, profile=False)
+        return {"status": "success", "logged": logged}
+    except Exception as e:
+        print(f"[ERROR] Workout log failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+@app.get("/workout_history/{user_id}")
+async def get_workout_history(user_id: str, weeks: int = 12):
+    """Completed workouts and minutes per week for the last `weeks` weeks, served from the rollups"""
+    if not 1 <= weeks <= 260:
+        raise HTTPException(status_code=422, detail="weeks must be between 1 and 260")
+    profile, rows = await asyncio.gather(
+        profile_cache.get(user_id),
+        run_blocking("db", week_range, user_id, weeks),
+    )
+    goal = (profile["workouts_per_week"] or 0) if profile else 0
+    return {
+        "goal": goal,
+        "weeks": [
+            {
+                "week_start": week.isoformat(),
+                "completed": completed,
+                "minutes": minutes,
+                "percentage": 0 if goal == 0 else int((completed / goal) * 100),
+            }
+            for week, completed, minutes in rows
+        ],
+    }
+
+async def _profile(user_id: str):
+    profile = await profile_cache.get(user_id)
+    
+    if not profile:
+        return {"error": "Not found"}
+    return _profile_view(profile)
 
 @app.get("/profile/{user_id}")
 async def get_profile(user_id: str):
+    try:
+        return await singleflight.do("profile", user_id, None, lambda: _profile(user_id))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out loading profile")
+
+def _profile_view(profile):
+    user_id = profile["user_id"]
+
+    # Calculate BMI from the data
+    age = profile["age"]
+    height_cm = profile["height_cm"]
+    weight_kg = profile["weight_kg"]
+    resting_bpm = profile["resting_bpm"]
+    fitness_score = profile["fitness_score"]
+    broad_goal = profile["broad_goal"]
+    
+    height_m = height_cm / 100
+    bmi = round(weight_kg / (height_m ** 2), 1) if height_m > 0 else 0
+
+    # Construct the response to match the 'profileData' state in React
+    return {
+        "user_id": user_id,
+        "age": age,
+        "height_cm": height_cm,
+        "weight_kg": weight_kg,
+        "resting_bpm": resting_bpm,
+        "fitness_score": fitness_score,
+        "broad_goal": broad_goal,
+        "bmi": bmi,  # Add calculated BMI
+        "model_version": profile.get("model_version")
+    }
+
+# Rendered dashboards keyed by user_id, each {"etag", "body"}; dropped whenever the user's data changes.
+# Same backend as the profile cache, so with PROFILE_CACHE_BACKEND=sqlite a write in one worker drops it in all
+_dashboard_cache = make_backend("dashboard_cache")
+
+def _forget_user(user_id: str, profile: bool = True):
+    if profile:
+        profile_cache.invalidate(user_id)
+    _dashboard_cache.delete(user_id)
+
+def _journals_stored(entries):
+    for user_id, score in entries:
+        trend_store.record(user_id, score)
+    for user_id in {user_id for user_id, _ in entries}:
+        _forget_user(user_id, profile=False)
+
+journal_queue.on_stored.append(_journals_stored)
+journal_queue.model = CORTEX_MODEL  # queued entries are cleaned with the same model as /journal
+
+def _sentiments_reconciled(entries):
+    # Trend aggregates folded in the local score; rebuild them only for users whose score actually moved
+    for user_id in {user_id for user_id, local, cortex in entries if abs(cortex - local) > 0.01}:
+        trend_store.forget(user_id)
+        _forget_user(user_id, profile=False)
+
+sentiment_reconciler.on_reconciled.append(_sentiments_reconciled)
+
+def _load_dashboard(user_id: str, need_profile: bool):
+    # One round trip: the profile row (unless cached), the journal history and this week's workout count
+    # as one multi-statement batch. A sqlite workout store is a local file and is read after the batch
     conn = _get_conn()
     cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT AGE, HEIGHT_CM, WEIGHT_KG, RESTING_BPM, FITNESS_SCORE, BROAD_GOAL
-            FROM USER_PROFILES WHERE USER_ID = %s
-        """, (user_id,))
-        r = cur.fetchone()
-        
-        if not r:
-            return {"error": "Not found"}
-
-        # Calculate BMI from the data
-        age = r[0]
-        height_cm = r[1]
-        weight_kg = r[2]
-        resting_bpm = r[3]
-        fitness_score = r[4]
-        broad_goal = r[5]
-        
-        height_m = height_cm / 100
-        bmi = round(weight_kg / (height_m ** 2), 1) if height_m > 0 else 0
-
-        # Construct the response to match the 'profileData' state in React
-        return {
-            "user_id": user_id,
-            "age": age,
-            "height_cm": height_cm,
-            "weight_kg": weight_kg,
-            "resting_bpm": resting_bpm,
-            "fitness_score": fitness_score,
-            "broad_goal": broad_goal,
-            "bmi": bmi  # Add calculated BMI
-        }
+        statements = [(SELECT_PROFILE_SQL, (user_id,))] if need_profile else []
+        statements.append((_JOURNAL_HISTORY_SQL, (user_id,)))
+        week_statement = workout_store.week_completed_statement(cur, user_id)
+        if week_statement is not None:
+            statements.append(week_statement)
+        cur.execute(";".join(sql for sql, _ in statements), tuple(p for _, params in statements for p in params),
+                    num_statements=len(statements))
+        profile = None
+        if need_profile:
+            row = cur.fetchone()
+            profile = record_from_row(row) if row else None
+            cur.nextset()
+        rows = cur.fetchall()
+        if week_statement is not None:
+            cur.nextset()
+            completed = int(cur.fetchone()[0])
+        else:
+            completed = current_week_completed(user_id)
+        return profile, rows, completed
     finally:
         cur.close()
         conn.close()
 
+def _etag(body) -> str:
+    digest = hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+@app.get("/dashboard/{user_id}")
+async def get_dashboard(user_id: str, request: Request):
+    """Profile card, workout stats and journal history in one response, with ETag revalidation"""
+    headers = {"Cache-Control": "private, no-cache"}
+    cached = _dashboard_cache.get(user_id, time.time())
+    if cached is None:
+        profile = profile_cache.peek(user_id)
+        loaded_profile, rows, completed = await run_blocking("db", _load_dashboard, user_id, profile is None)
+        if profile is None:
+            profile = loaded_profile
+            if profile is None:
+                return {"error": "Not found"}
+            profile_cache.put(profile)
+        body = {
+            "profile": _profile_view(profile),
+            "workout_stats": _workout_stats_view(profile, completed),
+            "history": _history_view(rows),
+        }
+        cached = {"etag": _etag(body), "body": body}
+        _dashboard_cache.put(user_id, cached, time.time() + DASHBOARD_TTL)
+
+    headers["ETag"] = cached["etag"]
+    if _etag_matches(request, cached["etag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(cached["body"], headers=headers)
+
 @app.patch("/profile/{user_id}")
 async def update_profile(user_id: str, updates: dict):
     """Update user profile metrics and recalculate fitness score"""
-    conn = _get_conn()
-    cur = conn.cursor()
     try:
         # Extract the new values
         age = float(updates.get("age"))
@@ -341,31 +765,33 @@ async def update_profile(user_id: str, updates: dict):
         max_bpm = 220 - age
         
         # Get workouts_per_week from existing profile
-        cur.execute("SELECT WORKOUTS_PER_WEEK FROM USER_PROFILES WHERE USER_ID = %s", (user_id,))
-        row = cur.fetchone()
-        workout_freq = float(row[0]) if row else 3.0
+        profile = await profile_cache.get(user_id)
+        workout_freq = float(profile["workouts_per_week"]) if profile else 3.0
         
         # Recalculate fitness score using model
-        feats = pd.DataFrame([[age, weight, height_m, resting_bpm, max_bpm, workout_freq, bmi]], 
-                            columns=['Age', 'Weight (kg)', 'Height (m)', 'Resting_BPM', 'Max_BPM', 'Workout_Frequency (days/week)', 'BMI'])
-        scaled = fit_scaler.transform(feats)
-        fitness_proba = fit_model.predict_proba(scaled)[0][1]
-        exp_level = int(fit_model.predict(scaled)[0]) + 1
+        fitness_proba, exp_level, model_version = await run_blocking(
+            "cpu", metrics.timed("model.inference", score_one), age, weight, height_m, resting_bpm, max_bpm, workout_freq, bmi
+        )
         
         fitness_score = round(float(fitness_proba), 2)
         
         # Update the database
-        cur.execute("""
+        await run_blocking("db", _execute, """
             UPDATE USER_PROFILES 
             SET AGE = %s, 
                 HEIGHT_CM = %s, 
                 WEIGHT_KG = %s, 
                 RESTING_BPM = %s,
                 FITNESS_SCORE = %s,
-                EXPERIENCE_LEVEL = %s
+                EXPERIENCE_LEVEL = %s,
+                MODEL_VERSION = %s
             WHERE USER_ID = %s
-        """, (age, height_cm, weight, resting_bpm, fitness_score, exp_level, user_id))
-        conn.commit()
+        """, (age, height_cm, weight, resting_bpm, fitness_score, exp_level, model_version, user_id))
+        if profile:
+            cohort_store.record(profile, {**profile, "age": age, "fitness_score": fitness_score, "experience_level": exp_level})
+        else:
+            cohort_store.skipped()
+        _forget_user(user_id)
         
         return {
             "status": "updated",
@@ -375,13 +801,57 @@ async def update_profile(user_id: str, updates: dict):
             "weight_kg": weight,
             "resting_bpm": resting_bpm,
             "fitness_score": fitness_score,
-            "experience_level": exp_level
+            "experience_level": exp_level,
+            "model_version": model_version
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
-    finally:
-        cur.close()
-        conn.close()
+
+@app.post("/score_batch")
+async def score_batch(data: dict):
+    """Score many profiles in one vectorized pass.
+    With write_back, the stored USER_PROFILES rows of the given user_ids are re-scored and updated; the body's
+    feature values are only scored, never written, so a stored score always matches the stored inputs."""
+    try:
+        profiles = data.get("profiles") or []
+        write_back = bool(data.get("write_back", False))
+
+        if not write_back:
+            scores, exp_levels, model_version = await run_blocking("cpu", metrics.timed("model.inference", score_profiles), profiles)
+            results = [
+                {"user_id": p.get("user_id"), "fitness_score": float(s), "experience_level": int(l),
+                 **({"imputed": missing_inputs(p)} if missing_inputs(p) else {})}
+                for p, s, l in zip(profiles, scores, exp_levels)
+            ]
+            return {"status": "success", "count": len(results), "updated": 0, "model_version": model_version,
+                    "results": results}
+
+        user_ids = list(dict.fromkeys(data.get("user_ids") or [p.get("user_id") for p in profiles if p.get("user_id")]))
+        stored = await run_blocking("db", _execute_with_cursor, fetch_profiles, user_ids)
+        scores, exp_levels, model_version = await run_blocking("cpu", metrics.timed("model.inference", score_profiles), stored)
+        # rows with missing inputs are scored on the training means; "imputed" names the columns that were filled in
+        results = [
+            {"user_id": p["user_id"], "fitness_score": float(s), "experience_level": int(l),
+             **({"imputed": missing_inputs(p)} if missing_inputs(p) else {})}
+            for p, s, l in zip(stored, scores, exp_levels)
+        ]
+        updated = await run_blocking(
+            "db", _execute_with_cursor, write_scores,
+            [r["user_id"] for r in results],
+            [r["fitness_score"] for r in results],
+            [r["experience_level"] for r in results],
+            model_version,
+        )
+        for old, r in zip(stored, results):
+            cohort_store.record(old, {**old, "fitness_score": r["fitness_score"], "experience_level": r["experience_level"]})
+            _forget_user(r["user_id"])
+        found = {p["user_id"] for p in stored}
+
+        return {"status": "success", "count": len(results), "updated": updated, "model_version": model_version,
+                "results": results, "missing": [u for u in user_ids if u not in found]}
+    except Exception as e:
+        print(f"[ERROR] Batch scoring failed: {str(e)}")
+        return {"status": "error", "message": str(e)}
 
 @app.post("/update_schedule")
 async def update_schedule(data: dict):
@@ -394,99 +864,239 @@ async def update_schedule(data: dict):
         if not user_id:
             return {"status": "error", "message": "user_id required"}
         
-        conn = _get_conn()
-        cur = conn.cursor()
-        try:
-            # Update AI_EXTRACTED_DATA with new schedule
-            cur.execute("""
-                SELECT AI_EXTRACTED_DATA FROM USER_PROFILES WHERE USER_ID = %s
-            """, (user_id,))
-            row = cur.fetchone()
-            
-            if not row:
-                return {"status": "error", "message": "User not found"}
-            
-            # Parse existing AI_EXTRACTED_DATA
-            ai_data = json.loads(row[0]) if row[0] else {}
-            ai_data['schedule'] = schedule
-            
-            # Update the profile
-            cur.execute("""
-                UPDATE USER_PROFILES
-                SET AI_EXTRACTED_DATA = PARSE_JSON(%s),
-                    WORKOUTS_PER_WEEK = %s
-                WHERE USER_ID = %s
-            """, (json.dumps(ai_data), workouts_per_week, user_id))
-            conn.commit()
-            
-            print(f"[DEBUG] Schedule updated for {user_id}: {schedule}")
-            
-            return {
-                "status": "success",
-                "schedule": schedule,
-                "workouts_per_week": workouts_per_week
-            }
-        finally:
-            cur.close()
-            conn.close()
+        if not await profile_cache.get(user_id):
+            return {"status": "error", "message": "User not found"}
+        
+        # Set the schedule key server-side, so a stale cached AI_EXTRACTED_DATA can't overwrite other keys
+        await run_blocking("db", _execute, """
+            UPDATE USER_PROFILES
+            SET AI_EXTRACTED_DATA = OBJECT_INSERT(COALESCE(AI_EXTRACTED_DATA, OBJECT_CONSTRUCT()), 'schedule', %s, TRUE),
+                WORKOUTS_PER_WEEK = %s
+            WHERE USER_ID = %s
+        """, (schedule, workouts_per_week, user_id))
+        _forget_user(user_id)
+        
+        print(f"[DEBUG] Schedule updated for {user_id}: {schedule}")
+        
+        return {
+            "status": "success",
+            "schedule": schedule,
+            "workouts_per_week": workouts_per_week
+        }
     except Exception as e:
         print(f"[ERROR] Schedule update failed: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+def _engine_schedule(profile) -> list:
+    # Deterministic week from the template library; microseconds, no warehouse or LLM involved
+    started = time.perf_counter()
+    ai_data = profile["ai_extracted_data"] or {}
+    week = build_schedule(
+        profile["fitness_score"],
+        profile["broad_goal"],
+        ai_data.get('schedule', 'flexible schedule'),
+        profile["workouts_per_week"] or 0,
+    )
+    record_schedule_latency("engine", started)
+    return week
+
+def _refine_prompt(profile, draft) -> str:
+    ai_data = profile["ai_extracted_data"] or {}
+    return SCHEDULE_REFINE_PROMPT.format(
+        fitness_score=profile["fitness_score"],
+        broad_goal=profile["broad_goal"],
+        goals=", ".join(str(g) for g in profile["goals"] or []) or "none given",
+        availability=ai_data.get('schedule', 'flexible schedule'),
+        injuries=ai_data.get('injuries', 'none'),
+        draft=json.dumps(draft, ensure_ascii=False, indent=2),
+    )
+
+async def _refine_schedule(profile, draft) -> Optional[list]:
+    # The LLM only personalizes the engine's draft; None if its answer isn't a full week
+    started = time.perf_counter()
+    try:
+        response_text = await run_llm(profile["user_id"], cortex_complete, _refine_prompt(profile, draft), temperature=0.4, kind="schedule")
+    except DeadlineExceeded:
+        return None  # out of budget: the engine's draft is the local answer
+    record_schedule_latency("llm", started)
+    try:
+        days = extract(response_text, ScheduleDay, many=True, name="schedule")
+    except ExtractionError:
+        return None
+    return days if len(days) == 7 else None
+
+async def _generate_schedule(user_id: str, personalize: bool):
+    profile = await profile_cache.get(user_id)
+    if not profile:
+        return {"status": "error", "message": "User not found"}
+
+    schedule = _engine_schedule(profile)
+    if not personalize:
+        return {"status": "success", "schedule": schedule, "source": "engine"}
+
+    refined = await _refine_schedule(profile, schedule)
+    if refined is None:
+        # Fall back to the draft rather than failing the request
+        return {"status": "success", "schedule": schedule, "source": "engine", "message": "Personalization failed"}
+    return {"status": "success", "schedule": refined, "source": "llm"}
+
 @app.post("/generate_schedule")
-async def generate_schedule(data: dict):
-    """Generate AI-powered workout schedule based on user profile"""
+async def generate_schedule(data: dict, response: Response, idempotency_key: Optional[str] = Header(None)):
+    """Workout schedule from the local engine; {"personalize": true} also has the LLM refine it"""
+    return await _idempotent("generate_schedule", idempotency_key, data, response, lambda: _schedule_request(data))
+
+async def _schedule_request(data: dict):
     try:
         user_id = data.get("user_id")
         
         if not user_id:
             return {"status": "error", "message": "user_id required"}
         
-        conn = _get_conn()
-        cur = conn.cursor()
-        try:
-            # Fetch user profile
-            cur.execute("""
-                SELECT FITNESS_SCORE, BROAD_GOAL, AI_EXTRACTED_DATA, WORKOUTS_PER_WEEK
-                FROM USER_PROFILES WHERE USER_ID = %s
-            """, (user_id,))
-            row = cur.fetchone()
-            
-            if not row:
-                return {"status": "error", "message": "User not found"}
-            
-            fitness_score = row[0]
-            broad_goal = row[1]
-            ai_data = json.loads(row[2]) if row[2] else {}
-            availability = ai_data.get('schedule', 'flexible schedule')
-            
-            # Generate schedule using AI
-            prompt = SCHEDULE_GENERATOR_PROMPT.format(
-                fitness_score=fitness_score,
-                broad_goal=broad_goal,
-                availability=availability
-            )
-            
-            schedule_response = cortex_complete(prompt, temperature=0.7)
-            
-            # Try to parse JSON response
-            json_match = re.search(r'\[.*\]', schedule_response, re.DOTALL)
-            if json_match:
-                schedule_data = json.loads(json_match.group())
-                return {
-                    "status": "success",
-                    "schedule": schedule_data
-                }
-            else:
-                return {"status": "error", "message": "Failed to generate schedule"}
-                
-        finally:
-            cur.close()
-            conn.close()
+        # Duplicate clicks while a schedule is being generated share the one in flight
+        personalize = bool(data.get("personalize"))
+        return await singleflight.do(
+            "generate_schedule", user_id, {"personalize": personalize},
+            lambda: _generate_schedule(user_id, personalize),
+        )
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
+    except asyncio.TimeoutError:
+        print(f"[ERROR] Schedule generation timed out for {data.get('user_id')}")
+        return {"status": "error", "message": "Schedule generation timed out"}
     except Exception as e:
         print(f"[ERROR] Schedule generation failed: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+@app.post("/generate_schedule/stream")
+async def generate_schedule_stream(data: dict):
+    """SSE variant of /generate_schedule: the engine's days immediately, then the LLM's refined days if requested"""
+    user_id = data.get("user_id")
+
+    async def events():
+        if not user_id:
+            yield "error", {"message": "user_id required"}
+            return
+        yield "stage", {"stage": "loading_profile"}
+        profile = await profile_cache.get(user_id)
+        if not profile:
+            yield "error", {"message": "User not found"}
+            return
+
+        schedule = _engine_schedule(profile)
+        for day in schedule:
+            yield "day", day
+        if not data.get("personalize"):
+            yield "schedule", {"status": "success", "days": len(schedule), "source": "engine"}
+            return
+
+        yield "stage", {"stage": "personalizing"}
+        result = {}
+        async for event in await_with_progress("personalizing", _refine_schedule(profile, schedule), result):
+            yield event
+        refined = result["value"]
+        if refined is None:
+            yield "schedule", {"status": "success", "days": len(schedule), "source": "engine",
+                               "message": "Personalization failed"}
+            return
+        for day in refined:
+            yield "refined_day", day
+        yield "schedule", {"status": "success", "days": len(refined), "source": "llm"}
+
+    return sse_response("generate_schedule", events())
+
+class _ExportResponse(StreamingResponse):
+    # Releases the export slot even when the client leaves before the body generator ever starts
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            release_export()
+
+@app.get("/export/{kind}")
+async def export_rows(kind: str, format: str = "ndjson", user_id: Optional[List[str]] = Query(None),
+                      after_user_id: Optional[str] = None, after_created_at: Optional[str] = None):
+    """Stream USER_JOURNALS or USER_PROFILES in (USER_ID, CREATED_AT) order; resume with the last row's keys"""
+    try:
+        enc = export_encoder(kind, format)
+        after = resume_after(after_user_id, after_created_at)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # claimed here, before any response exists, and released by _ExportResponse however the stream ends
+    if not reserve_export():
+        raise HTTPException(status_code=503, detail="Too many exports running", headers={"Retry-After": "30"})
+    chunks = export_chunks(kind, enc, user_id, after)
+
+    async def body():
+        # one batch in memory at a time: the next fetch only runs once this chunk has been sent
+        try:
+            while True:
+                chunk = await run_blocking("db", next, chunks, None)
+                if chunk is None:
+                    return
+                if chunk:
+                    yield chunk
+        finally:
+            await run_blocking("db", chunks.close)  # client gone or done: release the cursor and connection
+
+    return _ExportResponse(body(), media_type=enc.media_type,
+                           headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'})
+
 @app.get("/health")
 async def health_check():
-    return {"status": "alive", "engine": f"Snowflake Cortex ({CORTEX_MODEL})"}
\ No newline at end of file
+    return {"status": "alive", "engine": f"Snowflake Cortex ({CORTEX_MODEL})"}
+
+@app.on_event("startup")
+async def start_workers():
+    # Idempotent ADD COLUMN IF NOT EXISTS: profile reads and writes name MODEL_VERSION, so an older database gets it
+    # before the first request instead of failing every profile call until someone migrates by hand
+    try:
+        await run_blocking("db", migrate_schema)
+    except Exception as e:
+        print(f"[ERROR] Schema migration failed, run `python fitness_score.py --migrate` with a role that can ALTER "
+              f"USER_PROFILES: {str(e)}")
+    journal_queue.start()
+    sentiment_reconciler.start()
+    cohort_store.start()
+    if os.getenv("TREND_BACKFILL_ON_STARTUP") == "1":
+        jobs.submit("trend_backfill", run_blocking("db", trend_store.backfill))
+
+@app.on_event("shutdown")
+async def close_pool():
+    # drain queued journals while the executor and pool are still up
+    await journal_queue.stop()
+    await sentiment_reconciler.stop()
+    await cohort_store.stop()
+    shutdown_executor()
+    get_pool().close_all()
+    get_cache().close()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Request and per-stage latency histograms plus the /stats counters, in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(await get_stats()), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def get_stats():
+    """Connection pool, worker pool, cache, job and queue counters"""
+    return {
+        "pool": get_pool().stats(),
+        "executor": executor_stats(),
+        "llm_cache": get_cache().stats(),
+        "jobs": jobs.stats(),
+        "streams": stream_stats(),
+        "journal_queue": journal_queue.stats(),
+        "fitness_model": fitness_model_stats(),
+        "sentiment": sentiment_reconciler.stats(),
+        "profile_cache": profile_cache.stats(),
+        "sentiment_trends": trend_store.stats(),
+        "cohorts": cohort_store.stats(),
+        "schedule_engine": schedule_stats(),
+        "onboarding_sessions": onboarding_sessions.stats(),
+        "extractor": extractor_stats(),
+        "singleflight": singleflight.stats(),
+        "idempotency": idempotency.stats(),
+        "deadlines": deadline_stats(),
+        "hedging": hedger.stats(),
+        "admission": admission.stats(),
+        "export": export_stats(),
+    }
\ No newline at end of file
@@ -0,0 +1,250 @@
+#in-process latency histograms, labeled by endpoint and stage, rendered in the Prometheus text format on /metrics
+#stages (pool checkout / login, execute, fetch, Cortex, model inference, ...) are recorded wherever they run, worker
+#threads included: run_blocking copies contextvars, so they land on the request that caused them
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+METRICS_PREFIX  = os.getenv("METRICS_PREFIX", "cadence")
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames, buckets=BUCKETS):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count], sum
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *labels):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            base = _labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{{{_labels(self.labelnames, labels)}}} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+REQUEST_SECONDS = Histogram("request_duration_seconds", "HTTP request latency", ("method", "endpoint", "status"))
+STAGE_SECONDS   = Histogram("stage_duration_seconds", "Latency of one stage of a request", ("method", "endpoint", "stage"))
+SLOW_REQUESTS   = Counter("slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ("endpoint",))
+IDEMPOTENT_REQUESTS = Counter("idempotent_requests_total", "Requests carrying an Idempotency-Key, by outcome",
+                              ("endpoint", "outcome"))
+
+
+class RequestTrace:
+    """Stage samples of one request, shared by every thread working on it. They are observed into STAGE_SECONDS
+    when the request ends, once the route template is known; later stages (e.g. a deferred job) go straight in."""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.endpoint = None
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> [seconds, ...]
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            if self.endpoint is None:
+                self.stages.setdefault(stage, []).append(seconds)
+                return
+        STAGE_SECONDS.observe(seconds, self.method, self.endpoint, stage)
+
+    def close(self, endpoint):
+        with self._lock:
+            self.endpoint = endpoint
+            stages = dict(self.stages)
+        for stage, samples in stages.items():
+            for seconds in samples:
+                STAGE_SECONDS.observe(seconds, self.method, endpoint, stage)
+
+    def breakdown(self):
+        with self._lock:
+            totals = [(stage, sum(samples), len(samples)) for stage, samples in self.stages.items()]
+        return ", ".join(
+            f"{stage}={seconds * 1000:.0f}ms" + (f"x{calls}" if calls > 1 else "")
+            for stage, seconds, calls in sorted(totals, key=lambda t: -t[1])
+        )
+
+
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+_scope = contextvars.ContextVar("metrics_scope", default="db")  # prefix for connection / cursor stages
+
+
+def record_stage(stage: str, seconds: float):
+    trace = _trace.get()
+    if trace is None:
+        STAGE_SECONDS.observe(seconds, "", "background", stage)
+    else:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+@contextmanager
+def scope(name: str):
+    """Label the connection / execute / fetch stages inside this block as `name.*` (e.g. "llm.execute")."""
+    token = _scope.set(name)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def scoped(suffix: str) -> str:
+    return f"{_scope.get()}.{suffix}"
+
+
+def timed(name: str, fn):
+    """fn wrapped so each call is recorded as stage `name`; for handing to run_blocking."""
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing execute and fetch calls; everything else passes straight through."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def execute(self, *args, **kwargs):
+        with stage(scoped("execute")):
+            self._raw.execute(*args, **kwargs)
+            return self
+
+    def _fetch(self, method, *args):
+        with stage(scoped("fetch")):
+            return getattr(self._raw, method)(*args)
+
+    def fetchone(self):
+        return self._fetch("fetchone")
+
+    def fetchall(self):
+        return self._fetch("fetchall")
+
+    def fetchmany(self, *args):
+        return self._fetch("fetchmany", *args)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: request histogram, per-request trace, and the slow-request log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = _trace.set(trace)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            # the route template ("/profile/{user_id}") keeps label cardinality bounded
+            endpoint = getattr(scope.get("route"), "path", "unmatched")
+            elapsed = time.perf_counter() - trace.started
+            REQUEST_SECONDS.observe(elapsed, trace.method, endpoint, str(status["code"]))
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                SLOW_REQUESTS.inc(endpoint)
+                print(f"[SLOW] {trace.method} {trace.path} {elapsed * 1000:.0f}ms status={status['code']} "
+                      f"stages: {trace.breakdown() or 'none recorded'}")
+            trace.close(endpoint)
+
+
+def _gauges(stats: dict):
+    #numeric leaves of the /stats payload as {prefix}_component_stat{component, field} gauges
+    name = f"{METRICS_PREFIX}_component_stat"
+    lines = [f"# HELP {name} Numeric counters and gauges from /stats", f"# TYPE {name} gauge"]
+
+    def walk(component, path, value):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            lines.append(f'{name}{{component="{_escape(component)}",field="{_escape(".".join(path))}"}} {value}')
+        elif isinstance(value, dict):
+            for k, v in value.items():
+                walk(component, path + [str(k)], v)
+
+    for component, value in stats.items():
+        walk(component, [], value)
+    return lines
+
+
+def render(stats: dict = None) -> str:
+    lines = REQUEST_SECONDS.render() + STAGE_SECONDS.render() + SLOW_REQUESTS.render() + IDEMPOTENT_REQUESTS.render()
+    if stats:
+        lines += _gauges(stats)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,134 @@
+#server-side onboarding sessions: the transcript and the answers collected so far live here, keyed by session id
+#each /onboard turn carries only the new message; the prompt is rebuilt from the compact slot state, not the raw history
+#the model reports which slots each message answered (ONBOARD_STATE_PROMPT asks for {"filled", "reply"}), so a
+#clarifying question, a correction or one message covering several slots lands where it belongs
+import os
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+ONBOARD_SESSION_TTL        = float(os.getenv("ONBOARD_SESSION_TTL", "1800"))   # idle seconds before a session expires
+ONBOARD_MAX_SESSIONS       = int(os.getenv("ONBOARD_MAX_SESSIONS", "10000"))
+ONBOARD_MAX_TRANSCRIPT     = int(os.getenv("ONBOARD_MAX_TRANSCRIPT", "20"))    # messages kept per session
+ONBOARD_MAX_MESSAGE_CHARS  = int(os.getenv("ONBOARD_MAX_MESSAGE_CHARS", "2000"))
+ONBOARD_MAX_UNSORTED       = 5                                                # unmatched messages carried into the prompt
+
+#slots in the order ONBOARD_PROMPT asks for them
+SLOTS = [
+    ("broad_goal", "Broad goal"),
+    ("objectives", "Specific fitness objectives"),
+    ("schedule",   "Preferred workout schedule"),
+    ("injuries",   "Injuries or health limitations"),
+]
+
+
+class OnboardingSession:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.slots = {}                                        # slot -> the user's answer
+        self.unsorted = deque(maxlen=ONBOARD_MAX_UNSORTED)     # messages from turns whose reply named no slots
+        self.transcript = deque(maxlen=ONBOARD_MAX_TRANSCRIPT)  # kept for debugging, never sent to Cortex
+        self.last_question = None                              # the assistant's most recent reply
+        self.turns = 0
+        self.touched_at = time.time()
+        self.lock = asyncio.Lock()                             # one turn at a time, so answers land in the right slot
+
+    def pending_slot(self):
+        return next((slot for slot, _ in SLOTS if slot not in self.slots), None)
+
+    def record_turn(self, text: str, reply: str, filled=None):
+        """Store a completed turn. filled: the slots the model says the message answered ({} for none, e.g. a
+        clarifying question); None if its reply couldn't be parsed, in which case the message is kept unsorted
+        and shown to the model again next turn rather than guessed into a slot."""
+        if filled is None:
+            self.unsorted.append(text)
+        else:
+            labels = dict(SLOTS)
+            for slot, answer in filled.items():
+                answer = answer if isinstance(answer, str) else ", ".join(map(str, answer)) if isinstance(answer, list) else ""
+                if slot in labels and answer.strip():
+                    self.slots[slot] = answer.strip()
+            self.unsorted.clear()  # the model has seen them and filled what they answered
+        self.transcript.append({"role": "user", "content": text})
+        self.transcript.append({"role": "model", "content": reply})
+        self.last_question = reply
+        self.turns += 1
+
+    def messages(self, state_prompt: str, text: str):
+        """Chat history for cortex_complete_chat: one state summary, the pending question and the new answer."""
+        pending = self.pending_slot()
+        labels = dict(SLOTS)
+        state = state_prompt.format(
+            collected="\n".join(f"- {slot} ({label}): {self.slots[slot]}" for slot, label in SLOTS if slot in self.slots) or "- nothing yet",
+            unsorted="\n".join(f"- {text}" for text in self.unsorted) or "- none",
+            answering=labels[pending] if pending else "a follow-up; everything has been collected",
+            missing=", ".join(slot for slot, _ in SLOTS if slot not in self.slots) or "nothing",
+        )
+        history = [{"role": "user", "content": state}]
+        if self.last_question:
+            history.append({"role": "model", "content": self.last_question})
+        history.append({"role": "user", "content": text})
+        return history
+
+    def view(self):
+        return {"session_id": self.session_id, "collected": [s for s, _ in SLOTS if s in self.slots], "turns": self.turns}
+
+
+class SessionStore:
+    def __init__(self, ttl=ONBOARD_SESSION_TTL, max_sessions=ONBOARD_MAX_SESSIONS, clock=time.time):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions = OrderedDict()  # session_id -> OnboardingSession, least recently used at the left
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "completed": 0, "expired": 0, "evicted": 0}
+
+    def _evict(self, now):
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.touched_at > now - self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._stats["expired"] += 1
+        while len(self._sessions) >= self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["evicted"] += 1
+
+    def create(self) -> OnboardingSession:
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+            session = OnboardingSession("onb_" + uuid.uuid4().hex)
+            session.touched_at = now
+            self._sessions[session.session_id] = session
+            self._stats["created"] += 1
+            return session
+
+    def get(self, session_id: str):
+        """Live session or None if it never existed, expired, or was evicted."""
+        now = self._clock()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if session.touched_at <= now - self.ttl:
+                del self._sessions[session_id]
+                self._stats["expired"] += 1
+                return None
+            session.touched_at = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def finish(self, session_id: str):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._stats["completed"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._sessions), "ttl": self.ttl, "max_sessions": self.max_sessions, **self._stats}
+
+
+onboarding_sessions = SessionStore()
@@ -0,0 +1,213 @@
+#read-through cache of USER_PROFILES rows, stored as parsed records (GOALS / AI_EXTRACTED_DATA decoded once)
+#backends: "memory" (per process, LRU + TTL) or "sqlite" (a local file shared by every uvicorn worker on the host)
+import os
+import copy
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+from db_pool import get_conn
+from executor import run_blocking
+
+PROFILE_CACHE_BACKEND = os.getenv("PROFILE_CACHE_BACKEND", "memory")
+PROFILE_CACHE_PATH    = os.getenv("PROFILE_CACHE_PATH", "profile_cache.sqlite3")
+PROFILE_CACHE_SIZE    = int(os.getenv("PROFILE_CACHE_SIZE", "2048"))
+PROFILE_CACHE_TTL     = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+PROFILE_COLUMNS = [
+    "user_id", "goals", "workouts_per_week", "ai_extracted_data", "fitness_score",
+    "weight_kg", "height_cm", "age", "resting_bpm", "experience_level", "broad_goal", "model_version",
+]
+
+SELECT_PROFILE_SQL = """
+    SELECT USER_ID, GOALS, WORKOUTS_PER_WEEK, AI_EXTRACTED_DATA, FITNESS_SCORE,
+           WEIGHT_KG, HEIGHT_CM, AGE, RESTING_BPM, EXPERIENCE_LEVEL, BROAD_GOAL, MODEL_VERSION
+    FROM USER_PROFILES WHERE USER_ID = %s
+"""
+
+
+def _plain(value):
+    # NUMBER columns come back as Decimal; records have to survive a JSON round trip
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _parse_variant(value, default):
+    if value is None:
+        return default
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return default
+    return value
+
+
+def record_from_row(row) -> dict:
+    record = {col: _plain(v) for col, v in zip(PROFILE_COLUMNS, row)}
+    record["goals"] = _parse_variant(record["goals"], [])
+    record["ai_extracted_data"] = _parse_variant(record["ai_extracted_data"], {})
+    return record
+
+
+def load_profile(user_id: str):
+    """Blocking read of one USER_PROFILES row as a parsed record, or None."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute(SELECT_PROFILE_SQL, (user_id,))
+        row = cur.fetchone()
+        return record_from_row(row) if row else None
+    finally:
+        cur.close()
+        conn.close()
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=PROFILE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (record, expires_at), most recently used at the right
+        self._lock = threading.Lock()
+
+    def get(self, user_id, now):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return copy.deepcopy(entry[0])  # callers may edit nested dicts (e.g. ai_extracted_data)
+
+    def put(self, user_id, record, expires_at):
+        with self._lock:
+            self._entries[user_id] = (copy.deepcopy(record), expires_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteBackend:
+    """Shared by every worker process on the host, so an invalidation in one worker is seen by all."""
+
+    def __init__(self, path=PROFILE_CACHE_PATH, max_entries=PROFILE_CACHE_SIZE, table="profile_cache"):
+        self.max_entries = max_entries
+        self._table = table
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (user_id TEXT PRIMARY KEY, record TEXT, expires_at REAL, used_at REAL)")
+        self._db.commit()
+
+    def get(self, user_id, now):
+        with self._lock:
+            row = self._db.execute(f"SELECT record, expires_at FROM {self._table} WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute(f"DELETE FROM {self._table} WHERE user_id = ?", (user_id,))
+                self._db.commit()
+                return None
+            self._db.execute(f"UPDATE {self._table} SET used_at = ? WHERE user_id = ?", (now, user_id))
+            self._db.commit()
+            return json.loads(row[0])
+
+    def put(self, user_id, record, expires_at):
+        with self._lock:
+            self._db.execute(f"INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?, ?)",
+                             (user_id, json.dumps(record), expires_at, time.time()))
+            self._db.execute(f"""
+                DELETE FROM {self._table} WHERE user_id IN (
+                    SELECT user_id FROM {self._table} ORDER BY used_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._db.commit()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self._table} WHERE user_id = ?", (user_id,))
+            self._db.commit()
+
+    def size(self):
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+
+class ProfileCache:
+    def __init__(self, backend, ttl=PROFILE_CACHE_TTL, loader=load_profile, clock=time.time):
+        self.backend = backend
+        self.ttl = ttl
+        self._loader = loader
+        self._clock = clock
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_found": 0, "invalidations": 0}
+
+    def _bump(self, field, delta=1):
+        with self._stats_lock:
+            self._stats[field] += delta
+
+    def peek(self, user_id: str):
+        """Cached record or None, never touching Snowflake."""
+        record = self.backend.get(user_id, self._clock())
+        self._bump("hits" if record is not None else "misses")
+        return record
+
+    async def get(self, user_id: str):
+        """Parsed profile record, from the cache or (on a miss) from Snowflake; None if the user doesn't exist."""
+        record = self.backend.get(user_id, self._clock())
+        if record is not None:
+            self._bump("hits")
+            return record
+        self._bump("misses")
+        record = await run_blocking("db", self._loader, user_id)
+        if record is None:
+            self._bump("not_found")
+            return None
+        self.put(record)
+        return record
+
+    def put(self, record: dict):
+        """Write-through for callers that already hold the fresh row (e.g. right after the INSERT)."""
+        self.backend.put(record["user_id"], {col: _plain(record.get(col)) for col in PROFILE_COLUMNS},
+                         self._clock() + self.ttl)
+
+    def invalidate(self, user_id: str):
+        self.backend.delete(user_id)
+        self._bump("invalidations")
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "backend": type(self.backend).__name__,
+                "entries": self.backend.size(),
+                "ttl": self.ttl,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+                **self._stats,
+            }
+
+
+def make_backend(table="profile_cache"):
+    """The PROFILE_CACHE_BACKEND store; other per-user caches that must see every worker's invalidations
+    (e.g. rendered dashboards) pass their own sqlite table."""
+    if PROFILE_CACHE_BACKEND == "sqlite":
+        return SqliteBackend(table=table)
+    if PROFILE_CACHE_BACKEND == "memory":
+        return MemoryBackend()
+    raise ValueError(f"unknown PROFILE_CACHE_BACKEND: {PROFILE_CACHE_BACKEND}")
+
+
+profile_cache = ProfileCache(make_backend())
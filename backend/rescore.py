@@ -0,0 +1,113 @@
+#bulk re-score of USER_PROFILES after a model change: chunked reads, vectorized scoring, set-based UPDATEs
+#usage: python rescore.py [--chunk-size N] [--dry-run] [--stale-only]
+import argparse
+import time
+
+from db_pool import get_conn, get_pool
+from scoring import score_profiles, missing_inputs, model_version
+
+RESCORE_CHUNK_SIZE = 2000
+
+_SELECT_CHUNK = """
+    SELECT USER_ID, AGE, WEIGHT_KG, HEIGHT_CM, RESTING_BPM, WORKOUTS_PER_WEEK
+    FROM USER_PROFILES
+    WHERE USER_ID > %s {stale_filter}
+    ORDER BY USER_ID
+    LIMIT %s
+"""
+
+
+def fetch_chunk(cur, after_user_id: str, chunk_size: int, stale_before=None):
+    """Keyset-paginated read so each chunk is an index range scan, not an ever-growing OFFSET.
+    stale_before: only rows scored by an older (or unrecorded) model version."""
+    if stale_before is None:
+        cur.execute(_SELECT_CHUNK.format(stale_filter=""), (after_user_id, chunk_size))
+    else:
+        cur.execute(_SELECT_CHUNK.format(stale_filter="AND (MODEL_VERSION IS NULL OR MODEL_VERSION < %s)"),
+                    (after_user_id, stale_before, chunk_size))
+    return [
+        {"user_id": r[0], "age": r[1], "weight_kg": r[2], "height_cm": r[3],
+         "resting_bpm": r[4], "workouts_per_week": r[5]}
+        for r in cur.fetchall()
+    ]
+
+
+_SELECT_USERS = """
+    SELECT USER_ID, AGE, WEIGHT_KG, HEIGHT_CM, RESTING_BPM, WORKOUTS_PER_WEEK,
+           BROAD_GOAL, EXPERIENCE_LEVEL, FITNESS_SCORE
+    FROM USER_PROFILES
+    WHERE USER_ID IN ({placeholders})
+"""
+
+
+def fetch_profiles(cur, user_ids):
+    """Stored scoring inputs (plus the current score and cohort fields) for the given users, in one query."""
+    if not user_ids:
+        return []
+    cur.execute(_SELECT_USERS.format(placeholders=", ".join(["%s"] * len(user_ids))), tuple(user_ids))
+    return [
+        {"user_id": r[0], "age": r[1], "weight_kg": r[2], "height_cm": r[3], "resting_bpm": r[4],
+         "workouts_per_week": r[5], "broad_goal": r[6], "experience_level": r[7], "fitness_score": r[8]}
+        for r in cur.fetchall()
+    ]
+
+
+def write_scores(cur, user_ids, scores, exp_levels, model_version=None):
+    """One UPDATE ... FROM (VALUES ...) per chunk instead of one statement per user."""
+    if not user_ids:
+        return 0
+    values = ", ".join(["(%s, %s, %s)"] * len(user_ids))
+    params = [model_version]
+    for user_id, score, level in zip(user_ids, scores, exp_levels):
+        params.extend((user_id, float(score), int(level)))
+    cur.execute(f"""
+        UPDATE USER_PROFILES
+        SET FITNESS_SCORE = v.FITNESS_SCORE,
+            EXPERIENCE_LEVEL = v.EXPERIENCE_LEVEL,
+            MODEL_VERSION = %s
+        FROM (SELECT column1 AS USER_ID, column2 AS FITNESS_SCORE, column3 AS EXPERIENCE_LEVEL
+              FROM VALUES {values}) v
+        WHERE USER_PROFILES.USER_ID = v.USER_ID
+    """, tuple(params))
+    return len(user_ids)
+
+
+def rescore_all(chunk_size: int = RESCORE_CHUNK_SIZE, dry_run: bool = False, stale_only: bool = False):
+    conn = get_conn()
+    cur = conn.cursor()
+    totals = {"scored": 0, "updated": 0, "imputed": 0, "chunks": 0}
+    started = time.monotonic()
+    try:
+        last_user_id = ""
+        stale_before = model_version() if stale_only else None
+        while True:
+            profiles = fetch_chunk(cur, last_user_id, chunk_size, stale_before)
+            if not profiles:
+                break
+            scores, exp_levels, version = score_profiles(profiles)
+            user_ids = [p["user_id"] for p in profiles]
+            if not dry_run:
+                totals["updated"] += write_scores(cur, user_ids, scores, exp_levels, version)
+                conn.commit()
+            totals["scored"] += len(profiles)
+            totals["imputed"] += sum(bool(missing_inputs(p)) for p in profiles)
+            totals["chunks"] += 1
+            last_user_id = user_ids[-1]
+            print(f"[RESCORE] chunk {totals['chunks']}: {len(profiles)} rows (through {last_user_id})")
+    finally:
+        cur.close()
+        conn.close()
+    totals["seconds"] = round(time.monotonic() - started, 2)
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score every USER_PROFILES row with the current fitness model")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="score but do not write back")
+    parser.add_argument("--stale-only", action="store_true", help="only rows scored by an older model version")
+    args = parser.parse_args()
+    try:
+        print(f"[RESCORE] done: {rescore_all(args.chunk_size, args.dry_run, args.stale_only)}")
+    finally:
+        get_pool().close_all()
@@ -0,0 +1,183 @@
+#deterministic weekly schedule builder: (fitness band, goal, availability) -> a SCHEDULE_SCHEMA-shaped 7-day list
+#session templates are precomputed per (goal, band); assembled weeks are memoized per full bucket, so a hit is a dict copy
+import re
+import time
+import threading
+from functools import lru_cache
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+TIMES = ("morning", "afternoon", "evening")
+
+REST_DAY = {"activity": "Rest Day", "duration_min": 0, "intensity": "None", "focus": "Recovery", "emoji": "😴"}
+ACTIVE_RECOVERY = {"activity": "Mobility & Stretching", "duration_min": 20, "intensity": "Low", "focus": "Recovery", "emoji": "🧘"}
+
+#(activity, focus, emoji) rotations per goal; duration and intensity come from the fitness band
+_SESSIONS = {
+    "strength": [
+        ("Upper Body Strength", "Strength", "🏋️"),
+        ("Lower Body Strength", "Strength", "🦵"),
+        ("Full Body Compound Lifts", "Strength", "💪"),
+        ("Push Day", "Hypertrophy", "🏋️"),
+        ("Pull Day", "Hypertrophy", "💪"),
+        ("Core & Accessories", "Stability", "🧱"),
+    ],
+    "weight_loss": [
+        ("Interval Cardio", "Fat Loss", "🔥"),
+        ("Full Body Circuit", "Conditioning", "🏃"),
+        ("Steady-State Cardio", "Endurance", "🚴"),
+        ("Strength Circuit", "Muscle Retention", "🏋️"),
+        ("Brisk Walk or Hike", "Active Calorie Burn", "🚶"),
+        ("HIIT", "Fat Loss", "⚡"),
+    ],
+    "endurance": [
+        ("Easy Run", "Aerobic Base", "🏃"),
+        ("Tempo Run", "Threshold", "⏱️"),
+        ("Cross-Training Ride", "Endurance", "🚴"),
+        ("Interval Session", "Speed", "⚡"),
+        ("Long Distance Run", "Endurance", "🏃"),
+        ("Strength for Runners", "Injury Prevention", "🏋️"),
+    ],
+    "flexibility": [
+        ("Yoga Flow", "Flexibility", "🧘"),
+        ("Pilates Core", "Stability", "🤸"),
+        ("Mobility Circuit", "Mobility", "🔄"),
+        ("Light Cardio", "Recovery", "🚶"),
+        ("Deep Stretch", "Flexibility", "🧘"),
+    ],
+    "general": [
+        ("Full Body Strength", "Strength", "💪"),
+        ("Cardio Session", "Endurance", "🏃"),
+        ("Yoga Flow", "Flexibility", "🧘"),
+        ("Circuit Training", "Conditioning", "🔥"),
+        ("Outdoor Activity", "Wellbeing", "🌳"),
+    ],
+}
+
+_BANDS = {
+    # band: (duration_min, intensity, long-session bonus minutes)
+    "beginner":     (30, "Low",      10),
+    "intermediate": (45, "Moderate", 15),
+    "advanced":     (60, "High",     30),
+}
+
+_GOAL_KEYWORDS = [
+    ("weight_loss", ("weight", "fat", "lean", "tone", "slim")),
+    ("strength",    ("muscle", "strength", "strong", "bulk", "lift", "power")),
+    ("endurance",   ("endurance", "cardio", "run", "marathon", "stamina", "cycl", "swim")),
+    ("flexibility", ("flex", "mobility", "yoga", "stretch", "posture")),
+]
+
+#template library: (goal, band) -> tuple of session dicts, built once at import
+TEMPLATES = {
+    (goal, band): tuple(
+        {"activity": activity, "duration_min": minutes, "intensity": intensity, "focus": focus, "emoji": emoji}
+        for activity, focus, emoji in sessions
+    )
+    for goal, sessions in _SESSIONS.items()
+    for band, (minutes, intensity, _) in _BANDS.items()
+}
+
+
+def fitness_band(fitness_score) -> str:
+    score = float(fitness_score or 0)
+    if score < 0.35:
+        return "beginner"
+    if score < 0.7:
+        return "intermediate"
+    return "advanced"
+
+
+@lru_cache(maxsize=1024)
+def goal_bucket(broad_goal) -> str:
+    text = (broad_goal or "").lower()
+    for bucket, keywords in _GOAL_KEYWORDS:
+        if any(k in text for k in keywords):
+            return bucket
+    return "general"
+
+
+@lru_cache(maxsize=4096)
+def parse_availability(availability) -> tuple:
+    """'Monday evening, Wednesday evening, weekends' -> sorted tuple of (day index, time of day or None)."""
+    text = (availability or "").lower()
+    slots = {}
+    if "weekday" in text:
+        for i in (0, 2, 4):
+            slots.setdefault(i, None)
+    if "weekend" in text:
+        for i in (5, 6):
+            slots.setdefault(i, "morning")
+    for part in re.split(r"[,;/&]|\band\b", text):
+        for i, day in enumerate(DAYS):
+            if day.lower() in part or re.search(rf"\b{day[:3].lower()}\b", part):
+                slot_time = next((t for t in TIMES if t in part), None)
+                slots[i] = slot_time or slots.get(i)
+    return tuple(sorted(slots.items()))
+
+
+def _spread(n: int) -> tuple:
+    #n training days spaced as evenly as possible through the week, starting Monday
+    n = max(0, min(7, n))
+    return tuple(sorted({round(i * 7 / n) % 7 for i in range(n)})) if n else ()
+
+
+@lru_cache(maxsize=4096)
+def _build_week(goal: str, band: str, slots: tuple, workouts_per_week: int) -> tuple:
+    days = [i for i, _ in slots]
+    if workouts_per_week and len(days) > workouts_per_week:
+        #more availability than planned sessions: keep an evenly spaced subset
+        days = [days[round(k * len(days) / workouts_per_week)] for k in range(workouts_per_week)]
+    if not days:
+        days = list(_spread(workouts_per_week or 3))
+
+    templates = TEMPLATES[(goal, band)]
+    long_bonus = _BANDS[band][2]
+    training = {}
+    for k, day in enumerate(days):
+        session = dict(templates[k % len(templates)])
+        if k == len(days) - 1 and len(days) >= 3:
+            session["duration_min"] += long_bonus  # last session of the week is the long one
+        training[day] = session
+
+    week = []
+    for i, day in enumerate(DAYS):
+        if i in training:
+            entry = training[i]
+        elif band != "beginner" and (i - 1) in training and (i + 1) % 7 in training:
+            entry = ACTIVE_RECOVERY  # sandwiched between two sessions: keep it light rather than idle
+        else:
+            entry = REST_DAY
+        week.append({"day": day, **entry})
+    return tuple(week)
+
+
+def build_schedule(fitness_score, broad_goal, availability, workouts_per_week=0) -> list:
+    """SCHEDULE_SCHEMA-shaped list of 7 day dicts; deterministic for a given bucket."""
+    week = _build_week(goal_bucket(broad_goal), fitness_band(fitness_score),
+                       parse_availability(availability), int(workouts_per_week or 0))
+    return [dict(day) for day in week]
+
+
+_latency = {}  # source -> {"count", "ms_sum", "ms_max"}
+_latency_lock = threading.Lock()
+
+
+def record_latency(source: str, started: float):
+    ms = (time.perf_counter() - started) * 1000
+    with _latency_lock:
+        s = _latency.setdefault(source, {"count": 0, "ms_sum": 0.0, "ms_max": 0.0})
+        s["count"] += 1
+        s["ms_sum"] += ms
+        s["ms_max"] = max(s["ms_max"], ms)
+
+
+def stats():
+    with _latency_lock:
+        return {
+            "templates": len(TEMPLATES),
+            "memoized_weeks": _build_week.cache_info().currsize,
+            **{
+                source: {"count": s["count"], "ms_avg": round(s["ms_sum"] / s["count"], 3), "ms_max": round(s["ms_max"], 3)}
+                for source, s in _latency.items()
+            },
+        }
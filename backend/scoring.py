@@ -0,0 +1,175 @@
+#vectorized fitness scoring: one standardization and one probability pass for any number of profiles
+#the model is evaluated with plain NumPy from the compact fitness_model.npz export (see fitness_score.py),
+#so neither pandas nor sklearn is imported on the request path
+#versioned exports in FITNESS_MODEL_DIR are hot-reloaded: the CURRENT pointer is re-read every FITNESS_RELOAD_INTERVAL
+#seconds and a new version is swapped in with one reference assignment, so a batch is always scored by a single version
+#missing inputs (NaN) are imputed with the training mean from the exported scaler, i.e. they standardize to 0,
+#rather than scored as 0 (an age or weight of 0 gives a confident, wrong score)
+import os
+import time
+import threading
+import numpy as np
+
+FEATURES = ['Age', 'Weight (kg)', 'Height (m)', 'Resting_BPM', 'Max_BPM', 'Workout_Frequency (days/week)', 'BMI']
+INPUTS = ("age", "weight_kg", "height_cm", "resting_bpm", "workouts_per_week")  # profile columns the features derive from
+
+MODEL_PATH              = os.getenv("FITNESS_MODEL_PATH", "fitness_model.npz")
+FITNESS_MODEL_DIR       = os.getenv("FITNESS_MODEL_DIR", "fitness_models")         # v000001.npz, ... and CURRENT (see fitness_score.py)
+FITNESS_RELOAD_INTERVAL = float(os.getenv("FITNESS_RELOAD_INTERVAL", "5"))       # seconds between CURRENT checks
+
+_params = None
+_params_lock = threading.Lock()
+_checked_at = 0.0
+_reload_stats = {"swaps": 0, "reload_errors": 0, "last_swap_ms": None, "last_error": None}
+
+
+def read_params(path):
+    """Scaler mean/scale, logistic weights and version metadata from one .npz export."""
+    with np.load(path) as npz:
+        params = {k: npz[k] for k in ("mean", "scale", "coef", "intercept")}
+        features = [str(f) for f in npz["features"]]
+        params["version"] = int(npz["version"]) if "version" in npz else 0
+    if features != FEATURES:
+        raise ValueError(f"{path} was exported for features {features}")
+    params["artifact"] = os.path.basename(path)
+    params["loaded_at"] = time.time()
+    return params
+
+
+def current_artifact(model_dir=None):
+    """File name the CURRENT pointer names, or None before the first versioned export."""
+    try:
+        with open(os.path.join(model_dir or FITNESS_MODEL_DIR, "CURRENT"), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _initial_params():
+    name = current_artifact()
+    if name:
+        return read_params(os.path.join(FITNESS_MODEL_DIR, name))
+    if os.path.exists(MODEL_PATH):
+        return read_params(MODEL_PATH)
+    #no export yet: fall back to the pickles (pulls in sklearn once)
+    from fitness_score import load_pickled_params
+    params = load_pickled_params()
+    params.update(version=0, artifact=None, loaded_at=time.time())
+    return params
+
+
+def _load_params():
+    #the params dict in use; loaded on first use, then re-checked against CURRENT now and then
+    global _params, _checked_at
+    if _params is None:
+        with _params_lock:
+            if _params is None:
+                _params = _initial_params()
+                _checked_at = time.monotonic()
+    elif time.monotonic() - _checked_at >= FITNESS_RELOAD_INTERVAL:
+        reload()
+    return _params
+
+
+def reload() -> bool:
+    """Swap in the version CURRENT points at if it changed; True if a new model is now live.
+    Scoring carries on with the old params while the new ones load."""
+    global _params, _checked_at
+    if not _params_lock.acquire(blocking=False):
+        return False  # another thread is already checking
+    try:
+        _checked_at = time.monotonic()
+        name = current_artifact()
+        if name is None or (_params is not None and name == _params.get("artifact")):
+            return False
+        started = time.perf_counter()
+        try:
+            params = read_params(os.path.join(FITNESS_MODEL_DIR, name))
+        except Exception as e:
+            # a half-copied or bad export: keep serving the current version and retry next interval
+            _reload_stats["reload_errors"] += 1
+            _reload_stats["last_error"] = f"{name}: {e}"
+            print(f"[ERROR] Fitness model reload of {name} failed: {str(e)}")
+            return False
+        _params = params
+        _reload_stats["swaps"] += 1
+        _reload_stats["last_swap_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        print(f"[MODEL] Fitness model v{params['version']} live ({name}, {_reload_stats['last_swap_ms']}ms)")
+        return True
+    finally:
+        _params_lock.release()
+
+
+def model_version() -> int:
+    return _load_params()["version"]
+
+
+def stats():
+    p = _load_params()
+    return {
+        "version": p["version"],
+        "artifact": p["artifact"],
+        "loaded_at": p["loaded_at"],
+        "reload_interval": FITNESS_RELOAD_INTERVAL,
+        **_reload_stats,
+    }
+
+
+def build_features(age, weight_kg, height_cm, resting_bpm, workout_freq):
+    """Model feature matrix (n, 7) from raw profile columns; derives height in m, BMI and max BPM."""
+    age          = np.asarray(age, dtype=float)
+    weight_kg    = np.asarray(weight_kg, dtype=float)
+    height_m     = np.asarray(height_cm, dtype=float) / 100
+    resting_bpm  = np.asarray(resting_bpm, dtype=float)
+    workout_freq = np.asarray(workout_freq, dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bmi = np.where(height_m <= 0, 0.0, weight_kg / height_m ** 2)  # NaN (missing) stays NaN
+    max_bpm = 220 - age
+    return np.column_stack([age, weight_kg, height_m, resting_bpm, max_bpm, workout_freq, bmi])
+
+
+def score_matrix(features):
+    """(fitness probability, experience level) arrays for a feature matrix in FEATURES order, and the model version."""
+    p = _load_params()
+    features = np.asarray(features, dtype=float)
+    features = np.where(np.isnan(features), p["mean"], features)
+    scaled = (features - p["mean"]) / p["scale"]
+    logits = scaled @ p["coef"] + p["intercept"]
+    proba = 1.0 / (1.0 + np.exp(-logits))
+    #binary logistic regression predicts class 1 exactly when its probability exceeds 0.5
+    exp_level = (proba > 0.5).astype(int) + 1
+    return proba, exp_level, p["version"]
+
+
+def apply_bpm_bonus(proba, resting_bpm):
+    """Hybrid score: model probability (2 dp) plus the athletic / good resting-BPM bonus, capped at 1.0."""
+    resting_bpm = np.asarray(resting_bpm, dtype=float)
+    bonus = np.where(resting_bpm < 60, 0.3, np.where(resting_bpm < 70, 0.15, 0.0))
+    return np.round(np.minimum(1.0, np.round(proba, 2) + bonus), 2)
+
+
+def missing_inputs(profile) -> list:
+    """INPUTS the profile dict has no value for; score_profiles imputes them."""
+    return [key for key in INPUTS if profile.get(key) in (None, "")]
+
+
+def score_profiles(profiles, with_bonus=True):
+    """Score a list of profile dicts (age, weight_kg, height_cm, resting_bpm, workouts_per_week) -> (score, level, version)."""
+    if not profiles:
+        return np.empty(0), np.empty(0, dtype=int), model_version()
+    cols = {
+        key: [np.nan if p.get(key) in (None, "") else float(p[key]) for p in profiles]
+        for key in INPUTS
+    }
+    features = build_features(cols["age"], cols["weight_kg"], cols["height_cm"],
+                              cols["resting_bpm"], cols["workouts_per_week"])
+    proba, exp_level, version = score_matrix(features)
+    score = apply_bpm_bonus(proba, cols["resting_bpm"]) if with_bonus else np.round(proba, 2)
+    return score, exp_level, version
+
+
+def score_one(age, weight, height_m, resting_bpm, max_bpm, workout_freq, bmi):
+    """Single-profile helper kept for the per-user endpoints -> (probability, level, version); None inputs are imputed."""
+    proba, exp_level, version = score_matrix(np.array([[age, weight, height_m, resting_bpm, max_bpm, workout_freq, bmi]], dtype=float))
+    return float(proba[0]), int(exp_level[0]), version
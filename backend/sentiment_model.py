@@ -0,0 +1,90 @@
+#in-process journal sentiment: a bag-of-words linear model scored with plain NumPy, so a journal entry gets its score
+#without a CORTEX.SENTIMENT round trip; the authoritative Cortex score follows later (see sentiment_reconcile.py)
+#the model comes from sentiment_model.npz (see sentiment_score.py); without an export a small built-in lexicon is used
+import os
+import re
+import threading
+import numpy as np
+
+SENTIMENT_MODEL_PATH = os.getenv("SENTIMENT_MODEL_PATH", "sentiment_model.npz")
+
+_TOKEN = re.compile(r"[a-z']+")
+_NEGATIONS = {"not", "no", "never", "didn't", "don't", "wasn't", "isn't", "can't", "couldn't", "without"}
+
+#fallback weights, on the same [-1, 1] scale as CORTEX.SENTIMENT once squashed by tanh
+LEXICON = {
+    "great": 0.8, "good": 0.5, "strong": 0.6, "happy": 0.8, "energized": 0.7, "proud": 0.8, "pr": 0.5,
+    "love": 0.8, "fun": 0.6, "rested": 0.5, "better": 0.4, "accomplished": 0.8, "amazing": 0.9, "awesome": 0.9,
+    "motivated": 0.7, "calm": 0.4, "relaxed": 0.5, "excited": 0.7, "confident": 0.6, "progress": 0.4,
+    "enjoyed": 0.6, "fresh": 0.4, "crushed": 0.5, "easy": 0.3,
+    "tired": -0.5, "bad": -0.6, "stressed": -0.7, "sore": -0.3, "exhausted": -0.7, "anxious": -0.7, "sad": -0.7,
+    "pain": -0.6, "injured": -0.7, "awful": -0.9, "worse": -0.5, "burnt": -0.6, "burnout": -0.8, "skipped": -0.3,
+    "hard": -0.2, "struggled": -0.5, "frustrated": -0.7, "angry": -0.7, "overwhelmed": -0.8, "lazy": -0.4,
+    "hurt": -0.6, "sick": -0.6, "drained": -0.7, "terrible": -0.9, "depressed": -0.9, "lonely": -0.6,
+}
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def tokens(text: str):
+    """Lower-cased words, with the word after a negation marked ("not good" -> "not_good"), plus bigrams."""
+    words = _TOKEN.findall(str(text or "").lower())
+    out, negate = [], False
+    for w in words:
+        out.append(f"not_{w}" if negate else w)
+        negate = w in _NEGATIONS
+    return out + [f"{a} {b}" for a, b in zip(out, out[1:])]
+
+
+def _lexicon_model():
+    vocab = dict(LEXICON)
+    vocab.update({f"not_{w}": -0.6 * s for w, s in LEXICON.items()})
+    return {"vocab": vocab, "intercept": 0.0, "link": "tanh", "source": "lexicon", "val_mae": None}
+
+
+def load_model():
+    #vocabulary weights, loaded on first use
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if os.path.exists(SENTIMENT_MODEL_PATH):
+                    with np.load(SENTIMENT_MODEL_PATH) as npz:
+                        _model = {
+                            "vocab": dict(zip((str(t) for t in npz["vocab"]), npz["coef"].astype(float).tolist())),
+                            "intercept": float(npz["intercept"]),
+                            "link": str(npz["link"]),
+                            "source": SENTIMENT_MODEL_PATH,
+                            "val_mae": float(npz["val_mae"]) if "val_mae" in npz else None,
+                        }
+                else:
+                    _model = _lexicon_model()
+    return _model
+
+
+def score_texts(texts) -> np.ndarray:
+    """Scores in [-1, 1] for many texts at once: one weight lookup per token, one bincount to sum them per text."""
+    model = load_model()
+    vocab = model["vocab"]
+    rows, weights = [], []
+    for i, text in enumerate(texts):
+        for tok in set(tokens(text)):  # presence, not counts, like the exported vectorizer
+            w = vocab.get(tok)
+            if w is not None:
+                rows.append(i)
+                weights.append(w)
+    logits = np.bincount(np.asarray(rows, dtype=np.intp), weights=np.asarray(weights, dtype=float),
+                         minlength=len(texts)) + model["intercept"]
+    scores = np.tanh(logits) if model["link"] == "tanh" else logits
+    return np.round(np.clip(scores, -1.0, 1.0), 4)
+
+
+def score_text(text: str) -> float:
+    """Single-entry helper for the journal endpoint."""
+    return float(score_texts([text])[0])
+
+
+def model_info():
+    model = load_model()
+    return {"source": model["source"], "vocab": len(model["vocab"]), "link": model["link"], "val_mae": model["val_mae"]}
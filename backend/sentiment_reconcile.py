@@ -0,0 +1,265 @@
+#background reconciliation of locally scored journal entries: rows go into USER_JOURNALS with the in-process score,
+#then a worker fetches the authoritative CORTEX.SENTIMENT scores in batches (one SELECT over a VALUES list) and writes
+#them back with one UPDATE ... FROM VALUES; each (local, cortex) pair feeds the agreement / drift tracker
+import os
+import json
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from collections import deque
+
+import numpy as np
+
+import metrics
+from db_pool import get_conn
+from executor import run_blocking
+from sentiment_model import model_info
+
+RECONCILE_QUEUE_PATH     = os.getenv("RECONCILE_QUEUE_PATH", "")           # sqlite file; empty keeps the backlog in memory
+RECONCILE_BATCH_SIZE     = int(os.getenv("RECONCILE_BATCH_SIZE", "200"))
+RECONCILE_INTERVAL       = float(os.getenv("RECONCILE_INTERVAL", "5"))     # max seconds an entry waits for its Cortex score
+RECONCILE_MAX_ATTEMPTS   = int(os.getenv("RECONCILE_MAX_ATTEMPTS", "5"))
+SENTIMENT_TRAINING_PATH  = os.getenv("SENTIMENT_TRAINING_PATH", "")        # jsonl of reconciled pairs, the corpus for sentiment_score.py
+SENTIMENT_DRIFT_WINDOW   = int(os.getenv("SENTIMENT_DRIFT_WINDOW", "500")) # recent pairs the agreement stats cover
+SENTIMENT_DRIFT_RATIO    = float(os.getenv("SENTIMENT_DRIFT_RATIO", "1.5")) # recent MAE over baseline MAE that flags retraining
+SENTIMENT_MIN_AGREEMENT  = float(os.getenv("SENTIMENT_MIN_AGREEMENT", "0.7"))
+SENTIMENT_NEUTRAL_BAND   = float(os.getenv("SENTIMENT_NEUTRAL_BAND", "0.25")) # |score| below this counts as neutral
+
+
+def _label(score):
+    return 0 if abs(score) < SENTIMENT_NEUTRAL_BAND else (1 if score > 0 else -1)
+
+
+class AgreementTracker:
+    """Local vs Cortex over a sliding window: MAE, bias, correlation and positive/neutral/negative agreement.
+    The baseline MAE is the model's validation MAE from its export, or else the first full window seen."""
+
+    def __init__(self, window=SENTIMENT_DRIFT_WINDOW, drift_ratio=SENTIMENT_DRIFT_RATIO, min_agreement=SENTIMENT_MIN_AGREEMENT):
+        self.window = window
+        self.drift_ratio = drift_ratio
+        self.min_agreement = min_agreement
+        self._pairs = deque(maxlen=window)  # (local, cortex)
+        self._lock = threading.Lock()
+        self._total = 0
+        self._abs_err_sum = 0.0
+        self._baseline = None
+
+    def add(self, pairs):
+        with self._lock:
+            for local, cortex in pairs:
+                self._pairs.append((float(local), float(cortex)))
+                self._total += 1
+                self._abs_err_sum += abs(float(cortex) - float(local))
+            if self._baseline is None and len(self._pairs) == self.window:
+                self._baseline = model_info()["val_mae"] or self._window_mae()
+
+    def _window_mae(self):
+        a = np.asarray(self._pairs)
+        return float(np.mean(np.abs(a[:, 1] - a[:, 0])))
+
+    def stats(self):
+        with self._lock:
+            if not self._pairs:
+                return {"pairs": 0, "window": self.window}
+            a = np.asarray(self._pairs)
+            total, abs_err_sum, baseline = self._total, self._abs_err_sum, self._baseline
+        local, cortex = a[:, 0], a[:, 1]
+        mae = float(np.mean(np.abs(cortex - local)))
+        agreement = float(np.mean([_label(l) == _label(c) for l, c in a]))
+        corr = float(np.corrcoef(local, cortex)[0, 1]) if len(a) > 2 and local.std() > 0 and cortex.std() > 0 else None
+        drifted = baseline is not None and mae > baseline * self.drift_ratio
+        return {
+            "pairs": total,
+            "window": self.window,
+            "mae_all": round(abs_err_sum / total, 4),
+            "mae": round(mae, 4),
+            "bias": round(float(np.mean(cortex - local)), 4),  # > 0: the local model under-scores
+            "correlation": None if corr is None else round(corr, 4),
+            "agreement": round(agreement, 4),
+            "baseline_mae": None if baseline is None else round(baseline, 4),
+            "needs_retraining": len(a) == self.window and (drifted or agreement < self.min_agreement),
+        }
+
+
+def fetch_and_update(batch):
+    """batch: [(entry_id, user_id, created_at, text)] -> {entry_id: cortex score}; two statements per batch."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        values = ", ".join(["(%s, %s)"] * len(batch))
+        with metrics.scope("sentiment"):
+            cur.execute(f"""
+                SELECT column1, SNOWFLAKE.CORTEX.SENTIMENT(column2)
+                FROM VALUES {values}
+            """, tuple(v for entry_id, _, _, text in batch for v in (entry_id, text)))
+            scores = {r[0]: r[1] for r in cur.fetchall()}
+
+        rows = ", ".join(["(%s, %s::TIMESTAMP_NTZ, %s)"] * len(batch))
+        cur.execute(f"""
+            UPDATE USER_JOURNALS
+            SET SENTIMENT_ANALYSIS = v.SCORE
+            FROM (SELECT column1 AS USER_ID, column2 AS CREATED_AT, column3 AS SCORE
+                  FROM VALUES {rows}) v
+            WHERE USER_JOURNALS.USER_ID = v.USER_ID AND USER_JOURNALS.CREATED_AT = v.CREATED_AT
+        """, tuple(v for entry_id, user_id, created_at, _ in batch for v in (user_id, created_at, scores[entry_id])))
+        conn.commit()
+        return scores
+    finally:
+        cur.close()
+        conn.close()
+
+
+class SentimentReconciler:
+    def __init__(self, path=RECONCILE_QUEUE_PATH, batch_size=RECONCILE_BATCH_SIZE, interval=RECONCILE_INTERVAL,
+                 max_attempts=RECONCILE_MAX_ATTEMPTS, sink=fetch_and_update, tracker=None):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.durable = bool(path)
+        self.tracker = tracker or AgreementTracker()
+        self._sink = sink
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS reconcile_queue (
+                entry_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, created_at TEXT, text TEXT,
+                local_score REAL, attempts INTEGER DEFAULT 0, taken INTEGER DEFAULT 0
+            )
+        """)
+        #a batch that was in flight when the process died is retried
+        self._db.execute("UPDATE reconcile_queue SET taken = 0")
+        self._db.commit()
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+        self._stopping = False
+        self.on_reconciled = []  # callbacks([(user_id, local_score, cortex_score)]), e.g. cache / trend invalidation
+        self._stats = {"submitted": 0, "reconciled": 0, "dropped": 0, "batches": 0, "batch_errors": 0, "lag_ms_max": 0.0}
+
+    def submit(self, user_id: str, created_at: str, text: str, local_score: float):
+        """Queue a row just written with its local score; created_at is the exact CREATED_AT value inserted."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO reconcile_queue (user_id, created_at, text, local_score) VALUES (?, ?, ?, ?)",
+                (user_id, created_at, text, local_score),
+            )
+            self._db.commit()
+            self._stats["submitted"] += 1
+            pending = self._db.execute("SELECT COUNT(*) FROM reconcile_queue WHERE taken = 0").fetchone()[0]
+        if pending >= self.batch_size and self._wakeup is not None:
+            # called from executor threads (the journal insert runs under run_blocking); Event isn't thread-safe
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM reconcile_queue").fetchone()[0]
+
+    def _take_batch(self):
+        with self._lock:
+            batch = self._db.execute(
+                "SELECT entry_id, user_id, created_at, text, local_score FROM reconcile_queue WHERE taken = 0 ORDER BY entry_id LIMIT ?",
+                (self.batch_size,),
+            ).fetchall()
+            self._db.executemany("UPDATE reconcile_queue SET taken = 1 WHERE entry_id = ?", [(row[0],) for row in batch])
+            self._db.commit()
+            return batch
+
+    def _done(self, batch):
+        with self._lock:
+            self._db.executemany("DELETE FROM reconcile_queue WHERE entry_id = ?", [(row[0],) for row in batch])
+            self._db.commit()
+
+    def _failed_attempt(self, batch):
+        ids = [row[0] for row in batch]
+        marks = ", ".join("?" * len(ids))
+        with self._lock:
+            self._db.execute(f"UPDATE reconcile_queue SET attempts = attempts + 1, taken = 0 WHERE entry_id IN ({marks})", ids)
+            # the row keeps its local score; give up on it rather than retry forever
+            self._stats["dropped"] += self._db.execute(
+                f"DELETE FROM reconcile_queue WHERE attempts >= ? AND entry_id IN ({marks})", (self.max_attempts, *ids)
+            ).rowcount
+            self._db.commit()
+
+    async def flush(self) -> int:
+        """Reconcile one batch; returns how many entries got their Cortex score."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        self._stats["batches"] += 1
+        try:
+            scores = await run_blocking("db", self._sink, [(entry_id, user_id, created_at, text)
+                                                           for entry_id, user_id, created_at, text, _ in batch])
+        except Exception as e:
+            self._stats["batch_errors"] += 1
+            print(f"[ERROR] Sentiment reconciliation of {len(batch)} entries failed: {str(e)}")
+            self._failed_attempt(batch)
+            return 0
+        self._done(batch)
+        entries = [(user_id, local, scores[entry_id]) for entry_id, user_id, _, _, local in batch if scores.get(entry_id) is not None]
+        self.tracker.add([(local, cortex) for _, local, cortex in entries])
+        self._stats["reconciled"] += len(entries)
+        self._stats["lag_ms_max"] = max(self._stats["lag_ms_max"], self._lag_ms(batch[0][2]))
+        if SENTIMENT_TRAINING_PATH:
+            _record([(text, local, scores[entry_id]) for entry_id, _, _, text, local in batch if scores.get(entry_id) is not None])
+        for callback in self.on_reconciled:
+            callback(entries)
+        return len(entries)
+
+    @staticmethod
+    def _lag_ms(created_at):
+        # created_at is naive UTC, as written by the journal endpoint
+        try:
+            return round((datetime.utcnow() - datetime.fromisoformat(created_at)).total_seconds() * 1000, 1)
+        except ValueError:
+            return 0.0
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while await self.flush() >= self.batch_size:
+                pass
+        #shutting down: one last pass; anything still left stays queued when the queue is durable
+        await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+
+    def stats(self):
+        return {
+            "model": model_info(),
+            "pending": self.pending(),
+            "batch_size": self.batch_size,
+            "interval": self.interval,
+            "durable": self.durable,
+            **self._stats,
+            "agreement": self.tracker.stats(),
+        }
+
+
+_record_lock = threading.Lock()
+
+
+def _record(pairs):
+    with _record_lock, open(SENTIMENT_TRAINING_PATH, "a", encoding="utf-8") as f:
+        for text, local, cortex in pairs:
+            f.write(json.dumps({"text": text, "cortex": cortex, "local": local}, ensure_ascii=False) + "\n")
+
+
+sentiment_reconciler = SentimentReconciler()
@@ -0,0 +1,87 @@
+#local journal sentiment model: ridge regression on bag-of-words presence features, fitted to CORTEX.SENTIMENT scores
+#usage: python sentiment_score.py --pairs reconciled.jsonl      train on the pairs the reconciler records (SENTIMENT_TRAINING_PATH)
+#       python sentiment_score.py --from-snowflake [--days N]   train on USER_JOURNALS rows old enough to be reconciled
+#either way the result is exported to sentiment_model.npz for sentiment_model.py; sklearn is only needed here
+import sys
+import json
+import argparse
+import numpy as np
+
+from sentiment_model import tokens
+
+MIN_DF = 3  # tokens seen in fewer entries are dropped from the vocabulary
+
+
+def load_pairs(path):
+    texts, scores = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            texts.append(row["text"])
+            scores.append(float(row["cortex"]))
+    return texts, scores
+
+
+def load_snowflake(min_age_days=1, limit=200_000):
+    #rows written in local mode carry the local score until reconciled, so skip the most recent ones
+    from db_pool import get_conn
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT JOURNAL, CAST(SENTIMENT_ANALYSIS AS FLOAT)
+            FROM USER_JOURNALS
+            WHERE CREATED_AT < DATEADD(day, -%s, CURRENT_TIMESTAMP()) AND SENTIMENT_ANALYSIS IS NOT NULL
+            ORDER BY CREATED_AT DESC
+            LIMIT %s
+        """, (min_age_days, limit))
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    return [r[0] for r in rows], [float(r[1]) for r in rows]
+
+
+def train(texts, scores, alpha=1.0):
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.linear_model import Ridge
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_absolute_error
+
+    #the analyzer is the runtime tokenizer, so training and serving see identical features
+    vectorizer = CountVectorizer(analyzer=tokens, binary=True, min_df=MIN_DF)
+    X = vectorizer.fit_transform(texts)
+    y = np.clip(np.asarray(scores, dtype=float), -1.0, 1.0)
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model = Ridge(alpha=alpha)
+    model.fit(X_train, y_train)
+
+    val_mae = mean_absolute_error(y_test, np.clip(model.predict(X_test), -1.0, 1.0))
+    print(f"Validation MAE vs Cortex: {val_mae:.4f} ({len(texts)} entries, {len(vectorizer.vocabulary_)} tokens)")
+    return vectorizer, model, val_mae
+
+
+def export_npz(vectorizer, model, val_mae, path="sentiment_model.npz"):
+    vocab = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    coef = np.asarray(model.coef_, dtype=float).ravel()
+    keep = np.abs(coef) > 1e-6  # zero-weight tokens would only slow the lookups down
+    np.savez(path, vocab=np.array(vocab)[keep], coef=coef[keep], intercept=float(model.intercept_),
+             link="identity", val_mae=val_mae)
+    print(f"Sentiment model exported to {path} ({int(keep.sum())} weighted tokens).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the local sentiment model to Cortex scores and export it")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pairs", help="jsonl of {text, cortex, local} written by the reconciler")
+    source.add_argument("--from-snowflake", action="store_true")
+    parser.add_argument("--days", type=int, default=1, help="with --from-snowflake: skip rows newer than this")
+    parser.add_argument("--alpha", type=float, default=1.0)
+    parser.add_argument("--out", default="sentiment_model.npz")
+    args = parser.parse_args()
+
+    texts, scores = load_pairs(args.pairs) if args.pairs else load_snowflake(args.days)
+    if len(texts) < 50:
+        sys.exit(f"only {len(texts)} labelled entries; need at least 50 to train")
+    export_npz(*train(texts, scores, args.alpha), path=args.out)
@@ -0,0 +1,275 @@
+#per-user rolling sentiment aggregates, updated on every journal insert so trend queries never rescan USER_JOURNALS
+#each window keeps running sums (n, Σt, Σy, Σt², Σty) over a deque of its entries: mean and least-squares slope are O(1),
+#eviction of entries that fall out of the window is amortized O(1)
+#users are held in an LRU bounded by TREND_MAX_USERS and dropped after TREND_IDLE_TTL seconds untouched; an evicted
+#user is rebuilt from USER_JOURNALS on their next summary; a score recorded while that rebuild is loading may be missing
+#from its snapshot, so such a rebuild is loaded again rather than cached
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+from db_pool import get_conn
+from executor import run_blocking
+
+TREND_WINDOWS          = tuple(int(w) for w in os.getenv("TREND_WINDOWS", "7,30,90").split(","))  # days
+TREND_EWMA_ALPHA       = float(os.getenv("TREND_EWMA_ALPHA", "0.3"))
+BURNOUT_DECLINE_STREAK = int(os.getenv("BURNOUT_DECLINE_STREAK", "3"))     # consecutive lower entries
+BURNOUT_EWMA_FLOOR     = float(os.getenv("BURNOUT_EWMA_FLOOR", "-0.2"))    # CORTEX.SENTIMENT is in [-1, 1]
+BURNOUT_SLOPE_FLOOR    = float(os.getenv("BURNOUT_SLOPE_FLOOR", "-0.02"))  # sentiment change per day over 7 days
+TREND_MAX_USERS        = int(os.getenv("TREND_MAX_USERS", "10000"))        # users whose aggregates are kept in memory
+TREND_IDLE_TTL         = float(os.getenv("TREND_IDLE_TTL", "86400"))       # seconds without a read or write before eviction
+
+DAY = 86400.0
+
+_JOURNAL_SCORES_SQL = """
+    SELECT USER_ID, DATE_PART(EPOCH_SECOND, CREATED_AT), CAST(SENTIMENT_ANALYSIS AS FLOAT)
+    FROM USER_JOURNALS
+    WHERE CREATED_AT >= DATEADD(day, -%s, CURRENT_TIMESTAMP()) {user_filter}
+    ORDER BY USER_ID, CREATED_AT
+"""
+
+
+class _Window:
+    __slots__ = ("days", "entries", "n", "st", "sy", "stt", "sty")
+
+    def __init__(self, days):
+        self.days = days
+        self.entries = deque()  # (t, y), oldest at the left; t is in days since the user's origin
+        self.n = 0
+        self.st = self.sy = self.stt = self.sty = 0.0
+
+    def add(self, t, y):
+        self.entries.append((t, y))
+        self.n += 1
+        self.st += t
+        self.sy += y
+        self.stt += t * t
+        self.sty += t * y
+
+    def evict(self, now_t):
+        while self.entries and self.entries[0][0] < now_t - self.days:
+            t, y = self.entries.popleft()
+            self.n -= 1
+            self.st -= t
+            self.sy -= y
+            self.stt -= t * t
+            self.sty -= t * y
+
+    def mean(self):
+        return self.sy / self.n if self.n else None
+
+    def slope(self):
+        #least-squares slope of sentiment against time, in sentiment units per day
+        denom = self.n * self.stt - self.st * self.st
+        if self.n < 2 or abs(denom) < 1e-12:
+            return None
+        return (self.n * self.sty - self.st * self.sy) / denom
+
+
+class UserTrend:
+    def __init__(self, origin_ts):
+        self.origin_ts = origin_ts
+        self.windows = {days: _Window(days) for days in TREND_WINDOWS}
+        self.ewma = None
+        self.last = None
+        self.decline_streak = 0
+        self.count = 0
+        self.updated_at = origin_ts
+
+    def _t(self, ts):
+        return (ts - self.origin_ts) / DAY
+
+    def add(self, ts, score):
+        score = float(score)
+        t = self._t(ts)
+        for window in self.windows.values():
+            window.add(t, score)
+            window.evict(t)
+        self.ewma = score if self.ewma is None else TREND_EWMA_ALPHA * score + (1 - TREND_EWMA_ALPHA) * self.ewma
+        self.decline_streak = self.decline_streak + 1 if self.last is not None and score < self.last else 0
+        self.last = score
+        self.count += 1
+        self.updated_at = ts
+
+    def summary(self, days, now):
+        window = self.windows[days]
+        window.evict(self._t(now))
+        short = self.windows[min(self.windows)]
+        short.evict(self._t(now))
+        slope = window.slope()
+        short_slope = short.slope()
+
+        reasons = []
+        if self.decline_streak >= BURNOUT_DECLINE_STREAK:
+            reasons.append(f"{self.decline_streak} consecutive declining entries")
+        if self.ewma is not None and self.ewma < BURNOUT_EWMA_FLOOR:
+            reasons.append("smoothed sentiment below floor")
+        if short_slope is not None and short_slope < BURNOUT_SLOPE_FLOOR:
+            reasons.append(f"sentiment falling over the last {short.days} days")
+
+        return {
+            "window_days": days,
+            "count": window.n,
+            "mean": _round(window.mean()),
+            "slope_per_day": _round(slope),
+            "ewma": _round(self.ewma),
+            "latest": _round(self.last),
+            "decline_streak": self.decline_streak,
+            "burnout_risk": len(reasons) >= 2 or self.decline_streak >= BURNOUT_DECLINE_STREAK + 2,
+            "burnout_signals": reasons,
+            "updated_at": self.updated_at,
+        }
+
+
+def _round(value, digits=4):
+    return None if value is None else round(value, digits)
+
+
+def load_scores(user_id=None, days=max(TREND_WINDOWS)):
+    """Blocking read of (user_id, epoch seconds, score) rows, ordered for a single folding pass."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        if user_id is None:
+            cur.execute(_JOURNAL_SCORES_SQL.format(user_filter=""), (days,))
+        else:
+            cur.execute(_JOURNAL_SCORES_SQL.format(user_filter="AND USER_ID = %s"), (days, user_id))
+        while True:
+            rows = cur.fetchmany(5000)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cur.close()
+        conn.close()
+
+
+class TrendStore:
+    def __init__(self, loader=load_scores, clock=time.time, max_users=TREND_MAX_USERS, idle_ttl=TREND_IDLE_TTL):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._users = OrderedDict()  # user_id -> [UserTrend, last used], least recently used at the left
+        self._lock = threading.Lock()
+        self._loader = loader
+        self._clock = clock
+        self._rebuilding = {}  # user_id -> [per-load count of scores record() skipped meanwhile]
+        self._stats = {"updates": 0, "rebuilds": 0, "rebuild_retries": 0, "backfills": 0, "evictions": 0}
+
+    def _touch(self, user_id, now):
+        #lock held; the user's UserTrend or None, marked as just used
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        if entry[1] <= now - self.idle_ttl:
+            del self._users[user_id]
+            self._stats["evictions"] += 1
+            return None
+        entry[1] = now
+        self._users.move_to_end(user_id)
+        return entry[0]
+
+    def _put(self, user_id, trend, now):
+        #lock held
+        self._users[user_id] = [trend, now]
+        self._users.move_to_end(user_id)
+        self._trim(now)
+
+    def _trim(self, now):
+        #lock held; over capacity, or idle past the TTL, from the least recently used end
+        while self._users:
+            user_id, (_, used) = next(iter(self._users.items()))
+            if len(self._users) <= self.max_users and used > now - self.idle_ttl:
+                break
+            del self._users[user_id]
+            self._stats["evictions"] += 1
+
+    def record(self, user_id: str, score, ts=None):
+        """Fold one new journal score in. Users not loaded yet are skipped: their rebuild will read the new row."""
+        if score is None:
+            return
+        with self._lock:
+            now = self._clock()
+            trend = self._touch(user_id, now)
+            if trend is not None:
+                trend.add(now if ts is None else ts, score)
+                self._stats["updates"] += 1
+            else:
+                for missed in self._rebuilding.get(user_id, ()):
+                    missed[0] += 1
+
+    def forget(self, user_id: str):
+        """Drop a user's aggregates, e.g. after stored scores were corrected; the next summary rebuilds them."""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def _fold(self, rows):
+        users = {}
+        for user_id, ts, score in rows:
+            if score is None:
+                continue
+            ts = float(ts)
+            trend = users.get(user_id)
+            if trend is None:
+                trend = users[user_id] = UserTrend(ts)
+            trend.add(ts, score)
+        return users
+
+    def _rebuild_user(self, user_id, attempts=3):
+        for _ in range(attempts):
+            missed = [0]
+            with self._lock:
+                self._rebuilding.setdefault(user_id, []).append(missed)
+            try:
+                users = self._fold(self._loader(user_id))
+            finally:
+                with self._lock:
+                    loads = self._rebuilding[user_id]
+                    loads.remove(missed)
+                    if not loads:
+                        del self._rebuilding[user_id]
+            trend = users.get(user_id) or UserTrend(self._clock())
+            with self._lock:
+                if missed[0]:
+                    # the snapshot may predate the skipped scores: caching it would lose them until the next eviction
+                    self._stats["rebuild_retries"] += 1
+                    continue
+                now = self._clock()
+                current = self._touch(user_id, now)
+                if current is not None:
+                    return current  # a concurrent rebuild got there first, and may already hold newer scores
+                self._put(user_id, trend, now)
+                self._stats["rebuilds"] += 1
+                return trend
+        return trend  # still racing with writes: serve this snapshot uncached, the next summary loads again
+
+    def backfill(self):
+        """Rebuild every user from USER_JOURNALS in one ordered pass (blocking).
+        Only the most recently active TREND_MAX_USERS are kept; the rest rebuild on demand."""
+        users = self._fold(self._loader())
+        with self._lock:
+            now = self._clock()
+            for user_id, trend in sorted(users.items(), key=lambda item: item[1].updated_at):
+                self._users[user_id] = [trend, now]
+                self._users.move_to_end(user_id)
+            self._trim(now)
+            self._stats["backfills"] += 1
+        return len(users)
+
+    async def summary(self, user_id: str, days: int):
+        if days not in TREND_WINDOWS:
+            raise ValueError(f"window must be one of {list(TREND_WINDOWS)}")
+        with self._lock:
+            trend = self._touch(user_id, self._clock())
+        if trend is None:
+            trend = await run_blocking("db", self._rebuild_user, user_id)
+        with self._lock:
+            return {"user_id": user_id, **trend.summary(days, self._clock())}
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "max_users": self.max_users, "idle_ttl": self.idle_ttl,
+                    "windows": list(TREND_WINDOWS), **self._stats}
+
+
+trend_store = TrendStore()
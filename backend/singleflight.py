@@ -0,0 +1,58 @@
+#single-flight coalescing: concurrent identical requests (double-clicks, React re-renders) share one in-flight computation
+#keyed on (endpoint, user_id, normalized payload); the first caller runs the work, the rest await the same task
+import os
+import json
+import asyncio
+import hashlib
+
+from deadline import detach
+
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", "60"))  # seconds any one caller waits
+
+
+def flight_key(endpoint: str, user_id, payload=None) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str) if payload is not None else ""
+    return f"{endpoint}:{user_id}:{hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]}"
+
+
+class SingleFlight:
+    def __init__(self, timeout=SINGLEFLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._flights = {}  # key -> asyncio.Task; only touched from the event loop, so no lock
+        self._stats = {}    # endpoint -> counters
+
+    def _bump(self, endpoint, field):
+        s = self._stats.setdefault(endpoint, {"executed": 0, "coalesced": 0, "errors": 0, "timeouts": 0})
+        s[field] += 1
+
+    async def do(self, endpoint: str, user_id, payload, fn):
+        """Await fn() (a coroutine function), or the identical call already in flight. The result is shared
+        between callers, so treat it as read-only; an exception reaches every waiter."""
+        key = flight_key(endpoint, user_id, payload)
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(detach(fn))
+            self._flights[key] = task
+            task.add_done_callback(lambda t, key=key, endpoint=endpoint: self._landed(key, endpoint, t))
+            self._bump(endpoint, "executed")
+        else:
+            self._bump(endpoint, "coalesced")
+        try:
+            # shield: one caller timing out or disconnecting must not cancel the work the others wait on
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self._bump(endpoint, "timeouts")
+            raise
+
+    def _landed(self, key, endpoint, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # retrieving the exception here also keeps a flight every caller gave up on from logging it as unhandled
+        if not task.cancelled() and task.exception() is not None:
+            self._bump(endpoint, "errors")
+
+    def stats(self):
+        return {"in_flight": len(self._flights), "timeout": self.timeout, **{e: dict(s) for e, s in self._stats.items()}}
+
+
+singleflight = SingleFlight()
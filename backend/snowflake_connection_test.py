@@ -1,8 +1,9 @@
 import os
 from fastapi import FastAPI, HTTPException
 from dotenv import load_dotenv
-from snowflake.sqlalchemy import URL
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from db_pool import get_engine, get_pool
 
 # Load environment variables from .env
 load_dotenv()
@@ -10,20 +11,10 @@ load_dotenv()
 app = FastAPI()
 
 def get_snowflake_conn():
-    # Construct the connection URL
+    # Shared engine backed by the same connection pool as main.py
     # IMPORTANT: Ensure SNOWFLAKE_ACCOUNT in .env does NOT include 'snowflakecomputing.com'
-    url = URL(
-        account=os.getenv("SNOWFLAKE_ACCOUNT"),
-        user=os.getenv("SNOWFLAKE_USER"),
-        password=os.getenv("SNOWFLAKE_PASSWORD"),
-        database=os.getenv("SNOWFLAKE_DATABASE"),
-        schema=os.getenv("SNOWFLAKE_SCHEMA"),
-        warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
-        role=os.getenv("SNOWFLAKE_ROLE"),
-    )
-    # Using echo=True will log all SQL commands to your terminal (great for debugging)
-    engine = create_engine(url, echo=True)
-    return engine
+    # Set SNOWFLAKE_SQL_ECHO=1 to log all SQL commands to your terminal (great for debugging)
+    return get_engine()
 
 @app.get("/")
 async def root():
@@ -44,7 +35,8 @@ async def test_snowflake():
                 "status": "Connected Successfully!",
                 "snowflake_version": version_result[0],
                 "database": os.getenv("SNOWFLAKE_DATABASE"),
-                "table_found": True if table_check else False
+                "table_found": True if table_check else False,
+                "pool": get_pool().stats(),
             }
     except Exception as e:
         # If this fails, check your .env credentials or Network Policy in Snowflake
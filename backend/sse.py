@@ -0,0 +1,86 @@
+#Server-Sent Events helpers: event framing, a StreamingResponse wrapper and time-to-first-byte accounting
+import os
+import json
+import time
+import asyncio
+import threading
+from fastapi.responses import StreamingResponse
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # stop nginx-style proxies from buffering the stream
+}
+
+SSE_PROGRESS_INTERVAL = float(os.getenv("SSE_PROGRESS_INTERVAL", "2"))  # seconds between progress events while waiting
+
+_latency = {}  # stream name -> {"count", "ttfb_ms_sum", "total_ms_sum", "ttfb_ms_max", "total_ms_max"}
+_latency_lock = threading.Lock()
+
+
+def sse_event(event: str, data) -> str:
+    payload = json.dumps(data, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def _record(name, ttfb_ms, total_ms):
+    with _latency_lock:
+        s = _latency.setdefault(name, {"count": 0, "ttfb_ms_sum": 0.0, "total_ms_sum": 0.0,
+                                       "ttfb_ms_max": 0.0, "total_ms_max": 0.0})
+        s["count"] += 1
+        s["ttfb_ms_sum"] += ttfb_ms
+        s["total_ms_sum"] += total_ms
+        s["ttfb_ms_max"] = max(s["ttfb_ms_max"], ttfb_ms)
+        s["total_ms_max"] = max(s["total_ms_max"], total_ms)
+
+
+async def await_with_progress(stage: str, awaitable, result: dict, interval: float = SSE_PROGRESS_INTERVAL):
+    """Yield ("progress", ...) events until `awaitable` finishes; its value is stored in result["value"]."""
+    task = asyncio.ensure_future(awaitable)
+    started = time.perf_counter()
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=interval)
+            if done:
+                break
+            yield "progress", {"stage": stage, "elapsed_ms": round((time.perf_counter() - started) * 1000)}
+        result["value"] = task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+async def _framed(name, events):
+    #events is an async generator of (event, data); a final "done" event carries the latency numbers
+    started = time.perf_counter()
+    ttfb_ms = None
+    try:
+        async for event, data in events:
+            if ttfb_ms is None:
+                ttfb_ms = (time.perf_counter() - started) * 1000
+            yield sse_event(event, data)
+    except Exception as e:
+        print(f"[ERROR] Stream {name} failed: {str(e)}")
+        yield sse_event("error", {"message": str(e)})
+    total_ms = (time.perf_counter() - started) * 1000
+    if ttfb_ms is None:
+        ttfb_ms = total_ms
+    _record(name, ttfb_ms, total_ms)
+    yield sse_event("done", {"ttfb_ms": round(ttfb_ms, 1), "total_ms": round(total_ms, 1)})
+
+
+def sse_response(name: str, events) -> StreamingResponse:
+    return StreamingResponse(_framed(name, events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+def stats():
+    with _latency_lock:
+        return {
+            name: {
+                "count": s["count"],
+                "ttfb_ms_avg": round(s["ttfb_ms_sum"] / s["count"], 1),
+                "total_ms_avg": round(s["total_ms_sum"] / s["count"], 1),
+                "ttfb_ms_max": round(s["ttfb_ms_max"], 1),
+                "total_ms_max": round(s["total_ms_max"], 1),
+            }
+            for name, s in _latency.items()
+        }
@@ -59,7 +59,7 @@ You are an Analytical Wellness Optimizer. Your role is to provide objective feed
 
 Input Data:
 User Journal Summary: {cleaned_text}
-Sentiment Score: {cortex_score}
+Sentiment Score: {sentiment_score} (source: {score_source}; "local" is an in-process lexicon estimate, "cortex" is Snowflake Cortex SENTIMENT)
 Recorded Interests: {user_goals_and_activities}
 
 Task:
@@ -92,24 +92,46 @@ SCHEDULE_SCHEMA = """
 ]
 """
 
-SCHEDULE_GENERATOR_PROMPT = f"""
+SCHEDULE_REFINE_PROMPT = """
 ROLE: You are an Elite Performance Coach.
 
-TASK: Create a 7-day training schedule based on the user's Fitness Score, Broad Goal, and Availability.
+TASK: Personalize the draft 7-day training schedule below for this user. Keep the same training days and rest days unless the availability clearly requires a change.
 
 INPUTS:
-- Fitness Score: {{fitness_score}} (0.0 is Beginner, 1.0 is Pro)
-- Goal: {{broad_goal}}
-- Availability: {{availability}}
+- Fitness Score: {fitness_score} (0.0 is Beginner, 1.0 is Pro)
+- Goal: {broad_goal}
+- Specific Objectives: {goals}
+- Availability: {availability}
+- Injuries / Limitations: {injuries}
+
+DRAFT SCHEDULE:
+{draft}
 
 CRITICAL INSTRUCTIONS:
-- Match the workout intensity to the Fitness Score
-- Respect the user's availability string
-- Return ONLY the JSON array with 7 days
+- Adjust activities, durations and focus to the specific objectives and limitations
+- Keep every field of each day object, and keep all 7 days in order
+- Return ONLY the JSON array
 - No conversational text, no preamble, no explanation
+"""
+
+ONBOARD_STATE_PROMPT = """
+ONBOARDING STATE (the earlier conversation, already summarized):
+{collected}
+
+Earlier user messages not yet matched to a slot:
+{unsorted}
 
-SCHEMA TO FOLLOW:
-{SCHEDULE_SCHEMA}
+Your last question asked about: {answering}
+Slots still needed: {missing}
 
-Output 7 days following this exact structure.
-"""
\ No newline at end of file
+Continue the CONVERSATION FLOW from this point. Until every slot is collected, reply with ONLY this JSON object, no markdown:
+{{"filled": {{"<slot>": "<the user's answer, in their words>"}}, "reply": "<your next message to the user>"}}
+
+RULES FOR "filled":
+- Slots are broad_goal, objectives, schedule and injuries.
+- Include a slot only if the user's next message (or an unmatched earlier message) actually answers it.
+- One message can answer several slots, or none: if the user asks a clarifying question or goes off topic, answer or re-ask in "reply" and leave "filled" empty.
+- A slot the user corrects can be filled again.
+
+When the user's next message completes every slot, output the final JSON from the schema instead, using the answers above and that message.
+"""
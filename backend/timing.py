@@ -0,0 +1,37 @@
+#per-stage wall-clock timings for a request, reported through the Server-Timing response header (and to /metrics)
+import time
+from contextlib import contextmanager
+
+import metrics
+
+
+class StageTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # stage name -> duration in ms, in completion order
+
+    async def timed(self, name: str, awaitable):
+        """Await `awaitable` and record how long it took under `name`."""
+        t0 = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = (time.perf_counter() - t0) * 1000
+            metrics.record_stage(name, self.stages[name] / 1000)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (time.perf_counter() - t0) * 1000
+            metrics.record_stage(name, self.stages[name] / 1000)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self) -> str:
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
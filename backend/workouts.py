@@ -0,0 +1,190 @@
+#append-only workout event log with per-user weekly rollups maintained on write
+#readers (/workout_stats, /dashboard, /workout_history) only ever touch the rollup rows, never the events
+#backends: "snowflake" (WORKOUT_EVENTS + WORKOUT_WEEKLY) or "sqlite" (a local stand-in used by bench_workouts.py)
+import os
+import uuid
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from db_pool import get_conn
+
+WORKOUT_STORE      = os.getenv("WORKOUT_STORE", "snowflake")
+WORKOUT_STORE_PATH = os.getenv("WORKOUT_STORE_PATH", "workouts.sqlite3")
+
+SNOWFLAKE_DDL = [
+    """CREATE TABLE IF NOT EXISTS WORKOUT_EVENTS (
+        EVENT_ID STRING, USER_ID STRING, COMPLETED_AT TIMESTAMP_NTZ,
+        WEEK_START DATE, ACTIVITY STRING, DURATION_MIN NUMBER
+    )""",
+    """CREATE TABLE IF NOT EXISTS WORKOUT_WEEKLY (
+        USER_ID STRING, WEEK_START DATE, COMPLETED NUMBER, MINUTES NUMBER,
+        PRIMARY KEY (USER_ID, WEEK_START)
+    )""",
+]
+
+WEEK_COMPLETED_SQL = "SELECT COALESCE(SUM(COMPLETED), 0) FROM WORKOUT_WEEKLY WHERE USER_ID = %s AND WEEK_START = %s"
+
+
+def _utc_naive(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def week_start(day) -> date:
+    """Monday of the ISO week containing `day`."""
+    if isinstance(day, datetime):
+        day = _utc_naive(day).date()
+    return day - timedelta(days=day.weekday())
+
+
+def _rows_and_deltas(events):
+    #events are data_structure.WorkoutEvent; the rollup delta is aggregated per (user, week) before it is written
+    rows = []
+    deltas = defaultdict(lambda: [0, 0])
+    for e in events:
+        completed_at = _utc_naive(e.completed_at)
+        week = week_start(completed_at)
+        rows.append(("wkt_" + uuid.uuid4().hex[:16], e.user_id, completed_at, week, e.activity, e.duration_min))
+        delta = deltas[(e.user_id, week)]
+        delta[0] += 1
+        delta[1] += e.duration_min
+    return rows, deltas
+
+
+class SnowflakeWorkoutStore:
+    def __init__(self):
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    def _ensure_schema(self, cur):
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    for ddl in SNOWFLAKE_DDL:
+                        cur.execute(ddl)
+                    self._schema_ready = True
+
+    def log_events(self, events) -> int:
+        """Multi-row INSERT of the events plus one MERGE of the per-week deltas, in a single transaction."""
+        rows, deltas = _rows_and_deltas(events)
+        if not rows:
+            return 0
+        conn = get_conn()
+        cur = conn.cursor()
+        try:
+            self._ensure_schema(cur)
+            event_values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+            delta_values = ", ".join(["(%s, %s, %s, %s)"] * len(deltas))
+            sql = f"""
+                BEGIN;
+                INSERT INTO WORKOUT_EVENTS (EVENT_ID, USER_ID, COMPLETED_AT, WEEK_START, ACTIVITY, DURATION_MIN)
+                    VALUES {event_values};
+                MERGE INTO WORKOUT_WEEKLY w
+                USING (SELECT column1 AS USER_ID, column2::DATE AS WEEK_START, column3 AS COMPLETED, column4 AS MINUTES
+                       FROM VALUES {delta_values}) d
+                ON w.USER_ID = d.USER_ID AND w.WEEK_START = d.WEEK_START
+                WHEN MATCHED THEN UPDATE SET COMPLETED = w.COMPLETED + d.COMPLETED, MINUTES = w.MINUTES + d.MINUTES
+                WHEN NOT MATCHED THEN INSERT (USER_ID, WEEK_START, COMPLETED, MINUTES)
+                    VALUES (d.USER_ID, d.WEEK_START, d.COMPLETED, d.MINUTES);
+                COMMIT;
+            """
+            params = [v for row in rows for v in row]
+            for (user_id, week), (completed, minutes) in deltas.items():
+                params.extend((user_id, week, completed, minutes))
+            cur.execute(sql, tuple(params), num_statements=4)
+            return len(rows)
+        except Exception:
+            try:
+                cur.execute("ROLLBACK")
+            except Exception:
+                pass
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def week_completed_statement(self, cur, user_id: str, today=None):
+        """(sql, params) for this week's completed count, so a caller can batch it with its own statements."""
+        self._ensure_schema(cur)
+        return WEEK_COMPLETED_SQL, (user_id, week_start(today or datetime.utcnow()))
+
+    def weeks(self, user_id: str, first_week: date, last_week: date):
+        """{week_start: (completed, minutes)} for the rollup rows in [first_week, last_week]."""
+        conn = get_conn()
+        cur = conn.cursor()
+        try:
+            self._ensure_schema(cur)
+            cur.execute("""
+                SELECT WEEK_START, COMPLETED, MINUTES FROM WORKOUT_WEEKLY
+                WHERE USER_ID = %s AND WEEK_START BETWEEN %s AND %s
+            """, (user_id, first_week, last_week))
+            return {r[0]: (int(r[1]), int(r[2])) for r in cur.fetchall()}
+        finally:
+            cur.close()
+            conn.close()
+
+
+class SqliteWorkoutStore:
+    def __init__(self, path=WORKOUT_STORE_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS workout_events (
+            event_id TEXT, user_id TEXT, completed_at TEXT, week_start TEXT, activity TEXT, duration_min INTEGER)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS workout_weekly (
+            user_id TEXT, week_start TEXT, completed INTEGER, minutes INTEGER, PRIMARY KEY (user_id, week_start))""")
+        self._db.commit()
+
+    def log_events(self, events) -> int:
+        rows, deltas = _rows_and_deltas(events)
+        if not rows:
+            return 0
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO workout_events VALUES (?, ?, ?, ?, ?, ?)",
+                [(eid, uid, at.isoformat(), week.isoformat(), activity, minutes)
+                 for eid, uid, at, week, activity, minutes in rows],
+            )
+            self._db.executemany("""
+                INSERT INTO workout_weekly VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, week_start) DO UPDATE
+                SET completed = completed + excluded.completed, minutes = minutes + excluded.minutes
+            """, [(uid, week.isoformat(), c, m) for (uid, week), (c, m) in deltas.items()])
+            self._db.commit()
+        return len(rows)
+
+    def week_completed_statement(self, cur, user_id: str, today=None):
+        return None  # local file: read it with current_week_completed(), no round trip to batch
+
+    def weeks(self, user_id: str, first_week: date, last_week: date):
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT week_start, completed, minutes FROM workout_weekly
+                WHERE user_id = ? AND week_start BETWEEN ? AND ?
+            """, (user_id, first_week.isoformat(), last_week.isoformat())).fetchall()
+        return {date.fromisoformat(r[0]): (r[1], r[2]) for r in rows}
+
+
+def week_range(user_id: str, weeks: int, store=None, today=None):
+    """Zero-filled [(week_start, completed, minutes)] for the last `weeks` weeks, oldest first (blocking)."""
+    store = store or workout_store
+    last = week_start(today or datetime.utcnow())
+    first = last - timedelta(weeks=weeks - 1)
+    found = store.weeks(user_id, first, last)
+    return [(first + timedelta(weeks=i),) + found.get(first + timedelta(weeks=i), (0, 0)) for i in range(weeks)]
+
+
+def current_week_completed(user_id: str, store=None) -> int:
+    return week_range(user_id, 1, store)[0][1]
+
+
+def _make_store():
+    if WORKOUT_STORE == "sqlite":
+        return SqliteWorkoutStore()
+    if WORKOUT_STORE == "snowflake":
+        return SnowflakeWorkoutStore()
+    raise ValueError(f"unknown WORKOUT_STORE: {WORKOUT_STORE}")
+
+
+workout_store = _make_store()
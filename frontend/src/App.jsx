@@ -32,6 +32,9 @@ function App() {
   // State to store partial profile data from chat
   const [partialProfile, setPartialProfile] = useState(null);
 
+  // Server-side onboarding session; each turn sends only the new message
+  const [onboardSessionId, setOnboardSessionId] = useState(null);
+
   // Journal state
   const [journalEntry, setJournalEntry] = useState('');
   const [journalResult, setJournalResult] = useState(null);
@@ -93,10 +96,6 @@ function App() {
   useEffect(() => {
     if (userProfile && currentPage === 'dashboard') {
       fetchDashboardData();
-      // ALSO fetch profile data immediately for the profile card
-      if (!profileData) {
-        fetchUserProfile(userProfile.user_id);
-      }
     }
   }, [userProfile, currentPage]);
 
@@ -104,34 +103,23 @@ function App() {
     if (!userProfile) return;
 
     try {
-      // Fetch journal history
-      const historyResponse = await fetch(`http://127.0.0.1:8000/journal_history/${userProfile.user_id}`);
-      const historyData = await historyResponse.json();
-      if (historyData.history && historyData.history.length > 0) {
-        setJournalHistory(historyData.history);
+      // One request for history, workout stats and the profile card; the browser revalidates it with If-None-Match
+      const response = await fetch(`http://127.0.0.1:8000/dashboard/${userProfile.user_id}`);
+      const data = await response.json();
+      if (data.error) {
+        console.error("Error fetching dashboard data:", data.error);
+        return;
       }
 
-      // Fetch workout stats  
-      const statsResponse = await fetch(`http://127.0.0.1:8000/workout_stats/${userProfile.user_id}`);
-      const statsData = await statsResponse.json();
-      // Store in state for workout progress card
-      if (statsData.completed !== undefined) {
-        // Calculate missing fields if backend doesn't provide them
-        const completed = statsData.completed || 0;
-        const goal = statsData.goal || 0;
-        const percentage = statsData.percentage ?? (goal === 0 ? 0 : Math.round((completed / goal) * 100));
-        const remaining = statsData.remaining ?? Math.max(0, goal - completed);
-        
-        setWorkoutStats({
-          completed,
-          goal,
-          percentage,
-          remaining
-        });
+      if (data.history && data.history.length > 0) {
+        setJournalHistory(data.history);
       }
 
-      // Fetch biometric profile for the profile card
-      fetchUserProfile(userProfile.user_id);
+      // Store in state for workout progress card
+      setWorkoutStats(data.workout_stats);
+
+      // Biometric profile for the profile card
+      setProfileData(data.profile);
     } catch (error) {
       console.error("Error fetching dashboard data:", error);
     }
@@ -244,10 +232,11 @@ function App() {
     setSelectedGoal(goal);
     setCurrentPage('chat');
     
-    // Initialize conversation with selected goal
+    // Initialize conversation with selected goal (starts a new server-side session)
     const initialMessage = { role: 'user', content: `My goal is ${goal}` };
     const newHistory = [initialMessage];
     setMessages(newHistory);
+    setOnboardSessionId(null);
     setIsLoading(true);
 
     try {
@@ -256,12 +245,13 @@ function App() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(newHistory),
+        body: JSON.stringify({ message: initialMessage.content }),
       });
 
       const data = await response.json();
 
       if (data.status === "chatting") {
+        setOnboardSessionId(data.session_id);
         setMessages(prev => [...prev, { role: 'model', content: data.message }]);
       }
     } catch (error) {
@@ -286,7 +276,7 @@ function App() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(newHistory),
+        body: JSON.stringify({ session_id: onboardSessionId, message: inputValue }),
       });
 
       const data = await response.json();
@@ -295,8 +285,14 @@ function App() {
         setMessages(prev => [...prev, { role: 'model', content: data.message }]);
       } else if (data.status === "needs_metrics") {
         // Store partial profile and move to metrics page
+        setOnboardSessionId(null);
         setPartialProfile(data.partial_data);
         setCurrentPage('metrics');
+      } else if (data.status === "expired") {
+        // Session timed out server-side: start over from goal selection
+        setOnboardSessionId(null);
+        setMessages([]);
+        setCurrentPage('goal-selection');
       } else if (data.status === "complete") {
         setUserProfile(data.data);
         setCurrentPage('dashboard');